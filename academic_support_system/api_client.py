@@ -1,10 +1,12 @@
-import base64
 import json
 import re
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, List, Optional
-from openai import OpenAI
+from core.client_registry import client_registry
+from core.image_pipeline import image_pipeline
+from core.response_cache import response_cache, make_cache_key
+from core.token_budget import plan_request
 
 class APIClient:
     def __init__(
@@ -23,7 +25,8 @@ class APIClient:
         self.api_key = api_key
         self.base_url = base_url
         self.default_model = default_model
-        self.client = OpenAI(
+        # 同一 base_url 共享连接池，避免每次实例化都重新建立连接
+        self.client = client_registry.get_openai_client(
             api_key=api_key,
             base_url=base_url
         )
@@ -33,9 +36,11 @@ class APIClient:
         prompt: str,
         image_paths: Optional[List[str]] = None,
         model: Optional[str] = None,
-        max_tokens: int = 50000,
+        max_tokens: Optional[int] = None,
         temperature: float = 0.7,
-        timeout: int = 60
+        timeout: int = 60,
+        use_cache: bool = True,
+        refresh_cache: bool = False
     ) -> str:
         if model is None:
             model = self.default_model
@@ -48,17 +53,17 @@ class APIClient:
         ]
         
         if image_paths:
-            for path in image_paths:
-                try:
-                    with open(path, "rb") as image_file:
-                        base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-                    messages[0]["content"].append({
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/png;base64,{base64_image}"}
-                    })
-                except Exception as e:
-                    raise ValueError(f"Failed to process image {path}: {str(e)}")
-        
+            # 缩放、压缩并缓存编码结果，重复调用同一图片不再读盘
+            messages[0]["content"].extend(image_pipeline.build_content_parts(image_paths))
+
+        # 按提示词大小约束max_tokens，超出上下文窗口时直接拒绝
+        max_tokens = plan_request(messages, max_tokens, model, label="APIClient")
+        cache_key = make_cache_key(model, messages, temperature, max_tokens) if use_cache else None
+        if cache_key and not refresh_cache:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
         try:
             response = self.client.chat.completions.create(
                 model=model,
@@ -69,18 +74,69 @@ class APIClient:
             )
             # 兼容代理/SDK返回字符串或OpenAI对象
             if isinstance(response, str):
-                return response.strip()
-            return response.choices[0].message.content.strip()
+                result = response.strip()
+            else:
+                result = response.choices[0].message.content.strip()
+
+            if cache_key:
+                response_cache.set(cache_key, result)
+            return result
             
         except Exception as e:
             raise Exception(f"API call failed: {str(e)}")
 
+    def chat_completion(
+        self,
+        messages: List[Dict[str, Any]],
+        model: Optional[str] = None,
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+        timeout: int = 60,
+        use_cache: bool = True,
+        refresh_cache: bool = False
+    ) -> str:
+        """
+        使用完整消息列表调用聊天接口。
+        messages: OpenAI格式的消息列表
+        use_cache / refresh_cache: 绕过或刷新响应缓存
+        返回: 模型回复文本
+        """
+        if model is None:
+            model = self.default_model
+
+        max_tokens = plan_request(messages, max_tokens, model, label="APIClient")
+        cache_key = make_cache_key(model, messages, temperature, max_tokens) if use_cache else None
+        if cache_key and not refresh_cache:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        try:
+            response = self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                timeout=timeout
+            )
+            if isinstance(response, str):
+                result = response.strip()
+            else:
+                result = response.choices[0].message.content.strip()
+
+            if cache_key:
+                response_cache.set(cache_key, result)
+            return result
+
+        except Exception as e:
+            raise Exception(f"Chat completion failed: {str(e)}")
+
     def call_api_streaming(
         self,
         prompt: str,
         image_paths: Optional[List[str]] = None,
         model: Optional[str] = None,
-        max_tokens: int = 20000,
+        max_tokens: Optional[int] = None,
         temperature: float = 0.7,
         timeout: int = 60
     ):
@@ -88,7 +144,7 @@ class APIClient:
         流式请求API，返回生成器。
         prompt: 用户输入文本
         image_paths: 可选图片路径列表
-        其余参数同call_api
+        其余参数同call_api（max_tokens为None时按模型上下文窗口自动计算）
         返回: openai流式响应生成器
         """
         if model is None:
@@ -100,16 +156,9 @@ class APIClient:
             }
         ]
         if image_paths:
-            for path in image_paths:
-                try:
-                    with open(path, "rb") as image_file:
-                        base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-                    messages[0]["content"].append({
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/png;base64,{base64_image}"}
-                    })
-                except Exception as e:
-                    raise ValueError(f"Failed to process image {path}: {str(e)}")
+            # 缩放、压缩并缓存编码结果，重复调用同一图片不再读盘
+            messages[0]["content"].extend(image_pipeline.build_content_parts(image_paths))
+        max_tokens = plan_request(messages, max_tokens, model, label="APIClient流式")
         try:
             stream = self.client.chat.completions.create(
                 model=model,
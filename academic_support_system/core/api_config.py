@@ -12,6 +12,83 @@ class APIConfig:
         self.api_key = self._get_api_key()
         self.base_url = self._get_base_url()
         self.default_model = self._get_default_model()
+        # HTTP连接池配置
+        self.pool_max_connections = self._get_int_setting('LLM_POOL_MAX_CONNECTIONS', 20)
+        self.pool_max_keepalive = self._get_int_setting('LLM_POOL_MAX_KEEPALIVE', 10)
+        self.pool_keepalive_expiry = self._get_float_setting('LLM_POOL_KEEPALIVE_EXPIRY', 30.0)
+        # 连接池的连接超时；读取超时默认与OpenAI SDK一致（600秒），各调用可按需传入 timeout 覆盖
+        self.connect_timeout = self._get_float_setting('LLM_CONNECT_TIMEOUT', 10.0)
+        self.read_timeout = self._get_float_setting('LLM_READ_TIMEOUT', 600.0)
+        # 异步并发调用上限
+        self.async_max_concurrency = self._get_int_setting('LLM_ASYNC_MAX_CONCURRENCY', 8)
+        # 重试、熔断与失败策略（mock: 返回模拟响应, raise: 抛出错误）
+        self.max_retries = self._get_int_setting('LLM_MAX_RETRIES', 2)
+        self.retry_base_delay = self._get_float_setting('LLM_RETRY_BASE_DELAY', 0.5)
+        self.retry_max_delay = self._get_float_setting('LLM_RETRY_MAX_DELAY', 8.0)
+        self.breaker_failure_threshold = self._get_int_setting('LLM_BREAKER_FAILURE_THRESHOLD', 5)
+        self.breaker_recovery_timeout = self._get_float_setting('LLM_BREAKER_RECOVERY_TIMEOUT', 30.0)
+        self.failure_policy = (self._get_setting('LLM_FAILURE_POLICY') or 'mock').strip().lower()
+        # 流式输出时请求服务端附带token用量
+        self.stream_include_usage = self._get_bool_setting('LLM_STREAM_INCLUDE_USAGE', True)
+        # 上下文窗口覆盖（0表示按模型内置表取值）
+        self.context_window = self._get_int_setting('LLM_CONTEXT_WINDOW', 0)
+        self.max_output_tokens = self._get_int_setting('LLM_MAX_OUTPUT_TOKENS', 0)
+        # 每次请求生成的题目数量（1表示逐题生成）
+        self.question_batch_size = max(1, self._get_int_setting('QUESTION_BATCH_SIZE', 1))
+        # 笔记生成模式（single/chunked/auto）及长文档分块的token预算
+        self.notes_generation_mode = (self._get_setting('NOTES_GENERATION_MODE') or 'auto').strip().lower()
+        self.notes_chunk_tokens = self._get_int_setting('NOTES_CHUNK_TOKENS', 16000)
+        self.notes_chunk_output_tokens = self._get_int_setting('NOTES_CHUNK_OUTPUT_TOKENS', 8192)
+        # 流式生成笔记中断或达到输出上限时，从最后一个完整章节续写的最大次数（0为不续写）
+        self.notes_max_continuations = max(0, self._get_int_setting('NOTES_MAX_CONTINUATIONS', 3))
+        # 客户端断开SSE连接时的处理：cancel 取消上游生成 / detach 后台继续完成
+        # 普通对话默认取消；AI修改笔记章节默认后台完成并写回；笔记流断开后默认后台任务继续生成
+        self.chat_disconnect_policy = (self._get_setting('CHAT_DISCONNECT_POLICY') or 'cancel').strip().lower()
+        self.notes_edit_disconnect_policy = (self._get_setting('NOTES_EDIT_DISCONNECT_POLICY') or 'detach').strip().lower()
+        self.notes_stream_disconnect_policy = (self._get_setting('NOTES_STREAM_DISCONNECT_POLICY') or 'detach').strip().lower()
+        # SSE保活帧间隔（秒），同时是WSGI下发现客户端断开的最长延迟
+        self.sse_heartbeat_seconds = max(1.0, self._get_float_setting('SSE_HEARTBEAT_SECONDS', 15.0))
+        # detach 策略的后台读取线程数与同时进行的上限，超出上限时改为取消上游生成
+        self.sse_detach_workers = max(1, self._get_int_setting('SSE_DETACH_WORKERS', 4))
+        self.sse_detach_max_pending = max(0, self._get_int_setting('SSE_DETACH_MAX_PENDING', 16))
+        # 任务事件日志在内存中保留的最近帧数（环形缓冲），落后更多的订阅者从日志文件补读并合并为追赶帧
+        self.event_log_buffer_frames = max(1, self._get_int_setting('EVENT_LOG_BUFFER_FRAMES', 256))
+        self.event_log_catchup_max_bytes = max(1, self._get_int_setting('EVENT_LOG_CATCHUP_MAX_BYTES', 64 * 1024))
+        # 任务事件日志文件最后一次写入后保留的小时数（供断线重连补发），超过后由清理删除；0为不清理
+        self.event_log_retention_hours = max(0.0, self._get_float_setting('EVENT_LOG_RETENTION_HOURS', 24.0))
+        # 文件解析完成后在后台以低优先级预先生成笔记（默认关闭）；每用户每小时、全站每小时的次数上限
+        self.notes_speculative_enabled = self._get_bool_setting('NOTES_SPECULATIVE_ENABLED', False)
+        self.notes_speculative_per_user_hour = max(0, self._get_int_setting('NOTES_SPECULATIVE_PER_USER_HOUR', 2))
+        self.notes_speculative_per_hour = max(0, self._get_int_setting('NOTES_SPECULATIVE_PER_HOUR', 20))
+        # 组装笔记提示词前去除页眉页脚、页码和近重复段落；近重复判定的相似度阈值
+        self.notes_compaction_enabled = self._get_bool_setting('NOTES_COMPACTION_ENABLED', True)
+        self.notes_compaction_threshold = self._get_float_setting('NOTES_COMPACTION_THRESHOLD', 0.8)
+        # 笔记流式输出：增量合并为一帧的最小间隔(毫秒)与字节数上限，0表示每个增量单独成帧
+        self.notes_frame_interval_ms = max(0, self._get_int_setting('NOTES_FRAME_INTERVAL_MS', 100))
+        self.notes_frame_max_bytes = max(0, self._get_int_setting('NOTES_FRAME_MAX_BYTES', 4096))
+        # notes.md 缓冲写入：达到间隔(毫秒)或缓冲字节数时落盘，结束时一定落盘
+        self.notes_flush_interval_ms = max(0, self._get_int_setting('NOTES_FLUSH_INTERVAL_MS', 1000))
+        self.notes_flush_bytes = max(0, self._get_int_setting('NOTES_FLUSH_BYTES', 64 * 1024))
+        # 多模态图片预处理：最长边像素、JPEG质量、编码结果缓存数量
+        self.image_max_side = self._get_int_setting('LLM_IMAGE_MAX_SIDE', 1568)
+        self.image_quality = self._get_int_setting('LLM_IMAGE_QUALITY', 85)
+        self.image_cache_size = self._get_int_setting('LLM_IMAGE_CACHE_SIZE', 256)
+        # 后台任务队列：工作线程数、最大尝试次数、是否在Web进程内运行工作线程
+        self.job_workers = max(1, self._get_int_setting('JOB_WORKERS', 4))
+        self.job_max_attempts = max(1, self._get_int_setting('JOB_MAX_ATTEMPTS', 3))
+        self.job_run_in_process = self._get_bool_setting('JOB_RUN_IN_PROCESS', True)
+        self.job_poll_interval = self._get_float_setting('JOB_POLL_INTERVAL', 1.0)
+        # 运行中任务超过该秒数没有心跳时视为工作进程已退出，重新排队
+        self.job_stale_seconds = self._get_float_setting('JOB_STALE_SECONDS', 300.0)
+        # 响应缓存配置（默认关闭）
+        self.cache_enabled = self._get_bool_setting('LLM_CACHE_ENABLED', False)
+        self.cache_memory_size = self._get_int_setting('LLM_CACHE_MEMORY_SIZE', 256)
+        self.cache_max_entries = self._get_int_setting('LLM_CACHE_MAX_ENTRIES', 5000)
+        self.cache_ttl = self._get_float_setting('LLM_CACHE_TTL', 7 * 24 * 3600)
+        self.cache_path = self._get_setting('LLM_CACHE_PATH') or os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            'media', 'cache', 'llm_responses.sqlite3'
+        )
         
     def _get_api_key(self) -> Optional[str]:
         """获取API密钥"""
@@ -55,6 +132,43 @@ class APIConfig:
         except ImportError:
             return "gemini-2.5-flash"
     
+    def _get_setting(self, name: str):
+        """按 环境变量 -> 配置文件 的顺序读取可选配置项"""
+        value = os.getenv(name)
+        if value is not None and value != '':
+            return value
+
+        try:
+            import config
+            return getattr(config, name, None)
+        except ImportError:
+            return None
+
+    def _get_int_setting(self, name: str, default: int) -> int:
+        """读取整数配置项，无效值回退到默认值"""
+        try:
+            value = self._get_setting(name)
+            return int(value) if value is not None else default
+        except (TypeError, ValueError):
+            return default
+
+    def _get_float_setting(self, name: str, default: float) -> float:
+        """读取浮点数配置项，无效值回退到默认值"""
+        try:
+            value = self._get_setting(name)
+            return float(value) if value is not None else default
+        except (TypeError, ValueError):
+            return default
+
+    def _get_bool_setting(self, name: str, default: bool) -> bool:
+        """读取布尔配置项，支持 1/true/yes/on"""
+        value = self._get_setting(name)
+        if value is None:
+            return default
+        if isinstance(value, bool):
+            return value
+        return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
     def is_configured(self) -> bool:
         """检查API是否已配置"""
         return bool(self.api_key and self.base_url)
@@ -0,0 +1,126 @@
+"""
+基于 AsyncOpenAI 的异步API客户端
+
+与 UnifiedAPIClient 行为保持一致（响应缓存、重试与熔断、失败策略），
+并通过信号量限制同时在途的请求数量，用于并发批量调用。
+"""
+import asyncio
+import logging
+import weakref
+from typing import Optional
+
+from .api_config import api_config
+from .client_registry import client_registry
+from .resilience import resilience, CircuitOpenError, LLMUnavailableError
+from .response_cache import response_cache, make_cache_key
+from .single_flight import single_flight
+from .token_budget import plan_request
+from .unified_api_client import get_mock_response
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncUnifiedAPIClient:
+    """统一的异步API客户端"""
+
+    def __init__(self, max_concurrency: Optional[int] = None):
+        self.config = api_config
+        self.max_concurrency = max_concurrency or self.config.async_max_concurrency
+        # 信号量绑定事件循环，按循环分别创建
+        self._semaphores: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+    def is_available(self) -> bool:
+        """检查API是否可用"""
+        return self.config.is_configured()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    async def _request(
+        self,
+        model: str,
+        messages: list,
+        max_tokens: int,
+        temperature: float,
+        timeout: int
+    ) -> str:
+        """实际调用上游（受信号量限制，带重试与熔断）"""
+        client = client_registry.get_async_openai_client(
+            api_key=self.config.api_key,
+            base_url=self.config.base_url
+        )
+        async with self._get_semaphore():
+            response = await resilience.acall(
+                lambda: client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    timeout=timeout
+                ),
+                endpoint=self.config.base_url
+            )
+
+        if isinstance(response, str):
+            return response.strip()
+        return response.choices[0].message.content.strip()
+
+    async def call_api(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+        timeout: int = 60,
+        use_cache: bool = True,
+        refresh_cache: bool = False
+    ) -> str:
+        """异步调用API生成文本，失败时返回模拟响应"""
+        if not self.is_available():
+            logger.error("API服务不可用，检查配置")
+            return get_mock_response(prompt)
+
+        if model is None:
+            model = self.config.default_model
+
+        messages = [{"role": "user", "content": prompt}]
+        max_tokens = plan_request(messages, max_tokens, model, label="异步API")
+        request_key = make_cache_key(model, messages, temperature, max_tokens)
+        cache_key = request_key if use_cache else None
+        if cache_key and not refresh_cache:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"命中响应缓存，模型: {model}")
+                return cached
+
+        try:
+            logger.info(f"异步调用API，模型: {model}, 提示词长度: {len(prompt)}")
+            # 相同请求并发到达时只调用一次上游，合并的调用方不占用信号量
+            result = await single_flight.ado(
+                request_key,
+                lambda: self._request(model, messages, max_tokens, temperature, timeout)
+            )
+
+            logger.info(f"异步API调用成功，响应长度: {len(result)}")
+            if cache_key:
+                response_cache.set(cache_key, result)
+            return result
+
+        except Exception as e:
+            if isinstance(e, CircuitOpenError):
+                logger.warning(str(e))
+            else:
+                logger.error(f"异步API调用失败: {type(e).__name__}: {e}")
+            if not resilience.should_fallback_to_mock():
+                raise LLMUnavailableError(f"API调用失败: {e}") from e
+            logger.warning("API调用失败，使用模拟响应作为备用方案")
+            return get_mock_response(prompt)
+
+
+# 全局异步客户端实例
+async_unified_client = AsyncUnifiedAPIClient()
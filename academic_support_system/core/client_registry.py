@@ -0,0 +1,180 @@
+"""
+进程级的LLM客户端注册表
+
+每个 base_url 只维护一个启用 keep-alive 的连接池（httpx.Client），
+所有 OpenAI 客户端实例都复用该连接池，避免每次调用重新建立 TCP/TLS 连接。
+异步连接池绑定事件循环，因此 AsyncOpenAI 客户端按 (事件循环, base_url) 复用。
+"""
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Dict, Optional, Tuple
+
+from .api_config import api_config
+
+logger = logging.getLogger(__name__)
+
+
+class ClientRegistry:
+    """按 base_url 复用HTTP连接池的客户端注册表"""
+
+    def __init__(
+        self,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 600.0
+    ):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._lock = threading.Lock()
+        self._transports: Dict[str, object] = {}
+        self._clients: Dict[Tuple[str, str], object] = {}
+        # 事件循环 -> {(base_url, api_key): AsyncOpenAI}，循环结束后自动释放
+        self._async_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def _normalize_url(base_url: str) -> str:
+        return (base_url or "").rstrip("/")
+
+    def get_http_client(self, base_url: str):
+        """获取指定 base_url 共享的 httpx.Client 连接池"""
+        key = self._normalize_url(base_url)
+        with self._lock:
+            transport = self._transports.get(key)
+            if transport is None:
+                import httpx
+
+                transport = httpx.Client(
+                    limits=self._build_limits(),
+                    timeout=self._build_timeout()
+                )
+                self._transports[key] = transport
+                logger.info(
+                    f"创建HTTP连接池: {key} (max_connections={self.max_connections}, "
+                    f"max_keepalive={self.max_keepalive_connections})"
+                )
+            return transport
+
+    def get_openai_client(self, api_key: str, base_url: str):
+        """获取复用连接池的 OpenAI 客户端，同一 (base_url, api_key) 只创建一次"""
+        key = (self._normalize_url(base_url), api_key or "")
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+
+        http_client = self.get_http_client(base_url)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                from openai import OpenAI
+
+                # 重试由 core.resilience 统一处理，避免与SDK内置重试叠加
+                client = OpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    http_client=http_client,
+                    max_retries=0
+                )
+                self._clients[key] = client
+            return client
+
+    def _build_limits(self):
+        import httpx
+
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    def _build_timeout(self):
+        """连接池默认超时：只约束连接阶段，读取超时保持宽松，由各调用通过 timeout 参数决定"""
+        import httpx
+
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+
+    def get_async_openai_client(self, api_key: str, base_url: str):
+        """获取当前事件循环内共享连接池的 AsyncOpenAI 客户端（需在协程中调用）"""
+        loop = asyncio.get_running_loop()
+        key = (self._normalize_url(base_url), api_key or "")
+        with self._lock:
+            loop_clients = self._async_clients.setdefault(loop, {})
+            client = loop_clients.get(key)
+            if client is None:
+                import httpx
+                from openai import AsyncOpenAI
+
+                client = AsyncOpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    max_retries=0,
+                    http_client=httpx.AsyncClient(
+                        limits=self._build_limits(),
+                        timeout=self._build_timeout()
+                    )
+                )
+                loop_clients[key] = client
+            return client
+
+    async def aclose_loop_clients(self):
+        """关闭当前事件循环创建的异步客户端（asyncio.run 结束前调用）"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            loop_clients = self._async_clients.pop(loop, {})
+
+        for client in loop_clients.values():
+            try:
+                await client.close()
+            except Exception as e:
+                logger.warning(f"关闭异步客户端失败: {e}")
+
+    def close_all(self):
+        """关闭所有连接池（进程退出或测试清理时调用）"""
+        with self._lock:
+            transports = list(self._transports.values())
+            self._transports.clear()
+            self._clients.clear()
+
+        for transport in transports:
+            try:
+                transport.close()
+            except Exception as e:
+                logger.warning(f"关闭HTTP连接池失败: {e}")
+
+    def stats(self) -> Dict[str, object]:
+        """返回注册表的当前状态"""
+        with self._lock:
+            return {
+                'transports': list(self._transports.keys()),
+                'clients': len(self._clients),
+                'async_event_loops': len(self._async_clients),
+                'max_connections': self.max_connections,
+                'max_keepalive_connections': self.max_keepalive_connections,
+                'keepalive_expiry': self.keepalive_expiry,
+                'connect_timeout': self.connect_timeout,
+                'read_timeout': self.read_timeout
+            }
+
+
+# 全局注册表实例
+client_registry = ClientRegistry(
+    max_connections=api_config.pool_max_connections,
+    max_keepalive_connections=api_config.pool_max_keepalive,
+    keepalive_expiry=api_config.pool_keepalive_expiry,
+    connect_timeout=api_config.connect_timeout,
+    read_timeout=api_config.read_timeout
+)
+
+
+def get_openai_client(api_key: Optional[str] = None, base_url: Optional[str] = None):
+    """便捷函数：获取共享连接池的 OpenAI 客户端，默认使用统一配置"""
+    return client_registry.get_openai_client(
+        api_key=api_key if api_key is not None else api_config.api_key,
+        base_url=base_url if base_url is not None else api_config.base_url
+    )
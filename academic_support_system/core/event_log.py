@@ -0,0 +1,353 @@
+"""
+任务事件日志（可续传的SSE流）
+
+长任务（如笔记生成）产出的每个SSE帧都带有递增序号，按行追加写入任务对应的日志文件，
+同时保存在内存中供本进程的订阅者实时读取：
+- 浏览器断线重连时携带 Last-Event-ID，服务端从日志中补发缺失的帧后继续实时推送
+- 生成任务在后台任务队列中运行，与客户端连接无关；客户端断开不会中断生成
+- 生产者在其他进程（manage.py run_job_workers）时，订阅者按增量读取日志文件
+- 一个任务只有一个生产者，任意多个SSE连接订阅同一个实例（同一用户多个标签页共享一次生成）
+- 内存中只保留最近 capacity 帧（环形缓冲），生产者追加从不等待订阅者；
+  写出慢、落后超出缓冲的订阅者从日志文件补读，相邻的 content 帧合并为追赶帧后推送
+
+SSE帧ID格式为 "<任务ID>:<序号>"，仅凭 Last-Event-ID 即可定位任务。
+任务结束后日志文件保留 retention 秒供重连补发，之后由 EventLogRegistry.prune 删除。
+"""
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from itertools import islice
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .api_config import api_config
+
+logger = logging.getLogger(__name__)
+
+
+def format_event_id(job_id, seq: int) -> str:
+    return f"{job_id}:{seq}"
+
+
+def parse_event_id(event_id: str) -> Optional[Tuple[str, int]]:
+    """解析 "<任务ID>:<序号>"，格式不正确时返回None"""
+    if not event_id or ':' not in event_id:
+        return None
+    job_id, _, seq = event_id.rpartition(':')
+    try:
+        return job_id, int(seq)
+    except ValueError:
+        return None
+
+
+def coalesce_frames(events: Iterable[Tuple[int, Dict[str, Any]]],
+                    max_bytes: int = 64 * 1024) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    把相邻的 content 帧合并为一帧，序号取最后一帧（据此续传不会重复或遗漏内容），
+    累计超过 max_bytes 字节时先产出；其他类型的帧原样产出，顺序不变。
+    """
+    seq, parts, size = None, [], 0
+    for event_seq, payload in events:
+        if payload.get('type') == 'content' and set(payload) == {'type', 'content'}:
+            seq = event_seq
+            parts.append(payload['content'])
+            size += len(payload['content'].encode('utf-8'))
+            if size >= max_bytes:
+                yield seq, {'type': 'content', 'content': ''.join(parts)}
+                parts, size = [], 0
+            continue
+        if parts:
+            yield seq, {'type': 'content', 'content': ''.join(parts)}
+            parts, size = [], 0
+        yield event_seq, payload
+    if parts:
+        yield seq, {'type': 'content', 'content': ''.join(parts)}
+
+
+class EventLog:
+    """单个任务的追加写事件日志"""
+
+    def __init__(self, path: str, poll_interval: float = 0.5, capacity: int = 256,
+                 catchup_max_bytes: int = 64 * 1024):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.capacity = capacity
+        self.catchup_max_bytes = catchup_max_bytes
+        self._cond = threading.Condition()
+        # 最近 capacity 帧；更早的帧只在日志文件中
+        self._events: Deque[Tuple[int, Dict[str, Any]]] = deque(maxlen=capacity)
+        self._last_id = 0
+        self._closed = False
+        self._offset = 0
+        self._subscribers = 0
+        self._stats = {'evicted': 0, 'catchups': 0, 'coalesced': 0, 'max_lag': 0}
+
+    def _push(self, seq: int, payload: Dict[str, Any]):
+        """加入环形缓冲（调用方持有锁）"""
+        if len(self._events) == self.capacity:
+            self._stats['evicted'] += 1
+        self._events.append((seq, payload))
+        self._last_id = seq
+
+    @property
+    def _first_id(self) -> int:
+        """缓冲中最早一帧的序号（调用方持有锁）"""
+        return self._last_id - len(self._events) + 1
+
+    def _sync(self):
+        """读取文件中新增的完整行（调用方持有锁）"""
+        try:
+            # 只做一次 stat：本实例就是生产者或没有新内容时不打开文件
+            if os.path.getsize(self.path) <= self._offset:
+                return
+        except OSError:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b'\n')
+        if end < 0:
+            return
+        self._offset += end + 1
+        for line in data[:end].split(b'\n'):
+            if not line.strip():
+                continue
+            record = json.loads(line.decode('utf-8'))
+            if record.get('closed'):
+                self._closed = True
+            else:
+                self._push(record['id'], record['data'])
+
+    @property
+    def last_id(self) -> int:
+        with self._cond:
+            self._sync()
+            return self._last_id
+
+    @property
+    def closed(self) -> bool:
+        with self._cond:
+            self._sync()
+            return self._closed
+
+    def append(self, payload: Dict[str, Any]) -> int:
+        """追加一帧，返回其序号"""
+        with self._cond:
+            self._sync()
+            if self._closed:
+                raise RuntimeError(f"事件日志已关闭: {self.path}")
+            seq = self._last_id + 1
+            self._write({'id': seq, 'data': payload})
+            self._push(seq, payload)
+            self._cond.notify_all()
+            return seq
+
+    def close(self):
+        """标记日志结束，订阅者读完剩余帧后退出"""
+        with self._cond:
+            self._sync()
+            if not self._closed:
+                self._write({'closed': True})
+                self._closed = True
+            self._cond.notify_all()
+
+    def _write(self, record: Dict[str, Any]):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+        with open(self.path, 'ab') as f:
+            f.write(line)
+        self._offset += len(line)
+
+    @property
+    def subscribers(self) -> int:
+        """当前正在跟随的订阅者数量"""
+        with self._cond:
+            return self._subscribers
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        缓冲深度与追赶统计：
+        evicted 移出缓冲的帧数，catchups 从文件补读的次数，coalesced 合并掉的帧数，max_lag 订阅者最大落后帧数
+        """
+        with self._cond:
+            return {
+                'depth': len(self._events),
+                'capacity': self.capacity,
+                'last_id': self._last_id,
+                'subscribers': self._subscribers,
+                **self._stats
+            }
+
+    def read(self, after_id: int = 0) -> List[Tuple[int, Dict[str, Any]]]:
+        """返回序号大于 after_id 的所有帧（不合并）"""
+        with self._cond:
+            self._sync()
+            events, end = self._pending(max(after_id, 0))
+        if events is None:
+            events = list(self._read_file(after_id, end))
+        return events
+
+    def _pending(self, after_id: int) -> Tuple[Optional[List[Tuple[int, Dict[str, Any]]]], int]:
+        """
+        序号大于 after_id 的帧（调用方持有锁）。
+        全部在缓冲中时直接返回；已被移出缓冲时返回 (None, 文件读取终点)，由调用方在锁外读取文件。
+        """
+        lag = self._last_id - after_id
+        if lag > self._stats['max_lag']:
+            self._stats['max_lag'] = lag
+        if after_id + 1 >= self._first_id:
+            # 序号从1开始连续递增，按下标定位
+            return list(islice(self._events, max(after_id + 1 - self._first_id, 0), None)), self._offset
+        self._stats['catchups'] += 1
+        return None, self._offset
+
+    def _read_file(self, after_id: int, end: int) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """逐行读取日志文件中 after_id 之后、end 字节之前的帧，内存只与单帧有关"""
+        with open(self.path, 'rb') as f:
+            while f.tell() < end:
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    break
+                if not line.strip():
+                    continue
+                record = json.loads(line.decode('utf-8'))
+                if not record.get('closed') and record['id'] > after_id:
+                    yield record['id'], record['data']
+
+    def _catch_up(self, events: Iterable[Tuple[int, Dict[str, Any]]]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """合并积压的帧，统计合并掉的帧数"""
+        counts = {'read': 0, 'sent': 0}
+
+        def counted():
+            for event in events:
+                counts['read'] += 1
+                yield event
+
+        try:
+            for event in coalesce_frames(counted(), self.catchup_max_bytes):
+                counts['sent'] += 1
+                yield event
+        finally:
+            with self._cond:
+                self._stats['coalesced'] += max(counts['read'] - counts['sent'], 0)
+
+    def follow(self, after_id: int = 0, heartbeat: float = 15.0) -> Iterator[Optional[Tuple[int, Dict[str, Any]]]]:
+        """
+        先补发序号大于 after_id 的帧，再实时产出新帧，日志关闭后结束。
+        超过 heartbeat 秒没有新帧时产出 None，调用方据此发送保活帧。
+        """
+        after_id = max(after_id, 0)
+        idle_since = time.monotonic()
+        with self._cond:
+            self._subscribers += 1
+        try:
+            while True:
+                with self._cond:
+                    self._sync()
+                    if self._last_id <= after_id and not self._closed:
+                        # 本进程的生产者追加时会唤醒；其他进程写入时靠超时后重新读取文件
+                        self._cond.wait(timeout=self.poll_interval)
+                        self._sync()
+                    pending, end = self._pending(after_id)
+                    closed = self._closed
+
+                if pending is None:
+                    # 落后超出缓冲：在锁外从文件补读并合并为追赶帧，不阻塞生产者
+                    pending = self._catch_up(self._read_file(after_id, end))
+                sent = False
+                for event in pending:
+                    after_id = event[0]
+                    sent = True
+                    yield event
+                if sent:
+                    idle_since = time.monotonic()
+                elif closed:
+                    return
+                elif time.monotonic() - idle_since >= heartbeat:
+                    idle_since = time.monotonic()
+                    yield None
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+
+
+class EventLogRegistry:
+    """按任务ID共享 EventLog 实例，使同一进程内的生产者和订阅者使用同一个条件变量"""
+
+    def __init__(self, root: str = 'media', capacity: int = None, catchup_max_bytes: int = None,
+                 retention: float = None, prune_interval: float = 3600.0):
+        self.root = root
+        self.capacity = capacity or api_config.event_log_buffer_frames
+        self.catchup_max_bytes = catchup_max_bytes or api_config.event_log_catchup_max_bytes
+        self.retention = api_config.event_log_retention_hours * 3600 if retention is None else retention
+        self.prune_interval = prune_interval
+        self._lock = threading.Lock()
+        self._logs: Dict[str, EventLog] = {}
+        self._last_prune = None
+        self._stats = {'pruned': 0}
+
+    def path_for(self, job_id, owner_id) -> str:
+        return os.path.join(self.root, str(owner_id), 'jobs', f"{job_id}.events.jsonl")
+
+    def get(self, job_id, owner_id) -> EventLog:
+        key = str(job_id)
+        with self._lock:
+            log = self._logs.get(key)
+            if log is None:
+                log = EventLog(self.path_for(job_id, owner_id), capacity=self.capacity,
+                               catchup_max_bytes=self.catchup_max_bytes)
+                self._logs[key] = log
+            return log
+
+    def release(self, job_id):
+        """任务结束后释放内存中的实例，仍在跟随的订阅者持有引用读完剩余帧（日志文件保留用于重连补发）"""
+        with self._lock:
+            self._logs.pop(str(job_id), None)
+
+    def prune(self, force: bool = False) -> int:
+        """
+        删除最后一次写入早于保留期的日志文件，返回删除的文件数。
+        本进程内仍在使用的日志不删除；未设置 force 时两次清理至少间隔 prune_interval 秒。
+        """
+        if not self.retention:
+            return 0
+        now = time.time()
+        with self._lock:
+            if not force and self._last_prune is not None and now - self._last_prune < self.prune_interval:
+                return 0
+            self._last_prune = now
+            active = {log.path for log in self._logs.values()}
+        removed = 0
+        for path in glob.glob(os.path.join(self.root, '*', 'jobs', '*.events.jsonl')):
+            if path in active:
+                continue
+            try:
+                if now - os.path.getmtime(path) > self.retention:
+                    os.remove(path)
+                    removed += 1
+            except OSError as e:
+                logger.warning(f"删除事件日志失败 {path}: {e}")
+        with self._lock:
+            self._stats['pruned'] += removed
+        if removed:
+            logger.info(f"已清理 {removed} 个过期的事件日志文件")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """内存中的日志数、订阅者数，缓冲深度与追赶统计的汇总，以及已清理的日志文件数"""
+        with self._lock:
+            logs = list(self._logs.values())
+            pruned = self._stats['pruned']
+        stats = [log.stats() for log in logs]
+        summary = {'logs': len(logs), 'subscribers': sum(item['subscribers'] for item in stats), 'pruned': pruned}
+        for key in ('depth', 'evicted', 'catchups', 'coalesced'):
+            summary[key] = sum(item[key] for item in stats)
+        summary['max_lag'] = max((item['max_lag'] for item in stats), default=0)
+        return summary
+
+
+# 全局事件日志注册表
+event_logs = EventLogRegistry()
@@ -0,0 +1,152 @@
+"""
+多模态调用的图片预处理
+
+- 按文件头识别真实MIME类型（不再一律标记为 image/png）
+- 安装了 Pillow 时把图片缩放到目标尺寸并重新压缩（不透明图转JPEG，透明图保持PNG）
+- 编码后的 data URL 按文件内容哈希缓存；同一文件未修改时只做一次 stat，
+  不再重复读盘和 base64 编码
+"""
+import base64
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .api_config import api_config
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow 为可选依赖，缺失时只做MIME识别和缓存
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'BM', 'image/bmp'),
+)
+
+
+def sniff_mime(data: bytes) -> Optional[str]:
+    """根据文件头判断图片MIME类型，无法识别时返回None"""
+    for signature, mime in _SIGNATURES:
+        if data.startswith(signature):
+            return mime
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+class ImagePipeline:
+    """图片缩放、压缩与 data URL 缓存"""
+
+    def __init__(self, max_side: int = 1568, quality: int = 85, cache_size: int = 256):
+        self.max_side = max_side
+        self.quality = quality
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        # 路径 -> (mtime_ns, size, 内容哈希)，文件未变化时无需读盘
+        self._file_index: Dict[str, Tuple[int, int, str]] = {}
+        # 内容哈希 -> data URL
+        self._encoded: "OrderedDict[str, str]" = OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+    def encode(self, path: str) -> str:
+        """返回图片的 data URL（命中缓存时不读取文件）"""
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            indexed = self._file_index.get(path)
+            if indexed and indexed[:2] == signature and indexed[2] in self._encoded:
+                self._encoded.move_to_end(indexed[2])
+                self._stats['hits'] += 1
+                return self._encoded[indexed[2]]
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+
+        with self._lock:
+            self._file_index[path] = signature + (digest,)
+            cached = self._encoded.get(digest)
+            if cached is not None:
+                # 内容相同的另一个文件
+                self._encoded.move_to_end(digest)
+                self._stats['hits'] += 1
+                return cached
+
+        payload, mime = self._transcode(data)
+        data_url = f"data:{mime};base64,{base64.b64encode(payload).decode('ascii')}"
+
+        with self._lock:
+            self._stats['misses'] += 1
+            self._stats['bytes_in'] += len(data)
+            self._stats['bytes_out'] += len(payload)
+            self._encoded[digest] = data_url
+            while len(self._encoded) > self.cache_size:
+                self._encoded.popitem(last=False)
+        return data_url
+
+    def _transcode(self, data: bytes) -> Tuple[bytes, str]:
+        """缩放并重新压缩，结果不比原图小时保留原图"""
+        mime = sniff_mime(data) or 'image/png'
+        if Image is None:
+            return data, mime
+
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                image.load()
+                resized = max(image.size) > self.max_side
+                if resized:
+                    image.thumbnail((self.max_side, self.max_side), Image.LANCZOS)
+
+                has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+                buffer = io.BytesIO()
+                if has_alpha:
+                    image.save(buffer, format='PNG', optimize=True)
+                    new_mime = 'image/png'
+                else:
+                    image.convert('RGB').save(buffer, format='JPEG', quality=self.quality, optimize=True)
+                    new_mime = 'image/jpeg'
+        except Exception as e:
+            logger.warning(f"图片预处理失败，使用原图: {e}")
+            return data, mime
+
+        payload = buffer.getvalue()
+        if not resized and len(payload) >= len(data):
+            return data, mime
+        return payload, new_mime
+
+    def build_content_parts(self, image_paths: List[str]) -> List[Dict[str, Any]]:
+        """把图片路径转换为OpenAI多模态消息的 image_url 片段"""
+        parts = []
+        for path in image_paths:
+            try:
+                parts.append({"type": "image_url", "image_url": {"url": self.encode(path)}})
+            except Exception as e:
+                raise ValueError(f"Failed to process image {path}: {str(e)}")
+        return parts
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中数与压缩前后字节数"""
+        with self._lock:
+            return {
+                **self._stats,
+                'cached_images': len(self._encoded),
+                'pillow_available': Image is not None
+            }
+
+
+# 全局图片处理实例
+image_pipeline = ImagePipeline(
+    max_side=api_config.image_max_side,
+    quality=api_config.image_quality,
+    cache_size=api_config.image_cache_size
+)
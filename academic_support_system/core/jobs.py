@@ -0,0 +1,474 @@
+"""
+持久化后台任务队列
+
+文件解析、笔记生成等耗时任务写入 Job 表（SQLite），由有界的工作线程池领取执行：
+- 负载高峰时任务排队等待，而不是为每个请求创建一个占用LLM连接的线程
+- 任务状态、进度和错误都落库，进程重启后排队中的任务继续执行，心跳超时的运行中任务重新排队
+  （运行期间由独立的心跳线程定期刷新，长时间阻塞在单次LLM调用中的任务不会被误判；已用完尝试次数的标记为失败）
+- 支持取消（排队中立即取消，运行中由处理函数在检查点退出）和失败重试（指数退避）
+
+工作线程默认在Web进程内按需启动；设置 JOB_RUN_IN_PROCESS=false 后，
+Web进程只负责入队，由 `python manage.py run_job_workers` 在独立进程中执行。
+"""
+import importlib
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .api_config import api_config
+from .models import Job
+from .progress import progress_store
+
+logger = logging.getLogger(__name__)
+
+# 任务类型 -> 处理函数（延迟导入，避免循环依赖；工作进程也能按名称找到处理函数）
+JOB_HANDLERS = {
+    'parse_file': 'core.views.run_parse_file_job',
+    'generate_notes': 'notes.views.run_note_generation_job',
+}
+
+
+class JobCancelled(Exception):
+    """任务已被取消（由处理函数在检查点抛出）"""
+    pass
+
+
+class JobContext:
+    """传给处理函数的任务上下文：读取参数、上报进度、检查取消"""
+
+    def __init__(self, job: Job, min_interval: float = 0.5):
+        self.job = job
+        self.min_interval = min_interval
+        self._last_write = 0.0
+        self._last_cancel_check = 0.0
+        self._cancelled = False
+
+    @property
+    def job_id(self) -> str:
+        return str(self.job.id)
+
+    @property
+    def owner_id(self) -> int:
+        return self.job.owner_id
+
+    @property
+    def payload(self) -> Dict[str, Any]:
+        return self.job.payload
+
+    @property
+    def attempt(self) -> int:
+        """当前是第几次执行"""
+        return self.job.attempts
+
+    @property
+    def will_retry(self) -> bool:
+        """本次执行失败后是否还会自动重试"""
+        return self.job.attempts < self.job.max_attempts
+
+    def update(self, progress: Dict[str, Any], force: bool = False):
+        """
+        发布进度：立即通知本进程的订阅者；写库（同时作为心跳）按最小间隔节流，
+        其他进程的订阅者最迟在一个间隔后看到最新进度
+        """
+        self.job.progress = progress
+        progress_store.publish(self.job, progress, state=Job.STATE_RUNNING)
+        now = time.monotonic()
+        if not force and now - self._last_write < self.min_interval:
+            return
+        self._last_write = now
+        Job.objects.filter(id=self.job.id).update(
+            progress=progress, progress_seq=self.job.progress_seq, heartbeat_at=timezone.now()
+        )
+
+    def is_cancelled(self) -> bool:
+        """读取取消标记（按最小间隔节流查询）"""
+        now = time.monotonic()
+        if not self._cancelled and now - self._last_cancel_check >= self.min_interval:
+            self._last_cancel_check = now
+            self._cancelled = Job.objects.filter(id=self.job.id, cancel_requested=True).exists()
+        return self._cancelled
+
+    def check_cancelled(self):
+        """检查点：任务被取消时抛出 JobCancelled"""
+        if self.is_cancelled():
+            raise JobCancelled(f"任务 {self.job_id} 已取消")
+
+
+class JobQueue:
+    """基于数据库的任务队列和有界工作线程池"""
+
+    def __init__(
+        self,
+        workers: int = 4,
+        max_attempts: int = 3,
+        poll_interval: float = 1.0,
+        stale_seconds: float = 300.0,
+        run_in_process: bool = True,
+        handlers: Dict[str, str] = None
+    ):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.stale_seconds = stale_seconds
+        self.run_in_process = run_in_process
+        self.handlers = dict(handlers or JOB_HANDLERS)
+        # 运行中任务的心跳间隔：超时阈值的三分之一，阈值内至少刷新两次
+        self.heartbeat_interval = max(1.0, stale_seconds / 3)
+        self._lock = threading.Lock()
+        # 只在本进程内串行化"查询-入队"；多个Web进程同时提交时仍可能各自创建一个任务
+        self._enqueue_lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._stats = {'executed': 0, 'succeeded': 0, 'failed': 0, 'retried': 0, 'cancelled': 0}
+
+    # ---- 入队与查询 ----
+
+    def enqueue(self, kind: str, owner_id: int = 0, payload: Dict[str, Any] = None,
+                progress: Dict[str, Any] = None, max_attempts: int = None,
+                priority: int = Job.PRIORITY_NORMAL) -> Job:
+        """创建任务；在进程内运行工作线程时按需启动线程池"""
+        if kind not in self.handlers:
+            raise ValueError(f"未知的任务类型: {kind}")
+        job = Job.objects.create(
+            kind=kind,
+            owner_id=owner_id,
+            payload=payload or {},
+            progress=progress or {'status': 'queued', 'message': '任务已提交，正在排队...'},
+            max_attempts=max_attempts or self.max_attempts,
+            priority=priority
+        )
+        logger.info(f"任务入队: {kind} {job.id} (用户{owner_id}, 优先级{priority})")
+        if self.run_in_process:
+            self.start()
+        self._wake.set()
+        return job
+
+    def active(self, kind: str, owner_id: int) -> Optional[Job]:
+        """用户尚未结束（排队或运行中）的同类任务"""
+        return Job.objects.filter(
+            kind=kind, owner_id=owner_id, state__in=[Job.STATE_QUEUED, Job.STATE_RUNNING]
+        ).order_by('created_at').first()
+
+    def enqueue_or_join(self, kind: str, owner_id: int = 0, payload: Dict[str, Any] = None,
+                        progress: Dict[str, Any] = None, max_attempts: int = None,
+                        priority: int = Job.PRIORITY_NORMAL) -> Tuple[Job, bool]:
+        """
+        同一用户已有未结束的同类任务时直接加入该任务，不再重复提交；
+        加入的任务优先级较低（如后台预先生成）时提升到本次请求的优先级，尝试次数也提升到本次请求的次数。
+        本次请求的参数与已有任务不同时：任务仍在排队则改用新参数；
+        低优先级任务已开始运行则取消后按新参数重新提交，不丢弃用户指定的参数。
+        返回 (任务, 是否新建)。
+        """
+        with self._enqueue_lock:
+            job = self.active(kind, owner_id)
+            if job is not None and not job.cancel_requested and payload \
+                    and not self._same_payload(job.payload, payload):
+                merged = {**job.payload, **payload}
+                if Job.objects.filter(id=job.id, state=Job.STATE_QUEUED).update(payload=merged):
+                    logger.info(f"排队中的任务改用新参数: {kind} {job.id} (用户{owner_id})")
+                    job.payload = merged
+                else:
+                    job.refresh_from_db()
+                    if job.state in Job.FINISHED_STATES:
+                        job = None
+                    elif job.state == Job.STATE_RUNNING and job.priority < priority:
+                        logger.info(f"参数不同，取消运行中的低优先级任务并重新提交: {kind} {job.id} (用户{owner_id})")
+                        self.cancel(job.id)
+                        job = None
+            if job is not None and not job.cancel_requested:
+                logger.info(f"加入已有任务: {kind} {job.id} (用户{owner_id})")
+                if job.priority < priority:
+                    # 预先生成的任务只尝试一次；用户确认后按普通任务重试
+                    attempts = max_attempts or self.max_attempts
+                    Job.objects.filter(id=job.id, priority__lt=priority).update(
+                        priority=priority, max_attempts=Greatest(F('max_attempts'), attempts)
+                    )
+                    job.priority = priority
+                    job.max_attempts = max(job.max_attempts, attempts)
+                    self._wake.set()
+                return job, False
+            return self.enqueue(kind, owner_id=owner_id, payload=payload, progress=progress,
+                                max_attempts=max_attempts, priority=priority), True
+
+    @staticmethod
+    def _same_payload(existing: Dict[str, Any], requested: Dict[str, Any]) -> bool:
+        """比较本次请求的参数是否与已有任务一致（未指定的参数视为一致）"""
+        return all(existing.get(key) == value for key, value in requested.items() if value not in (None, False))
+
+    def count_recent(self, kind: str, since, owner_id: int = None, **filters) -> int:
+        """统计某时间之后创建的同类任务数（可按用户和其他字段过滤）"""
+        queryset = Job.objects.filter(kind=kind, created_at__gte=since, **filters)
+        if owner_id is not None:
+            queryset = queryset.filter(owner_id=owner_id)
+        return queryset.count()
+
+    def get(self, job_id, owner_id: int = None) -> Optional[Job]:
+        """按ID获取任务；指定 owner_id 时只返回该用户的任务"""
+        queryset = Job.objects.filter(id=job_id)
+        if owner_id is not None:
+            queryset = queryset.filter(owner_id=owner_id)
+        return queryset.first()
+
+    def latest(self, owner_id: int, kinds: List[str] = None, include_speculative: bool = False) -> Optional[Job]:
+        """
+        用户最近创建的任务。
+        默认跳过用户尚未确认的后台预先生成任务（低优先级），避免遮住刚完成的解析任务的状态
+        """
+        queryset = Job.objects.filter(owner_id=owner_id)
+        if not include_speculative:
+            queryset = queryset.exclude(priority=Job.PRIORITY_SPECULATIVE)
+        if kinds:
+            queryset = queryset.filter(kind__in=kinds)
+        return queryset.order_by('-created_at').first()
+
+    def list_jobs(self, owner_id: int, limit: int = 20) -> List[Job]:
+        return list(Job.objects.filter(owner_id=owner_id).order_by('-created_at')[:limit])
+
+    def queue_position(self, job: Job) -> int:
+        """排队中的任务前面还有多少个任务"""
+        if job.state != Job.STATE_QUEUED:
+            return 0
+        return Job.objects.filter(state=Job.STATE_QUEUED).filter(
+            Q(priority__gt=job.priority) | Q(priority=job.priority, created_at__lt=job.created_at)
+        ).count()
+
+    def status_for(self, snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        """把进度快照转换为前端使用的状态，附带任务ID、序号和排队位置"""
+        status = dict(snapshot['progress'] or {})
+        status.setdefault('status', snapshot['state'])
+        status['job_id'] = snapshot['job_id']
+        status['job_state'] = snapshot['state']
+        status['seq'] = snapshot['seq']
+        if snapshot['state'] == Job.STATE_QUEUED:
+            job = Job.objects.filter(id=snapshot['job_id']).first()
+            position = self.queue_position(job) if job else 0
+            status['queue_position'] = position
+            if position:
+                status['message'] = f"任务排队中，前面还有{position}个任务..."
+        return status
+
+    def latest_status(self, owner_id: int, kinds: List[str] = None) -> Optional[Dict[str, Any]]:
+        """用户最近一个任务的状态"""
+        job = self.latest(owner_id, kinds)
+        if job is None:
+            return None
+        return self.status_for(progress_store.get(job.id) or progress_store.snapshot(job))
+
+    # ---- 取消与重试 ----
+
+    def cancel(self, job_id) -> Optional[Job]:
+        """排队中的任务直接取消；运行中的任务标记取消，由处理函数在下一个检查点退出"""
+        now = timezone.now()
+        Job.objects.filter(id=job_id, state=Job.STATE_QUEUED).update(
+            state=Job.STATE_CANCELLED, cancel_requested=True, finished_at=now,
+            progress={'status': 'cancelled', 'message': '任务已取消'}, progress_seq=F('progress_seq') + 1
+        )
+        Job.objects.filter(id=job_id, state=Job.STATE_RUNNING).update(cancel_requested=True)
+        return self.get(job_id)
+
+    def retry(self, job_id) -> Optional[Job]:
+        """失败或已取消的任务重新排队"""
+        updated = Job.objects.filter(id=job_id, state__in=[Job.STATE_FAILED, Job.STATE_CANCELLED]).update(
+            state=Job.STATE_QUEUED, cancel_requested=False, error='', finished_at=None,
+            available_at=timezone.now(), attempts=0, progress_seq=F('progress_seq') + 1,
+            progress={'status': 'queued', 'message': '任务已重新提交，正在排队...'}
+        )
+        if updated:
+            progress_store.forget(job_id)
+            if self.run_in_process:
+                self.start()
+            self._wake.set()
+        return self.get(job_id)
+
+    # ---- 执行 ----
+
+    def claim(self, worker_name: str) -> Optional[Job]:
+        """领取一个可执行的任务（条件更新保证多个工作进程不会重复领取）"""
+        now = timezone.now()
+        candidates = Job.objects.filter(
+            state=Job.STATE_QUEUED, available_at__lte=now
+        ).order_by('-priority', 'created_at').values_list('id', flat=True)[:5]
+        for job_id in candidates:
+            claimed = Job.objects.filter(id=job_id, state=Job.STATE_QUEUED).update(
+                state=Job.STATE_RUNNING, worker=worker_name, started_at=now,
+                heartbeat_at=now, attempts=F('attempts') + 1
+            )
+            if claimed:
+                return Job.objects.get(id=job_id)
+        return None
+
+    def _resolve_handler(self, kind: str) -> Callable[[JobContext], Any]:
+        module_name, func_name = self.handlers[kind].rsplit('.', 1)
+        return getattr(importlib.import_module(module_name), func_name)
+
+    def retry_delay(self, attempts: int) -> float:
+        """第 attempts 次失败后的重试等待时间"""
+        return min(60.0, 5.0 * (2 ** max(attempts - 1, 0)))
+
+    def _heartbeat(self, job_id, stop: threading.Event):
+        """任务运行期间定期刷新心跳，与处理函数是否上报进度无关"""
+        try:
+            while not stop.wait(self.heartbeat_interval):
+                Job.objects.filter(id=job_id, state=Job.STATE_RUNNING).update(heartbeat_at=timezone.now())
+        except Exception as e:
+            logger.warning(f"刷新任务心跳失败: {job_id}: {e}")
+        finally:
+            close_old_connections()
+
+    def run_job(self, job: Job) -> Job:
+        """执行已领取的任务并记录结果"""
+        context = JobContext(job)
+        with self._lock:
+            self._stats['executed'] += 1
+        stop_heartbeat = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat, args=(job.id, stop_heartbeat), name=f"job-heartbeat-{job.id}", daemon=True
+        )
+        heartbeat.start()
+        try:
+            result = self._resolve_handler(job.kind)(context)
+        except JobCancelled:
+            logger.info(f"任务已取消: {job.kind} {job.id}")
+            self._finish(job, Job.STATE_CANCELLED, progress={'status': 'cancelled', 'message': '任务已取消'})
+            self._count('cancelled')
+        except Exception as e:
+            message = str(e)
+            # 运行期间可能被取消，或被用户确认后提高了尝试次数
+            cancelled, job.max_attempts = Job.objects.filter(id=job.id).values_list(
+                'cancel_requested', 'max_attempts').get()
+            if job.attempts < job.max_attempts and not cancelled:
+                delay = self.retry_delay(job.attempts)
+                logger.warning(f"任务失败，{delay:.0f}秒后重试({job.attempts}/{job.max_attempts}): {job.kind} {job.id}: {message}")
+                Job.objects.filter(id=job.id).update(
+                    state=Job.STATE_QUEUED, worker='', error=message,
+                    available_at=timezone.now() + timedelta(seconds=delay),
+                    progress={'status': 'queued', 'message': f'处理失败，{delay:.0f}秒后自动重试：{message}'},
+                    progress_seq=F('progress_seq') + 1
+                )
+                # 重试可能由其他进程领取，订阅方改为读取数据库
+                progress_store.forget(job.id)
+                self._count('retried')
+            else:
+                logger.error(f"任务失败: {job.kind} {job.id}: {message}")
+                self._finish(job, Job.STATE_FAILED, error=message, progress={'status': 'error', 'message': message})
+                self._count('failed')
+        else:
+            progress = context.job.progress or {}
+            self._finish(job, Job.STATE_SUCCEEDED, result=result, progress=progress)
+            self._count('succeeded')
+        finally:
+            # 心跳只更新运行中的任务，结束状态写入后停止不会覆盖结果
+            stop_heartbeat.set()
+            heartbeat.join()
+        return Job.objects.get(id=job.id)
+
+    def _finish(self, job: Job, state: str, progress: Dict[str, Any], **fields):
+        """记录任务结束状态并发布最终进度"""
+        progress_store.publish(job, progress, state=state)
+        Job.objects.filter(id=job.id).update(
+            state=state, finished_at=timezone.now(), progress=progress, progress_seq=job.progress_seq, **fields
+        )
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def recover_stale(self) -> int:
+        """
+        心跳超时的运行中任务（工作进程已退出）：尝试次数未用完的重新排队，已用完的标记为失败。
+        返回重新排队的任务数。
+        """
+        now = timezone.now()
+        stale = Job.objects.filter(state=Job.STATE_RUNNING, heartbeat_at__lt=now - timedelta(seconds=self.stale_seconds))
+        message = '工作进程已退出，任务未完成'
+        failed = stale.filter(attempts__gte=F('max_attempts')).update(
+            state=Job.STATE_FAILED, worker='', error=message, finished_at=now,
+            progress={'status': 'error', 'message': message}, progress_seq=F('progress_seq') + 1
+        )
+        recovered = stale.filter(attempts__lt=F('max_attempts')).update(
+            state=Job.STATE_QUEUED, worker='', available_at=now
+        )
+        if failed:
+            logger.warning(f"{failed}个运行中任务心跳超时且已用完尝试次数，标记为失败")
+        if recovered:
+            logger.warning(f"{recovered}个运行中任务心跳超时，已重新排队")
+        return recovered
+
+    def run_once(self, worker_name: str = 'inline') -> Optional[Job]:
+        """领取并执行一个任务，没有可执行任务时返回None"""
+        job = self.claim(worker_name)
+        if job is None:
+            return None
+        return self.run_job(job)
+
+    def _worker_loop(self, worker_name: str):
+        while not self._stop.is_set():
+            try:
+                job = self.claim(worker_name)
+                if job is None:
+                    self._wake.wait(self.poll_interval)
+                    self._wake.clear()
+                    continue
+                self.run_job(job)
+            except Exception as e:
+                logger.error(f"工作线程{worker_name}出错: {type(e).__name__}: {e}")
+                time.sleep(self.poll_interval)
+            finally:
+                close_old_connections()
+
+    def start(self, workers: int = None):
+        """启动工作线程池（已启动时忽略）"""
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            if self._threads:
+                return
+            self._stop.clear()
+            try:
+                self.recover_stale()
+            except Exception as e:
+                logger.warning(f"恢复超时任务失败: {e}")
+            prefix = f"{socket.gethostname()}:{os.getpid()}"
+            for index in range(workers or self.workers):
+                thread = threading.Thread(
+                    target=self._worker_loop, args=(f"{prefix}:{index}",),
+                    name=f"job-worker-{index}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"任务工作线程池已启动: {len(self._threads)}个线程")
+
+    def stop(self, timeout: float = None):
+        """停止领取新任务，等待正在执行的任务结束"""
+        self._stop.set()
+        self._wake.set()
+        for thread in list(self._threads):
+            thread.join(timeout)
+        self._threads = []
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['workers'] = sum(1 for thread in self._threads if thread.is_alive())
+        stats['queued'] = Job.objects.filter(state=Job.STATE_QUEUED).count()
+        stats['running'] = Job.objects.filter(state=Job.STATE_RUNNING).count()
+        return stats
+
+
+# 全局任务队列
+job_queue = JobQueue(
+    workers=api_config.job_workers,
+    max_attempts=api_config.job_max_attempts,
+    poll_interval=api_config.job_poll_interval,
+    stale_seconds=api_config.job_stale_seconds,
+    run_in_process=api_config.job_run_in_process
+)
@@ -0,0 +1,360 @@
+"""
+本地 OpenAI 兼容的LLM替身服务
+
+实现 /v1/chat/completions（流式与非流式）和 /v1/models，
+可配置首字延迟、输出速度、错误率，并按提示词类型返回预置内容。
+用于无网络环境下的端到端压测和延迟测量：
+
+    python manage.py llm_stub_server --port 8765 --ttft 0.5 --tps 40
+    GEMINI_BASE_URL=http://127.0.0.1:8765/v1 GEMINI_API_KEY=stub python manage.py runserver
+"""
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .token_budget import estimate_messages_tokens
+
+logger = logging.getLogger(__name__)
+
+_QUESTION_PAYLOADS = {
+    '选择题': {
+        "text": "下列关于机器学习的说法中，正确的是哪一项？",
+        "type": "选择题",
+        "options": ["A. 监督学习不需要标注数据", "B. 过拟合意味着模型在训练集上表现差",
+                    "C. 交叉验证可以评估模型的泛化能力", "D. 特征越多模型一定越好"],
+        "answer": "C",
+        "explanation": "交叉验证通过多次划分训练集和验证集来估计模型在未见数据上的表现。"
+    },
+    '填空题': {
+        "text": "在神经网络中，用于引入非线性的函数称为______。",
+        "type": "填空题",
+        "answer": "激活函数",
+        "explanation": "激活函数（如ReLU、Sigmoid）使网络能够拟合非线性关系。"
+    },
+    '判断题': {
+        "text": "梯度下降法一定能找到全局最优解。",
+        "type": "判断题",
+        "options": ["A. 正确", "B. 错误"],
+        "answer": "B",
+        "explanation": "对于非凸问题，梯度下降可能陷入局部最优。"
+    },
+    '解答题': {
+        "text": "简述正则化在机器学习中的作用。",
+        "type": "解答题",
+        "answer": "正则化通过在损失函数中加入模型复杂度惩罚项，限制参数规模，从而降低过拟合风险。",
+        "explanation": "常见的正则化方法包括L1、L2正则和Dropout。"
+    },
+}
+
+_NOTES_PAYLOAD = """# 机器学习基础
+
+## 一、基本概念
+
+机器学习是人工智能的一个分支，研究如何让计算机从数据中自动学习规律。
+
+- **监督学习**：使用带标签的数据训练模型，例如分类与回归。
+- **无监督学习**：从无标签数据中发现结构，例如聚类与降维。
+- **强化学习**：智能体通过与环境交互获得奖励来学习策略。
+
+## 二、模型评估
+
+### 2.1 训练集与测试集
+
+将数据划分为训练集和测试集，用测试集估计模型的泛化能力。
+
+### 2.2 过拟合与欠拟合
+
+过拟合指模型在训练集上表现很好但在新数据上表现差；欠拟合指模型无法捕捉数据中的规律。
+
+## 三、常用算法
+
+| 算法 | 类型 | 特点 |
+| --- | --- | --- |
+| 线性回归 | 回归 | 简单、可解释 |
+| 决策树 | 分类/回归 | 易于理解 |
+| 支持向量机 | 分类 | 适合高维数据 |
+
+## 总结
+
+掌握基本概念、评估方法和常用算法是学习机器学习的第一步。
+"""
+
+_MINDMAP_PAYLOAD = {
+    "name": "章节标题",
+    "children": [
+        {"name": "核心概念", "children": [{"name": "定义", "children": []}, {"name": "特点", "children": []}]},
+        {"name": "关键方法", "children": [{"name": "步骤", "children": []}]}
+    ]
+}
+
+
+def _json_block(payload: Any) -> str:
+    return "```json\n" + json.dumps(payload, ensure_ascii=False, indent=2) + "\n```"
+
+
+_QUESTION_TYPE_PATTERN = re.compile(r'(选择题|填空题|判断题|简答题|解答题)')
+
+
+def _question_type(prompt: str) -> str:
+    match = _QUESTION_TYPE_PATTERN.search(prompt)
+    if not match:
+        return '选择题'
+    return '解答题' if match.group(1) == '简答题' else match.group(1)
+
+
+def _question_payload(prompt: str) -> str:
+    return _json_block(_QUESTION_PAYLOADS[_question_type(prompt)])
+
+
+def _batch_payload(prompt: str) -> str:
+    """批量出题：按提示词要求的数量返回带 slice 字段的题目数组"""
+    count_match = re.search(r'一次性生成(\d+)道', prompt)
+    count = int(count_match.group(1)) if count_match else 3
+    question_type = _question_type(prompt[count_match.end():] if count_match else prompt)
+    items = []
+    for slice_index in range(1, count + 1):
+        item = dict(_QUESTION_PAYLOADS[question_type])
+        item['text'] = f"（片段{slice_index}）" + item['text']
+        item['slice'] = slice_index
+        items.append(item)
+    return _json_block(items)
+
+
+# 提示词类型: (名称, 匹配函数, 生成函数)，按顺序匹配，特征越明确的越靠前
+PROMPT_FAMILIES: List[Tuple[str, Callable[[str], bool], Callable[[str], str]]] = [
+    ('question_batch', lambda p: '"slice"' in p, _batch_payload),
+    ('notes', lambda p: '学术笔记整理专家' in p, lambda p: _NOTES_PAYLOAD),
+    ('summary', lambda p: '题目集合' in p,
+     lambda p: "本次练习覆盖了核心概念、模型评估与常用算法，建议重点复习过拟合与正则化相关内容。"),
+    ('question', lambda p: '生成一道' in p, _question_payload),
+    ('mindmap', lambda p: '思维导图' in p, lambda p: json.dumps(_MINDMAP_PAYLOAD, ensure_ascii=False)),
+    ('chat', lambda p: True,
+     lambda p: "这是本地替身服务的回复。机器学习通过数据训练模型，常见方法包括监督学习、无监督学习和强化学习。"),
+]
+
+_PIECE_PATTERN = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]|[A-Za-z]{1,4}|\d{1,3}|\s+|.', re.S)
+
+
+class StubProfile:
+    """替身服务的延迟与错误配置"""
+
+    def __init__(
+        self,
+        ttft: float = 0.3,
+        tokens_per_second: float = 50.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        payloads: Optional[Dict[str, str]] = None,
+        seed: Optional[int] = None
+    ):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_status = error_status
+        # 按提示词类型覆盖预置内容，如 {'chat': '固定回复'}
+        self.payloads = payloads or {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'streamed': 0, 'errors': 0, 'completion_tokens': 0}
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def record(self, key: str, amount: int = 1):
+        with self._lock:
+            self.stats[key] += amount
+
+
+def classify_prompt(prompt: str) -> str:
+    """判断提示词所属类型"""
+    for name, matcher, _ in PROMPT_FAMILIES:
+        if matcher(prompt):
+            return name
+    return 'chat'
+
+
+def render_reply(prompt: str, profile: StubProfile) -> Tuple[str, str]:
+    """返回 (提示词类型, 回复文本)"""
+    family = classify_prompt(prompt)
+    if family in profile.payloads:
+        return family, profile.payloads[family]
+    for name, _, render in PROMPT_FAMILIES:
+        if name == family:
+            return family, render(prompt)
+    return family, ""
+
+
+def split_pieces(text: str) -> List[str]:
+    """把回复切分为近似token的片段（中文单字、英文最多4个字母）"""
+    return _PIECE_PATTERN.findall(text)
+
+
+def _prompt_text(messages: List[Dict[str, Any]]) -> str:
+    parts = []
+    for message in messages:
+        content = message.get('content')
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(part.get('text', '') for part in content if part.get('type') == 'text')
+    return "\n".join(parts)
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """OpenAI 兼容接口的请求处理器"""
+
+    server_version = "LLMStub/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def profile(self) -> StubProfile:
+        return self.server.profile
+
+    def log_message(self, format, *args):
+        logger.debug("llm-stub: " + format % args)
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self._send_json(200, {
+                'object': 'list',
+                'data': [{'id': 'stub-model', 'object': 'model', 'owned_by': 'local'}]
+            })
+        else:
+            self._send_json(404, {'error': {'message': 'not found', 'type': 'invalid_request_error'}})
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'not found', 'type': 'invalid_request_error'}})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except (ValueError, json.JSONDecodeError):
+            self._send_json(400, {'error': {'message': 'invalid JSON body', 'type': 'invalid_request_error'}})
+            return
+
+        profile = self.profile
+        profile.record('requests')
+        if profile.should_fail():
+            profile.record('errors')
+            self._send_json(profile.error_status, {
+                'error': {'message': 'injected failure', 'type': 'server_error', 'code': profile.error_status}
+            })
+            return
+
+        messages = request.get('messages') or []
+        model = request.get('model') or 'stub-model'
+        max_tokens = request.get('max_tokens')
+        _, text = render_reply(_prompt_text(messages), profile)
+
+        pieces = split_pieces(text)
+        finish_reason = 'stop'
+        if max_tokens and len(pieces) > max_tokens:
+            pieces = pieces[:max_tokens]
+            finish_reason = 'length'
+
+        usage = {
+            'prompt_tokens': estimate_messages_tokens(messages),
+            'completion_tokens': len(pieces),
+        }
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        profile.record('completion_tokens', len(pieces))
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        if request.get('stream'):
+            profile.record('streamed')
+            include_usage = bool((request.get('stream_options') or {}).get('include_usage'))
+            self._stream(completion_id, model, pieces, finish_reason, usage if include_usage else None)
+        else:
+            time.sleep(profile.ttft + self._generation_time(len(pieces)))
+            self._send_json(200, {
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': "".join(pieces)},
+                    'finish_reason': finish_reason
+                }],
+                'usage': usage
+            })
+
+    def _generation_time(self, token_count: int) -> float:
+        tps = self.profile.tokens_per_second
+        return token_count / tps if tps and tps > 0 else 0.0
+
+    def _stream(self, completion_id: str, model: str, pieces: List[str], finish_reason: str,
+                usage: Optional[Dict[str, int]]):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        try:
+            time.sleep(self.profile.ttft)
+            interval = self._generation_time(1)
+            for chunk in self._chunks(completion_id, model, pieces, finish_reason, usage):
+                self.wfile.write(("data: " + json.dumps(chunk, ensure_ascii=False) + "\n\n").encode('utf-8'))
+                self.wfile.flush()
+                if interval and chunk['choices'] and chunk['choices'][0]['delta'].get('content'):
+                    time.sleep(interval)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug("llm-stub: 客户端提前断开连接")
+
+    @staticmethod
+    def _chunks(completion_id: str, model: str, pieces: List[str], finish_reason: str,
+                usage: Optional[Dict[str, int]]) -> Iterator[Dict[str, Any]]:
+        base = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model}
+        yield {**base, 'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': ''}, 'finish_reason': None}]}
+        for piece in pieces:
+            yield {**base, 'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]}
+        yield {**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': finish_reason}]}
+        if usage is not None:
+            yield {**base, 'choices': [], 'usage': usage}
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    """多线程替身服务，每个请求一个线程"""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], profile: Optional[StubProfile] = None):
+        super().__init__(address, StubRequestHandler)
+        self.profile = profile or StubProfile()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def start_stub_server(host: str = '127.0.0.1', port: int = 0,
+                      profile: Optional[StubProfile] = None) -> StubLLMServer:
+    """在后台线程启动替身服务（port=0 时自动分配端口），返回服务实例"""
+    server = StubLLMServer((host, port), profile)
+    thread = threading.Thread(target=server.serve_forever, name='llm-stub-server', daemon=True)
+    thread.start()
+    logger.info(f"LLM替身服务已启动: {server.base_url}")
+    return server
+
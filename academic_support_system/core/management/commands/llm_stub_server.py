@@ -0,0 +1,59 @@
+"""
+启动本地 OpenAI 兼容的LLM替身服务
+
+用法:
+    python manage.py llm_stub_server --port 8765 --ttft 0.5 --tps 40 --error-rate 0.05
+然后设置 GEMINI_BASE_URL=http://127.0.0.1:8765/v1 让应用指向该服务。
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.llm_stub_server import PROMPT_FAMILIES, StubLLMServer, StubProfile
+
+
+class Command(BaseCommand):
+    help = '启动本地 OpenAI 兼容的LLM替身服务，用于离线压测和延迟测量'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+        parser.add_argument('--port', type=int, default=8765, help='监听端口')
+        parser.add_argument('--ttft', type=float, default=0.3, help='首个token延迟（秒）')
+        parser.add_argument('--tps', type=float, default=50.0, help='每秒输出token数，0表示不限速')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='注入错误的概率（0-1）')
+        parser.add_argument('--error-status', type=int, default=503, help='注入错误时返回的HTTP状态码')
+        parser.add_argument('--payloads', help='JSON文件，按提示词类型覆盖预置回复，如 {"chat": "..."}')
+        parser.add_argument('--seed', type=int, help='错误注入的随机种子')
+
+    def handle(self, *args, **options):
+        payloads = None
+        if options['payloads']:
+            try:
+                with open(options['payloads'], 'r', encoding='utf-8') as f:
+                    payloads = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'读取预置回复失败: {e}')
+
+        profile = StubProfile(
+            ttft=options['ttft'],
+            tokens_per_second=options['tps'],
+            error_rate=options['error_rate'],
+            error_status=options['error_status'],
+            payloads=payloads,
+            seed=options['seed']
+        )
+        server = StubLLMServer((options['host'], options['port']), profile)
+
+        families = ', '.join(name for name, _, _ in PROMPT_FAMILIES)
+        self.stdout.write(self.style.SUCCESS(f'LLM替身服务已启动: {server.base_url}'))
+        self.stdout.write(f'首字延迟={profile.ttft}s, 速度={profile.tokens_per_second} token/s, '
+                          f'错误率={profile.error_rate}, 提示词类型: {families}')
+        self.stdout.write(f'设置 GEMINI_BASE_URL={server.base_url} 以使用该服务，Ctrl+C 停止')
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f'已停止，统计: {profile.stats}')
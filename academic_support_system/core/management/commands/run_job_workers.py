@@ -0,0 +1,51 @@
+"""
+在独立进程中运行后台任务工作线程
+
+用法:
+    python manage.py run_job_workers --workers 4
+Web进程设置 JOB_RUN_IN_PROCESS=false 后只负责入队，任务由该命令领取执行。
+"""
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from core.api_config import api_config
+from core.jobs import job_queue
+
+
+class Command(BaseCommand):
+    help = '运行后台任务（文件解析、笔记生成）的工作线程池'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=api_config.job_workers, help='工作线程数')
+        parser.add_argument('--poll-interval', type=float, default=api_config.job_poll_interval,
+                            help='没有任务时的轮询间隔（秒）')
+        parser.add_argument('--once', action='store_true', help='执行完当前可执行的任务后退出')
+
+    def handle(self, *args, **options):
+        job_queue.poll_interval = options['poll_interval']
+
+        if options['once']:
+            job_queue.recover_stale()
+            count = 0
+            while job_queue.run_once('manage-once') is not None:
+                count += 1
+            self.stdout.write(self.style.SUCCESS(f'已执行{count}个任务'))
+            return
+
+        stopped = threading.Event()
+
+        def shutdown(signum, frame):
+            self.stdout.write('收到退出信号，等待正在执行的任务结束...')
+            stopped.set()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+
+        job_queue.start(workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(f'任务工作进程已启动: {options["workers"]}个线程'))
+        while not stopped.wait(1.0):
+            pass
+        job_queue.stop()
+        self.stdout.write(self.style.SUCCESS('任务工作进程已退出'))
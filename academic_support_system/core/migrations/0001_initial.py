@@ -0,0 +1,42 @@
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(max_length=50, verbose_name='任务类型')),
+                ('owner_id', models.IntegerField(db_index=True, default=0, verbose_name='用户ID')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='任务参数')),
+                ('state', models.CharField(choices=[('queued', '排队中'), ('running', '运行中'), ('succeeded', '已完成'), ('failed', '失败'), ('cancelled', '已取消')], default='queued', max_length=20, verbose_name='状态')),
+                ('progress', models.JSONField(blank=True, default=dict, verbose_name='进度')),
+                ('result', models.JSONField(blank=True, null=True, verbose_name='结果')),
+                ('error', models.TextField(blank=True, verbose_name='错误信息')),
+                ('attempts', models.IntegerField(default=0, verbose_name='已尝试次数')),
+                ('max_attempts', models.IntegerField(default=3, verbose_name='最大尝试次数')),
+                ('cancel_requested', models.BooleanField(default=False, verbose_name='已请求取消')),
+                ('worker', models.CharField(blank=True, max_length=100, verbose_name='工作线程')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='可执行时间')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True, verbose_name='心跳时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='结束时间')),
+            ],
+            options={
+                'verbose_name': '后台任务',
+                'verbose_name_plural': '后台任务',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['state', 'available_at'], name='core_job_state_idx'), models.Index(fields=['owner_id', 'kind', 'created_at'], name='core_job_owner_idx')],
+            },
+        ),
+    ]
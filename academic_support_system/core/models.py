@@ -0,0 +1,77 @@
+import uuid
+
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """后台任务（文件解析、笔记生成等），持久化在数据库中，重启后可继续执行"""
+    STATE_QUEUED = 'queued'
+    STATE_RUNNING = 'running'
+    STATE_SUCCEEDED = 'succeeded'
+    STATE_FAILED = 'failed'
+    STATE_CANCELLED = 'cancelled'
+    STATES = [
+        (STATE_QUEUED, '排队中'),
+        (STATE_RUNNING, '运行中'),
+        (STATE_SUCCEEDED, '已完成'),
+        (STATE_FAILED, '失败'),
+        (STATE_CANCELLED, '已取消'),
+    ]
+    FINISHED_STATES = (STATE_SUCCEEDED, STATE_FAILED, STATE_CANCELLED)
+    # 优先级：数值大的先执行；预先生成等后台推测任务使用负数，让位于用户主动发起的任务
+    PRIORITY_NORMAL = 0
+    PRIORITY_SPECULATIVE = -10
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=50, verbose_name="任务类型")
+    # 游客的用户ID为0，因此不使用外键
+    owner_id = models.IntegerField(default=0, db_index=True, verbose_name="用户ID")
+    payload = models.JSONField(default=dict, blank=True, verbose_name="任务参数")
+    state = models.CharField(max_length=20, choices=STATES, default=STATE_QUEUED, verbose_name="状态")
+    priority = models.IntegerField(default=PRIORITY_NORMAL, verbose_name="优先级")
+    # 前端使用的进度信息（status/message/progress 等字段）
+    progress = models.JSONField(default=dict, blank=True, verbose_name="进度")
+    # 进度序号，每次进度变化加一，订阅方据此判断是否有新进度
+    progress_seq = models.IntegerField(default=0, verbose_name="进度序号")
+    result = models.JSONField(null=True, blank=True, verbose_name="结果")
+    error = models.TextField(blank=True, verbose_name="错误信息")
+    attempts = models.IntegerField(default=0, verbose_name="已尝试次数")
+    max_attempts = models.IntegerField(default=3, verbose_name="最大尝试次数")
+    cancel_requested = models.BooleanField(default=False, verbose_name="已请求取消")
+    worker = models.CharField(max_length=100, blank=True, verbose_name="工作线程")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="创建时间")
+    available_at = models.DateTimeField(default=timezone.now, verbose_name="可执行时间")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="开始时间")
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name="心跳时间")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="结束时间")
+
+    class Meta:
+        verbose_name = "后台任务"
+        verbose_name_plural = "后台任务"
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['state', 'available_at'], name='core_job_state_idx'),
+            models.Index(fields=['owner_id', 'kind', 'created_at'], name='core_job_owner_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}[{self.state}] - {self.id}"
+
+    def to_dict(self):
+        return {
+            'job_id': str(self.id),
+            'kind': self.kind,
+            'state': self.state,
+            'priority': self.priority,
+            'progress': self.progress,
+            'progress_seq': self.progress_seq,
+            'result': self.result,
+            'error': self.error,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'cancel_requested': self.cancel_requested,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
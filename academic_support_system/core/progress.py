@@ -0,0 +1,114 @@
+"""
+按任务ID保存的进度存储
+
+取代 generation_status['current'] 这类全用户共享的全局槽位：
+- 每个任务一条进度记录，带单调递增的序号（seq），读取是内存字典命中或数据库主键查询
+- 正在本进程执行的任务进度保存在内存中，发布时唤醒订阅者；同时写入 Job 表供其他进程读取
+- subscribe() 在进度变化时产出最新快照，供SSE接口推送，前端不再高频轮询
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional
+
+from .models import Job
+
+
+class ProgressStore:
+    """任务进度存储（进程内内存 + Job 表）"""
+
+    def __init__(self, poll_interval: float = 0.5, max_entries: int = 1000):
+        self.poll_interval = poll_interval
+        self.max_entries = max_entries
+        self._cond = threading.Condition()
+        # job_id -> 快照；只保存由本进程执行（或已在本进程结束）的任务
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def publish(self, job: Job, progress: Dict[str, Any], state: str = None) -> int:
+        """发布本进程执行中任务的新进度，返回新的序号"""
+        job_id = str(job.id)
+        with self._cond:
+            entry = self._entries.get(job_id)
+            seq = max(entry['seq'] if entry else 0, job.progress_seq or 0) + 1
+            self._entries[job_id] = {
+                'job_id': job_id,
+                'owner_id': job.owner_id,
+                'kind': job.kind,
+                'state': state or job.state,
+                'seq': seq,
+                'progress': progress,
+            }
+            self._entries.move_to_end(job_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._cond.notify_all()
+        job.progress_seq = seq
+        return seq
+
+    def forget(self, job_id):
+        """任务状态在本进程之外被修改（取消、重试）时丢弃内存快照，改为读取数据库"""
+        with self._cond:
+            self._entries.pop(str(job_id), None)
+            self._cond.notify_all()
+
+    def get(self, job_id) -> Optional[Dict[str, Any]]:
+        """读取任务的最新进度快照"""
+        with self._cond:
+            entry = self._entries.get(str(job_id))
+            if entry is not None:
+                return dict(entry)
+        job = Job.objects.filter(id=job_id).only(
+            'id', 'owner_id', 'kind', 'state', 'progress', 'progress_seq'
+        ).first()
+        return self.snapshot(job) if job else None
+
+    @staticmethod
+    def snapshot(job: Job) -> Dict[str, Any]:
+        return {
+            'job_id': str(job.id),
+            'owner_id': job.owner_id,
+            'kind': job.kind,
+            'state': job.state,
+            'seq': job.progress_seq,
+            'progress': job.progress or {},
+        }
+
+    def is_local(self, job_id) -> bool:
+        with self._cond:
+            return str(job_id) in self._entries
+
+    def subscribe(self, job_id, after_seq: int = 0, heartbeat: float = 15.0) -> Iterator[Optional[Dict[str, Any]]]:
+        """
+        产出序号大于 after_seq 的最新快照，任务结束后停止。
+        超过 heartbeat 秒没有变化时产出 None，调用方据此发送保活帧。
+        中间的进度可能被合并，只保证拿到最新状态。
+        """
+        job_id = str(job_id)
+        idle_since = time.monotonic()
+        while True:
+            snapshot = self.get(job_id)
+            if snapshot is None:
+                return
+            if snapshot['seq'] > after_seq:
+                after_seq = snapshot['seq']
+                idle_since = time.monotonic()
+                yield snapshot
+            if snapshot['state'] in Job.FINISHED_STATES:
+                return
+            if time.monotonic() - idle_since >= heartbeat:
+                idle_since = time.monotonic()
+                yield None
+
+            with self._cond:
+                entry = self._entries.get(job_id)
+                if entry is not None and entry['seq'] <= after_seq:
+                    # 本进程执行的任务：等待发布通知
+                    self._cond.wait(timeout=min(heartbeat, 5.0))
+                    continue
+            if entry is None:
+                # 其他进程执行的任务：在服务端按主键轮询数据库
+                time.sleep(self.poll_interval)
+
+
+# 全局进度存储
+progress_store = ProgressStore()
@@ -3,15 +3,8 @@ import os
 import re
 import time
 from typing import List, Dict, Any
-import requests
-from django.conf import settings
-
-# 动态导入配置
-import importlib.util
-config_path = os.path.join(settings.BASE_DIR.parent, 'config.py')
-spec = importlib.util.spec_from_file_location('config', config_path)
-config = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(config)
+from .api_config import api_config
+from .client_registry import client_registry
 
 def get_latest_notes_content(user_id):
     """获取用户最新的笔记内容"""
@@ -199,35 +192,31 @@ def generate_questions_from_notes(user_id, requirement, question_types=None):
 9. 确保返回的是有效的JSON格式
 """
 
-        # 调用AI生成题目
-        headers = {
-            'Authorization': f'Bearer {config.API_KEY}',
-            'Content-Type': 'application/json'
-        }
-        
-        data = {
-            'model': config.DEFAULT_MODEL,
-            'messages': [
-                {
-                    'role': 'user',
-                    'content': prompt
-                }
-            ],
-            'temperature': 0.7,
-            'max_tokens': 2000
-        }
-        
-        response = requests.post(
-            f'{config.BASE_URL}/chat/completions',
-            headers=headers,
-            json=data,
-            timeout=120  # 增加到2分钟
+        # 调用AI生成题目（复用共享连接池）
+        client = client_registry.get_openai_client(
+            api_key=api_config.api_key,
+            base_url=api_config.base_url
         )
-        
-        if response.status_code == 200:
-            result = response.json()
-            content = result['choices'][0]['message']['content']
-            
+
+        try:
+            response = client.chat.completions.create(
+                model=api_config.default_model,
+                messages=[
+                    {
+                        'role': 'user',
+                        'content': prompt
+                    }
+                ],
+                temperature=0.7,
+                max_tokens=2000,
+                timeout=120  # 增加到2分钟
+            )
+        except Exception as api_error:
+            return {"success": False, "error": f"AI服务错误: {api_error}"}
+
+        if response.choices:
+            content = response.choices[0].message.content or ''
+
             # 解析JSON响应
             try:
                 # 提取JSON部分
@@ -253,9 +242,9 @@ def generate_questions_from_notes(user_id, requirement, question_types=None):
                 print(f"JSON解析失败: {e}")
                 print(f"原始内容: {content}")
                 return {"success": False, "error": "AI响应格式错误"}
-                
+
         else:
-            return {"success": False, "error": f"AI服务错误: {response.status_code}"}
+            return {"success": False, "error": "AI服务返回了空响应"}
             
     except Exception as e:
         print(f"生成题目失败: {e}")
@@ -1,16 +1,22 @@
 """
 统一的出题服务
 """
+import asyncio
 import json
 import logging
-from typing import Dict, List, Any, Optional
+import re
+from typing import Dict, List, Any, Optional, Tuple
 from .unified_api_client import unified_client
+from .async_api_client import async_unified_client
+from .resilience import LLMUnavailableError
+from .api_config import api_config
 from prompts import (
     MULTIPLE_CHOICE_GENERATION_PROMPT,
     FILL_IN_BLANK_GENERATION_PROMPT,
     TRUE_FALSE_GENERATION_PROMPT,
     SHORT_ANSWER_GENERATION_PROMPT,
-    ANSWER_REPORT_GENERATION_PROMPT
+    ANSWER_REPORT_GENERATION_PROMPT,
+    QUESTION_BATCH_GENERATION_PROMPT
 )
 from .error_handler import error_handler
 
@@ -19,8 +25,11 @@ logger = logging.getLogger(__name__)
 class QuestionService:
     """统一的出题服务"""
     
-    def __init__(self):
+    def __init__(self, batch_size: Optional[int] = None):
         self.client = unified_client
+        self.async_client = async_unified_client
+        # 大于1时启用批量模式：一次请求生成同一题型的多道题目
+        self.batch_size = batch_size or api_config.question_batch_size
     
     def generate_questions(
         self,
@@ -43,11 +52,9 @@ class QuestionService:
         """
         try:
             # 验证输入参数
-            if not notes_content or notes_content.strip() == "":
-                return error_handler.handle_validation_error("笔记内容不能为空", "笔记内容")
-
-            if not question_types or len(question_types) == 0:
-                return error_handler.handle_validation_error("必须选择至少一种题目类型", "题目类型")
+            validation_error = self._validate_request(notes_content, question_types)
+            if validation_error:
+                return validation_error
 
             if not self.client.is_available():
                 logger.warning("API不可用，使用备用方案")
@@ -58,22 +65,7 @@ class QuestionService:
             questions = []
 
             # 为每种题型分别生成题目
-            for type_key, type_info in question_types.items():
-                type_name = type_info['name']
-                count = type_info['count']
-
-                if count <= 0:
-                    continue
-
-                logger.info(f"正在生成{count}道{type_name}")
-
-                # 获取对应的提示词模板
-                prompt_template = self._get_prompt_template(type_name)
-                if not prompt_template:
-                    logger.warning(f"未找到{type_name}的提示词模板，跳过")
-                    continue
-
-                # 生成该类型的题目
+            for type_name, prompt_template, count in self._get_type_plan(question_types):
                 type_questions = self._generate_questions_by_type(
                     prompt_template, type_name, count, notes_content, user_preferences
                 )
@@ -85,22 +77,151 @@ class QuestionService:
             # 生成题目总结
             summary = self._generate_questions_summary(questions, question_types)
 
-            return error_handler.create_success_response({
-                'questions': questions,
-                'total_count': len(questions),
-                'questions_summary': summary
-            }, f"成功生成了{len(questions)}道题目")
+            return self._build_success_response(questions, summary)
 
+        except LLMUnavailableError as e:
+            return error_handler.handle_api_error(e, "题目生成")
         except Exception as e:
             logger.error(f"生成题目失败: {e}")
-            # 尝试提供备用方案
-            try:
+            return self._handle_generation_failure(e, question_types, notes_content)
+
+    async def generate_questions_async(
+        self,
+        notes_content: str,
+        question_types: Dict[str, Dict[str, Any]],
+        user_preferences: str = "",
+        user_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        并发生成题目：所有题型的所有题目同时发起请求（受客户端信号量限制），
+        结果顺序与串行版本一致，单题失败时使用备用题目。
+        """
+        try:
+            validation_error = self._validate_request(notes_content, question_types)
+            if validation_error:
+                return validation_error
+
+            if not self.client.is_available():
+                logger.warning("API不可用，使用备用方案")
                 fallback_result = self._generate_fallback_questions(question_types, notes_content)
-                fallback_result['error'] = f"生成过程中出现问题，已提供备用题目: {str(e)}"
-                fallback_result['success'] = False
+                fallback_result['message'] = "AI服务暂时不可用，已为您生成示例题目"
                 return fallback_result
-            except:
-                return error_handler.handle_system_error(e, "题目生成")
+
+            tasks = []
+            for type_name, prompt_template, count in self._get_type_plan(question_types):
+                if self.batch_size > 1:
+                    for indices in self._split_batches(count):
+                        tasks.append(self._generate_batch_async(
+                            prompt_template, type_name, indices, count, notes_content, user_preferences
+                        ))
+                else:
+                    for i in range(count):
+                        tasks.append(self._generate_single_question_async(
+                            prompt_template, type_name, i, count, notes_content, user_preferences
+                        ))
+
+            # gather 按任务提交顺序返回结果，保证题目顺序确定
+            questions = []
+            for result in await asyncio.gather(*tasks):
+                if isinstance(result, list):
+                    questions.extend(result)
+                else:
+                    questions.append(result)
+
+            if not questions:
+                return error_handler.handle_business_error("未能生成任何题目，请检查笔记内容或重试")
+
+            summary = await self._generate_questions_summary_async(questions, question_types)
+
+            return self._build_success_response(questions, summary)
+
+        except LLMUnavailableError as e:
+            return error_handler.handle_api_error(e, "题目生成")
+        except Exception as e:
+            logger.error(f"并发生成题目失败: {e}")
+            return self._handle_generation_failure(e, question_types, notes_content)
+
+    def generate_questions_concurrently(
+        self,
+        notes_content: str,
+        question_types: Dict[str, Dict[str, Any]],
+        user_preferences: str = "",
+        user_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """供同步视图调用的并发出题入口，已有运行中的事件循环时退回串行版本"""
+        try:
+            asyncio.get_running_loop()
+            return self.generate_questions(notes_content, question_types, user_preferences, user_id)
+        except RuntimeError:
+            pass
+
+        async def _run():
+            try:
+                return await self.generate_questions_async(
+                    notes_content, question_types, user_preferences, user_id
+                )
+            finally:
+                from .client_registry import client_registry
+                await client_registry.aclose_loop_clients()
+
+        return asyncio.run(_run())
+
+    def _validate_request(
+        self,
+        notes_content: str,
+        question_types: Dict[str, Dict[str, Any]]
+    ) -> Optional[Dict[str, Any]]:
+        """验证输入参数，返回错误响应或None"""
+        if not notes_content or notes_content.strip() == "":
+            return error_handler.handle_validation_error("笔记内容不能为空", "笔记内容")
+
+        if not question_types or len(question_types) == 0:
+            return error_handler.handle_validation_error("必须选择至少一种题目类型", "题目类型")
+
+        return None
+
+    def _get_type_plan(self, question_types: Dict[str, Dict[str, Any]]) -> List[Tuple[str, str, int]]:
+        """按配置顺序列出需要生成的 (题型名称, 提示词模板, 数量)"""
+        plan = []
+        for type_key, type_info in question_types.items():
+            type_name = type_info['name']
+            count = type_info['count']
+
+            if count <= 0:
+                continue
+
+            logger.info(f"正在生成{count}道{type_name}")
+
+            # 获取对应的提示词模板
+            prompt_template = self._get_prompt_template(type_name)
+            if not prompt_template:
+                logger.warning(f"未找到{type_name}的提示词模板，跳过")
+                continue
+
+            plan.append((type_name, prompt_template, count))
+        return plan
+
+    def _build_success_response(self, questions: List[Dict[str, Any]], summary: str) -> Dict[str, Any]:
+        return error_handler.create_success_response({
+            'questions': questions,
+            'total_count': len(questions),
+            'questions_summary': summary
+        }, f"成功生成了{len(questions)}道题目")
+
+    def _handle_generation_failure(
+        self,
+        error: Exception,
+        question_types: Dict[str, Dict[str, Any]],
+        notes_content: str
+    ) -> Dict[str, Any]:
+        """生成过程异常时尝试提供备用方案"""
+        try:
+            fallback_result = self._generate_fallback_questions(question_types, notes_content)
+            fallback_result['error'] = f"生成过程中出现问题，已提供备用题目: {str(error)}"
+            fallback_result['success'] = False
+            return fallback_result
+        except:
+            return error_handler.handle_system_error(error, "题目生成")
     
     def _get_prompt_template(self, question_type: str) -> Optional[str]:
         """获取题型对应的提示词模板"""
@@ -121,43 +242,312 @@ class QuestionService:
         user_preferences: str
     ) -> List[Dict[str, Any]]:
         """为特定题型生成题目"""
-        questions = []
-        
-        for i in range(count):
+        if self.batch_size > 1:
+            questions = []
+            for indices in self._split_batches(count):
+                questions.extend(self._generate_batch(
+                    prompt_template, question_type, indices, count, notes_content, user_preferences
+                ))
+            return questions
+
+        return [
+            self._generate_single_question(
+                prompt_template, question_type, i, count, notes_content, user_preferences
+            )
+            for i in range(count)
+        ]
+
+    def _generate_single_question(
+        self,
+        prompt_template: str,
+        question_type: str,
+        index: int,
+        count: int,
+        notes_content: str,
+        user_preferences: str
+    ) -> Dict[str, Any]:
+        """生成单道题目，失败时返回备用题目"""
+        try:
+            # 构建完整提示词
+            full_prompt = self._build_full_prompt(
+                prompt_template, question_type, notes_content,
+                user_preferences, index, count
+            )
+
+            # 调用API生成题目
+            logger.info(f"开始生成第{index+1}道{question_type}...")
             try:
-                # 构建完整提示词
-                full_prompt = self._build_full_prompt(
-                    prompt_template, question_type, notes_content, 
-                    user_preferences, i, count
-                )
-                
-                # 调用API生成题目
-                logger.info(f"开始生成第{i+1}道{question_type}...")
-                try:
-                    response = self.client.call_api(full_prompt)
-                    logger.info(f"API调用成功，响应长度: {len(response)}")
-                except Exception as api_error:
-                    logger.error(f"API调用失败: {type(api_error).__name__}: {api_error}")
-                    raise api_error
-
-                # 解析响应
-                question_data = self._parse_question_response(response, question_type)
-                
-                if question_data:
-                    questions.append(question_data)
-                else:
-                    # 解析失败，使用备用题目
-                    fallback_question = self._create_fallback_question(question_type, i + 1)
-                    questions.append(fallback_question)
-                    
-            except Exception as e:
-                logger.error(f"生成第{i+1}道{question_type}失败: {e}")
-                # 添加备用题目
-                fallback_question = self._create_fallback_question(question_type, i + 1)
-                questions.append(fallback_question)
-        
-        return questions
+                response = self.client.call_api(full_prompt)
+                logger.info(f"API调用成功，响应长度: {len(response)}")
+            except Exception as api_error:
+                logger.error(f"API调用失败: {type(api_error).__name__}: {api_error}")
+                raise api_error
+
+            return self._parse_or_fallback(response, question_type, index)
+
+        except LLMUnavailableError:
+            # 失败策略为 raise 时不再用备用题目掩盖服务故障
+            raise
+        except Exception as e:
+            logger.error(f"生成第{index+1}道{question_type}失败: {e}")
+            # 添加备用题目
+            return self._create_fallback_question(question_type, index + 1)
+
+    async def _generate_single_question_async(
+        self,
+        prompt_template: str,
+        question_type: str,
+        index: int,
+        count: int,
+        notes_content: str,
+        user_preferences: str
+    ) -> Dict[str, Any]:
+        """异步生成单道题目，失败时返回备用题目"""
+        try:
+            full_prompt = self._build_full_prompt(
+                prompt_template, question_type, notes_content,
+                user_preferences, index, count
+            )
+            response = await self.async_client.call_api(full_prompt)
+            return self._parse_or_fallback(response, question_type, index)
+
+        except LLMUnavailableError:
+            # 失败策略为 raise 时不再用备用题目掩盖服务故障
+            raise
+        except Exception as e:
+            logger.error(f"生成第{index+1}道{question_type}失败: {e}")
+            return self._create_fallback_question(question_type, index + 1)
+
+    def _parse_or_fallback(self, response: str, question_type: str, index: int) -> Dict[str, Any]:
+        """解析响应，解析失败时使用备用题目"""
+        question_data = self._parse_question_response(response, question_type)
+        if question_data:
+            return question_data
+        return self._create_fallback_question(question_type, index + 1)
     
+    def _split_batches(self, count: int) -> List[List[int]]:
+        """按批量大小切分题目序号"""
+        return [
+            list(range(start, min(start + self.batch_size, count)))
+            for start in range(0, count, self.batch_size)
+        ]
+
+    def _generate_batch(
+        self,
+        prompt_template: str,
+        question_type: str,
+        indices: List[int],
+        total_count: int,
+        notes_content: str,
+        user_preferences: str
+    ) -> List[Dict[str, Any]]:
+        """批量生成一组题目，仅对缺失的题目发起一次补充请求"""
+        results = self._request_batch(
+            prompt_template, question_type, indices, total_count, notes_content, user_preferences
+        )
+        missing = [i for i in indices if i not in results]
+        if missing:
+            logger.info(f"批量{question_type}缺少{len(missing)}道，补充请求")
+            results.update(self._request_batch(
+                prompt_template, question_type, missing, total_count, notes_content, user_preferences
+            ))
+        return self._assemble_batch(results, question_type, indices)
+
+    async def _generate_batch_async(
+        self,
+        prompt_template: str,
+        question_type: str,
+        indices: List[int],
+        total_count: int,
+        notes_content: str,
+        user_preferences: str
+    ) -> List[Dict[str, Any]]:
+        """异步批量生成一组题目"""
+        results = await self._request_batch_async(
+            prompt_template, question_type, indices, total_count, notes_content, user_preferences
+        )
+        missing = [i for i in indices if i not in results]
+        if missing:
+            logger.info(f"批量{question_type}缺少{len(missing)}道，补充请求")
+            results.update(await self._request_batch_async(
+                prompt_template, question_type, missing, total_count, notes_content, user_preferences
+            ))
+        return self._assemble_batch(results, question_type, indices)
+
+    def _request_batch(
+        self,
+        prompt_template: str,
+        question_type: str,
+        indices: List[int],
+        total_count: int,
+        notes_content: str,
+        user_preferences: str
+    ) -> Dict[int, Dict[str, Any]]:
+        """发起一次批量请求，返回 {题目序号: 题目}"""
+        prompt = self._build_batch_prompt(
+            prompt_template, question_type, notes_content, user_preferences, indices, total_count
+        )
+        try:
+            logger.info(f"批量生成{len(indices)}道{question_type}...")
+            response = self.client.call_api(prompt, max_tokens=self._batch_max_tokens(indices))
+        except LLMUnavailableError:
+            raise
+        except Exception as e:
+            logger.error(f"批量生成{question_type}失败: {e}")
+            return {}
+        return self._map_batch_results(response, question_type, indices)
+
+    async def _request_batch_async(
+        self,
+        prompt_template: str,
+        question_type: str,
+        indices: List[int],
+        total_count: int,
+        notes_content: str,
+        user_preferences: str
+    ) -> Dict[int, Dict[str, Any]]:
+        """异步发起一次批量请求，返回 {题目序号: 题目}"""
+        prompt = self._build_batch_prompt(
+            prompt_template, question_type, notes_content, user_preferences, indices, total_count
+        )
+        try:
+            response = await self.async_client.call_api(prompt, max_tokens=self._batch_max_tokens(indices))
+        except LLMUnavailableError:
+            raise
+        except Exception as e:
+            logger.error(f"批量生成{question_type}失败: {e}")
+            return {}
+        return self._map_batch_results(response, question_type, indices)
+
+    def _batch_max_tokens(self, indices: List[int]) -> int:
+        return max(4000, 800 * len(indices))
+
+    def _map_batch_results(
+        self,
+        response: str,
+        question_type: str,
+        indices: List[int]
+    ) -> Dict[int, Dict[str, Any]]:
+        parsed = self._parse_batch_response(response, question_type, len(indices))
+        return {indices[slot]: question for slot, question in parsed.items()}
+
+    def _assemble_batch(
+        self,
+        results: Dict[int, Dict[str, Any]],
+        question_type: str,
+        indices: List[int]
+    ) -> List[Dict[str, Any]]:
+        """按序号组装批量结果，仍缺失的题目使用备用题目"""
+        return [
+            results.get(i) or self._create_fallback_question(question_type, i + 1)
+            for i in indices
+        ]
+
+    def _build_batch_prompt(
+        self,
+        template: str,
+        question_type: str,
+        notes_content: str,
+        user_preferences: str,
+        indices: List[int],
+        total_count: int
+    ) -> str:
+        """构建批量出题提示词，每道题对应一个独立的内容片段"""
+        slices = []
+        for slot, index in enumerate(indices, 1):
+            content_section = self._get_diverse_content_section(notes_content, index, total_count)
+            slices.append(f"【片段{slot}】\n{content_section}")
+
+        preference_text = f"\n用户偏好：{user_preferences}" if user_preferences else ""
+        batch_instruction = QUESTION_BATCH_GENERATION_PROMPT.format(
+            count=len(indices), question_type=question_type
+        )
+
+        return f"""{template}
+
+{batch_instruction}
+
+学习笔记内容：
+{chr(10).join(slices)}
+{preference_text}
+"""
+
+    def _parse_batch_response(
+        self,
+        response: str,
+        question_type: str,
+        batch_size: int
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        解析批量响应为 {片段位置: 题目}。
+        逐个解码数组元素，响应被截断时保留已完整的题目。
+        """
+        text = (response or "").strip()
+        fence = re.search(r'```(?:json)?\s*', text)
+        if fence:
+            text = text[fence.end():]
+            text = text.split('```', 1)[0]
+
+        results: Dict[int, Dict[str, Any]] = {}
+        start = text.find('[')
+        brace = text.find('{')
+        if start == -1 or (brace != -1 and brace < start):
+            # 模型只返回了单个对象时，作为第一道题处理
+            match = re.search(r'\{.*\}', text, re.DOTALL)
+            if match:
+                try:
+                    data = json.loads(match.group(0))
+                    if self._is_well_formed_question(data):
+                        results[0] = self._validate_and_normalize_question(data, question_type)
+                except json.JSONDecodeError:
+                    pass
+            return results
+
+        decoder = json.JSONDecoder()
+        pos = start + 1
+        position = 0
+        while pos < len(text):
+            while pos < len(text) and text[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(text) or text[pos] == ']':
+                break
+            try:
+                item, pos = decoder.raw_decode(text, pos)
+            except json.JSONDecodeError:
+                logger.warning(f"批量响应在第{position + 1}个元素处被截断，保留{len(results)}道题目")
+                break
+
+            if self._is_well_formed_question(item):
+                slot = self._resolve_batch_slot(item.get('slice'), position, batch_size, results)
+                if slot is not None:
+                    results[slot] = self._validate_and_normalize_question(item, question_type)
+            position += 1
+
+        return results
+
+    def _is_well_formed_question(self, data: Any) -> bool:
+        return isinstance(data, dict) and bool(data.get('text')) and bool(data.get('answer'))
+
+    def _resolve_batch_slot(
+        self,
+        slice_no: Any,
+        position: int,
+        batch_size: int,
+        taken: Dict[int, Any]
+    ) -> Optional[int]:
+        """优先使用模型返回的片段编号，无效时按出现位置分配空位"""
+        try:
+            slot = int(slice_no) - 1
+            if 0 <= slot < batch_size and slot not in taken:
+                return slot
+        except (TypeError, ValueError):
+            pass
+
+        for slot in [position] + list(range(batch_size)):
+            if 0 <= slot < batch_size and slot not in taken:
+                return slot
+        return None
+
     def _build_full_prompt(
         self,
         template: str,
@@ -366,17 +756,40 @@ class QuestionService:
             return self._generate_simple_summary(questions, question_types)
 
         try:
-            # 构建题目信息
-            questions_info = []
-            for i, question in enumerate(questions, 1):
-                questions_info.append(f"第{i}题（{question.get('type', '未知题型')}）：{question.get('text', '')[:50]}...")
+            prompt = self._build_summary_prompt(questions, question_types)
+            summary = self.client.call_api(prompt, max_tokens=500)
+            return summary
+
+        except Exception as e:
+            logger.error(f"生成题目总结失败: {e}")
+            return self._generate_simple_summary(questions, question_types)
+
+    async def _generate_questions_summary_async(self, questions: List[Dict[str, Any]], question_types: Dict[str, Dict[str, Any]]) -> str:
+        """异步生成题目总结"""
+        if not self.client.is_available():
+            return self._generate_simple_summary(questions, question_types)
+
+        try:
+            prompt = self._build_summary_prompt(questions, question_types)
+            return await self.async_client.call_api(prompt, max_tokens=500)
 
-            # 统计题型分布
-            type_stats = {}
-            for type_key, type_info in question_types.items():
-                type_stats[type_info['name']] = type_info['count']
+        except Exception as e:
+            logger.error(f"生成题目总结失败: {e}")
+            return self._generate_simple_summary(questions, question_types)
+
+    def _build_summary_prompt(self, questions: List[Dict[str, Any]], question_types: Dict[str, Dict[str, Any]]) -> str:
+        """构建题目总结提示词"""
+        # 构建题目信息
+        questions_info = []
+        for i, question in enumerate(questions, 1):
+            questions_info.append(f"第{i}题（{question.get('type', '未知题型')}）：{question.get('text', '')[:50]}...")
+
+        # 统计题型分布
+        type_stats = {}
+        for type_key, type_info in question_types.items():
+            type_stats[type_info['name']] = type_info['count']
 
-            prompt = f"""请为以下生成的题目集合写一段简明扼要的介绍，包括：
+        return f"""请为以下生成的题目集合写一段简明扼要的介绍，包括：
 1. 题目数量和题型分布
 2. 涵盖的主要知识点
 3. 学习建议
@@ -389,13 +802,6 @@ class QuestionService:
 
 请用简洁友好的语言，为学习者提供有用的指导。"""
 
-            summary = self.client.call_api(prompt, max_tokens=500)
-            return summary
-
-        except Exception as e:
-            logger.error(f"生成题目总结失败: {e}")
-            return self._generate_simple_summary(questions, question_types)
-
     def _generate_simple_summary(self, questions: List[Dict[str, Any]], question_types: Dict[str, Dict[str, Any]]) -> str:
         """生成简单的题目总结"""
         total_count = len(questions)
@@ -0,0 +1,268 @@
+"""
+LLM调用的容错层
+
+- 错误分类：只有超时、连接错误、429和5xx等暂时性错误才重试
+- 指数退避 + 随机抖动，避免所有请求在同一时刻重试
+- 按端点（base_url）的熔断器：连续失败达到阈值后熔断，
+  熔断期间直接快速失败，冷却后放行少量半开探测请求
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from .api_config import api_config
+
+logger = logging.getLogger(__name__)
+
+# 失败策略：mock 返回模拟响应，raise 抛出 LLMUnavailableError
+FAILURE_POLICY_MOCK = 'mock'
+FAILURE_POLICY_RAISE = 'raise'
+
+_RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+_RETRYABLE_ERROR_NAMES = (
+    'APITimeoutError', 'APIConnectionError', 'RateLimitError', 'InternalServerError',
+    'ConnectError', 'ReadTimeout', 'ConnectTimeout', 'RemoteProtocolError',
+    'TimeoutError', 'ConnectionError', 'ConnectionResetError',
+)
+
+
+class LLMUnavailableError(Exception):
+    """LLM服务不可用（失败策略为 raise 时抛出）"""
+    pass
+
+
+class CircuitOpenError(LLMUnavailableError):
+    """熔断器处于打开状态，请求被快速拒绝"""
+    pass
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """判断错误是否为可重试的暂时性错误"""
+    status_code = getattr(error, 'status_code', None)
+    if status_code is not None:
+        return status_code in _RETRYABLE_STATUS_CODES
+
+    if isinstance(error, (TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+
+    error_name = type(error).__name__
+    if error_name in _RETRYABLE_ERROR_NAMES:
+        return True
+
+    error_msg = str(error).lower()
+    return 'timeout' in error_msg or 'timed out' in error_msg or 'connection' in error_msg
+
+
+class CircuitBreaker:
+    """单个端点的熔断器（closed -> open -> half_open -> closed）"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._stats = {'successes': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        """返回当前状态，冷却时间到后转为半开（调用方持有锁）"""
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+            logger.info(f"熔断器[{self.name}]进入半开状态，放行探测请求")
+        return self._state
+
+    def allow_request(self) -> bool:
+        """是否放行请求；半开状态下只放行有限数量的探测请求"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+            self._stats['rejected'] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._stats['successes'] += 1
+            if self._state != self.CLOSED:
+                logger.info(f"熔断器[{self.name}]探测成功，恢复闭合")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._half_open_calls = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._stats['failures'] += 1
+            state = self._current_state()
+            self._failures += 1
+            if state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if state != self.OPEN:
+                    self._stats['opened'] += 1
+                    logger.warning(
+                        f"熔断器[{self.name}]打开: 连续失败{self._failures}次，"
+                        f"{self.recovery_timeout}秒内快速失败"
+                    )
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+                self._half_open_calls = 0
+
+    def reset(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._half_open_calls = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                'name': self.name,
+                'state': self._current_state(),
+                'consecutive_failures': self._failures
+            }
+
+
+class ResilienceManager:
+    """管理各端点的熔断器，并提供带重试的同步/异步调用"""
+
+    def __init__(
+        self,
+        max_retries: int = 2,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        failure_policy: str = FAILURE_POLICY_MOCK
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.failure_policy = failure_policy
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get_breaker(self, endpoint: str) -> CircuitBreaker:
+        """获取端点对应的熔断器"""
+        key = (endpoint or "").rstrip("/")
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    key,
+                    failure_threshold=self.failure_threshold,
+                    recovery_timeout=self.recovery_timeout
+                )
+                self._breakers[key] = breaker
+            return breaker
+
+    def backoff_delay(self, attempt: int) -> float:
+        """第 attempt 次重试前的等待时间（指数退避 + 全抖动）"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def should_fallback_to_mock(self) -> bool:
+        return self.failure_policy != FAILURE_POLICY_RAISE
+
+    def _before_attempt(self, breaker: CircuitBreaker):
+        if not breaker.allow_request():
+            raise CircuitOpenError(f"LLM服务熔断中，暂停请求: {breaker.name}")
+
+    def _after_failure(self, breaker: CircuitBreaker, error: Exception, attempt: int) -> bool:
+        """记录失败，返回是否需要重试"""
+        retryable = is_retryable_error(error)
+        if retryable:
+            breaker.record_failure()
+        else:
+            # 参数错误等说明端点可达，不计入熔断（同时释放半开探测名额）
+            breaker.record_success()
+        logger.warning(
+            f"LLM调用失败(第{attempt + 1}次): {type(error).__name__}: {error}，"
+            f"{'可重试' if retryable else '不可重试'}"
+        )
+        return retryable and attempt < self.max_retries
+
+    def call(self, func: Callable[[], Any], endpoint: str) -> Any:
+        """同步调用 func，按策略重试并记录熔断状态"""
+        breaker = self.get_breaker(endpoint)
+        attempt = 0
+        while True:
+            self._before_attempt(breaker)
+            try:
+                result = func()
+            except Exception as e:
+                if not self._after_failure(breaker, e, attempt):
+                    raise
+                delay = self.backoff_delay(attempt)
+                logger.info(f"{delay:.2f}秒后重试")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            breaker.record_success()
+            return result
+
+    async def acall(self, func: Callable[[], Awaitable[Any]], endpoint: str) -> Any:
+        """异步版本的 call"""
+        breaker = self.get_breaker(endpoint)
+        attempt = 0
+        while True:
+            self._before_attempt(breaker)
+            try:
+                result = await func()
+            except Exception as e:
+                if not self._after_failure(breaker, e, attempt):
+                    raise
+                delay = self.backoff_delay(attempt)
+                logger.info(f"{delay:.2f}秒后重试")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            breaker.record_success()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {
+            'failure_policy': self.failure_policy,
+            'max_retries': self.max_retries,
+            'breakers': [breaker.stats() for breaker in breakers]
+        }
+
+
+# 全局容错管理器
+resilience = ResilienceManager(
+    max_retries=api_config.max_retries,
+    base_delay=api_config.retry_base_delay,
+    max_delay=api_config.retry_max_delay,
+    failure_threshold=api_config.breaker_failure_threshold,
+    recovery_timeout=api_config.breaker_recovery_timeout,
+    failure_policy=api_config.failure_policy
+)
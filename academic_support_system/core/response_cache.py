@@ -0,0 +1,216 @@
+"""
+LLM响应缓存
+
+以 (模型, 消息列表哈希, temperature, max_tokens) 为键缓存模型回复：
+- 内存层：LRU，命中耗时为微秒级
+- 磁盘层：SQLite，按条目数上限和TTL淘汰，进程重启后仍然有效
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from .api_config import api_config
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(
+    model: str,
+    messages: List[Dict[str, Any]],
+    temperature: float,
+    max_tokens: Optional[int]
+) -> str:
+    """根据请求参数生成内容寻址的缓存键"""
+    messages_hash = hashlib.sha256(
+        json.dumps(messages, ensure_ascii=False, sort_keys=True).encode('utf-8')
+    ).hexdigest()
+    raw_key = json.dumps([model, messages_hash, temperature, max_tokens])
+    return hashlib.sha256(raw_key.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """两级（内存LRU + SQLite）响应缓存"""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        memory_size: int = 256,
+        db_path: Optional[str] = None,
+        max_entries: int = 5000,
+        ttl: float = 7 * 24 * 3600
+    ):
+        self.enabled = enabled
+        self.memory_size = memory_size
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._stats = {
+            'hits': 0,
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0
+        }
+
+    def _get_conn(self) -> Optional[sqlite3.Connection]:
+        """懒加载SQLite连接，失败时降级为纯内存缓存"""
+        if not self.db_path:
+            return None
+        if self._conn is None:
+            try:
+                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+                self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                    "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                self._conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)"
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"响应缓存数据库不可用，仅使用内存缓存: {e}")
+                self.db_path = None
+                self._conn = None
+        return self._conn
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return bool(self.ttl) and now - created_at > self.ttl
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，未命中返回None"""
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if not self._is_expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    self._stats['hits'] += 1
+                    self._stats['memory_hits'] += 1
+                    return value
+                del self._memory[key]
+
+            conn = self._get_conn()
+            if conn is not None:
+                try:
+                    row = conn.execute(
+                        "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row is not None:
+                        value, created_at = row
+                        if not self._is_expired(created_at, now):
+                            conn.execute(
+                                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+                            )
+                            conn.commit()
+                            self._remember(key, value, created_at)
+                            self._stats['hits'] += 1
+                            self._stats['disk_hits'] += 1
+                            return value
+                        conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                        conn.commit()
+                        self._stats['evictions'] += 1
+                except sqlite3.Error as e:
+                    logger.warning(f"读取响应缓存失败: {e}")
+
+            self._stats['misses'] += 1
+            return None
+
+    def set(self, key: str, value: str):
+        """写入缓存，空响应不缓存"""
+        if not self.enabled or not value:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            self._stats['stores'] += 1
+
+            conn = self._get_conn()
+            if conn is None:
+                return
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, value, now, now)
+                )
+                self._evict_disk(conn, now)
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"写入响应缓存失败: {e}")
+
+    def _remember(self, key: str, value: str, created_at: float):
+        """写入内存LRU层（调用方持有锁）"""
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def _evict_disk(self, conn: sqlite3.Connection, now: float):
+        """按TTL和条目数上限淘汰磁盘层（调用方持有锁）"""
+        if self.ttl:
+            cursor = conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self.ttl,)
+            )
+            self._stats['evictions'] += max(cursor.rowcount, 0)
+
+        count = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            cursor = conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,)
+            )
+            self._stats['evictions'] += max(cursor.rowcount, 0)
+
+    def clear(self):
+        """清空两级缓存"""
+        with self._lock:
+            self._memory.clear()
+            conn = self._get_conn()
+            if conn is not None:
+                try:
+                    conn.execute("DELETE FROM responses")
+                    conn.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"清空响应缓存失败: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中/未命中等计数"""
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'enabled': self.enabled,
+                'memory_entries': len(self._memory),
+                'hit_rate': round(self._stats['hits'] / lookups, 4) if lookups else 0.0
+            }
+
+
+# 全局缓存实例
+response_cache = ResponseCache(
+    enabled=api_config.cache_enabled,
+    memory_size=api_config.cache_memory_size,
+    db_path=api_config.cache_path,
+    max_entries=api_config.cache_max_entries,
+    ttl=api_config.cache_ttl
+)
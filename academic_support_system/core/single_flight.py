@@ -0,0 +1,127 @@
+"""
+相同请求合并（single-flight）
+
+同一时刻多个调用方发起完全相同的LLM请求时，只有第一个（leader）真正调用上游，
+其余调用方等待并共享同一结果（或同一异常）。请求完成后立即移除，不承担缓存职责。
+线程与 asyncio 两条路径分别维护在途请求表。
+"""
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """线程路径下的一次在途调用"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """按请求键合并并发的相同调用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        # 事件循环 -> {key: Future}，Future 绑定事件循环
+        self._async_calls: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self._stats = {'calls': 0, 'executed': 0, 'coalesced': 0}
+
+    def do(self, key: str, func: Callable[[], Any]) -> Any:
+        """执行 func；若相同 key 的调用正在进行，则等待并复用其结果"""
+        with self._lock:
+            self._stats['calls'] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                self._stats['coalesced'] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._stats['executed'] += 1
+                leader = True
+
+        if not leader:
+            logger.info(f"合并相同的在途请求: {key[:12]}")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    async def ado(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """异步版本的 do，只在同一事件循环内合并"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._stats['calls'] += 1
+            loop_calls = self._async_calls.setdefault(loop, {})
+            future = loop_calls.get(key)
+            if future is not None:
+                self._stats['coalesced'] += 1
+                leader = False
+            else:
+                future = loop.create_future()
+                loop_calls[key] = future
+                self._stats['executed'] += 1
+                leader = True
+
+        if not leader:
+            logger.info(f"合并相同的在途请求: {key[:12]}")
+            try:
+                # shield: 当前调用方被取消时不影响 leader
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if future.cancelled():
+                    # leader 被取消而当前调用方仍需结果，自行重新发起
+                    return await self.ado(key, func)
+                raise
+
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                loop_calls = self._async_calls.get(loop)
+                if loop_calls is not None and loop_calls.get(key) is future:
+                    del loop_calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """返回调用总数、实际执行数与被合并数"""
+        with self._lock:
+            in_flight = len(self._calls) + sum(len(calls) for calls in self._async_calls.values())
+            calls = self._stats['calls']
+            return {
+                **self._stats,
+                'in_flight': in_flight,
+                'coalesce_rate': round(self._stats['coalesced'] / calls, 4) if calls else 0.0
+            }
+
+
+# 全局实例，同步与异步客户端共享统计
+single_flight = SingleFlight()
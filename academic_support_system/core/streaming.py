@@ -0,0 +1,254 @@
+"""
+Server-Sent Events 工具
+
+统一SSE帧格式和响应头，并把 UnifiedAPIClient.stream_chat 的事件转换为前端使用的帧：
+start -> content(增量) -> complete(含完整文本) / error
+
+模型每次只返回几个token，逐个增量成帧、逐个 write+flush 会产生大量帧和系统调用：
+coalesce_deltas 把相邻的 content 增量按时间/字节阈值合并，BufferedTextWriter 按阈值批量落盘。
+
+客户端断开后，WSGI服务器在下一次写入失败时关闭响应迭代器（生成器收到 GeneratorExit），
+各接口按 DISCONNECT_CANCEL / DISCONNECT_DETACH 策略取消或转入后台继续上游生成；保活帧间隔决定发现断开的最长延迟。
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from django.http import StreamingHttpResponse
+
+from .api_config import api_config
+
+logger = logging.getLogger(__name__)
+
+# 客户端断开时的处理策略：取消上游生成，或转入后台继续完成
+DISCONNECT_CANCEL = 'cancel'
+DISCONNECT_DETACH = 'detach'
+
+
+def sse_event(payload: Dict[str, Any], event_id: str = None) -> str:
+    """格式化一个SSE数据帧；带 event_id 时客户端重连会通过 Last-Event-ID 回传"""
+    frame = "data: " + json.dumps(payload, ensure_ascii=False) + "\n\n"
+    if event_id is not None:
+        frame = f"id: {event_id}\n" + frame
+    return frame
+
+
+def coalesce_deltas(
+    events: Iterable[Dict[str, Any]],
+    interval: float = 0.1,
+    max_bytes: int = 4096,
+    clock: Callable[[], float] = time.monotonic
+) -> Iterator[Dict[str, Any]]:
+    """
+    合并相邻的 {'type': 'content'} 事件：距上次产出超过 interval 秒或累计超过 max_bytes 字节时产出一帧。
+    其他类型的事件先冲刷已累积的内容再原样产出，结束时冲刷剩余内容，保证顺序和文本不变。
+    interval 为0时不合并。
+    """
+    parts: List[str] = []
+    size = 0
+    last_emit = clock()
+    for event in events:
+        if event.get('type') != 'content':
+            if parts:
+                yield {'type': 'content', 'content': ''.join(parts)}
+                parts, size = [], 0
+            last_emit = clock()
+            yield event
+            continue
+
+        parts.append(event['content'])
+        size += len(event['content'].encode('utf-8'))
+        now = clock()
+        if interval <= 0 or size >= max_bytes or now - last_emit >= interval:
+            yield {'type': 'content', 'content': ''.join(parts)}
+            parts, size = [], 0
+            last_emit = now
+    if parts:
+        yield {'type': 'content', 'content': ''.join(parts)}
+
+
+class BufferedTextWriter:
+    """按时间或大小阈值批量写入文本文件，close() 时写入剩余内容；mode='a' 时追加到已有内容之后"""
+
+    def __init__(self, path, flush_interval: float = 1.0, flush_bytes: int = 64 * 1024,
+                 clock: Callable[[], float] = time.monotonic, mode: str = 'w'):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.clock = clock
+        self.flushes = 0
+        self._file = open(path, mode, encoding='utf-8')
+        self._parts: List[str] = []
+        self._size = 0
+        self._last_flush = clock()
+
+    def write(self, text: str):
+        self._parts.append(text)
+        self._size += len(text.encode('utf-8'))
+        if self._size >= self.flush_bytes or self.clock() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._parts:
+            self._file.write(''.join(self._parts))
+            self._parts, self._size = [], 0
+            self._file.flush()
+            self.flushes += 1
+        self._last_flush = self.clock()
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def sse_response(frames: Iterable[str]) -> StreamingHttpResponse:
+    """构建禁用缓冲的SSE流式响应"""
+    response = StreamingHttpResponse(frames, content_type='text/event-stream; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    # WSGI不允许设置Connection等hop-by-hop头部
+    response['X-Accel-Buffering'] = 'no'  # 禁用nginx缓冲
+    return response
+
+
+def stream_chat_events(
+    messages: List[Dict[str, Any]],
+    prefix: str = "",
+    on_complete: Optional[Callable[[str], Dict[str, Any]]] = None,
+    disconnect_policy: str = None,
+    **kwargs
+) -> Iterator[str]:
+    """
+    调用统一客户端流式生成，并逐帧产出SSE数据。
+
+    prefix: 在模型输出前先推送的固定文本（计入完整回复）
+    on_complete: 生成结束后以完整文本调用，返回值合并进 complete 帧
+    disconnect_policy: 客户端断开时的处理（默认取配置 CHAT_DISCONNECT_POLICY）；
+        断开在下一次写入帧时才被发现，模型长时间没有输出时可能延迟处理
+        cancel 关闭上游模型流，不再消耗token；
+        detach 交给有界的后台线程池读完上游并执行 on_complete（如把改写结果写回笔记），线程池已满时按 cancel 处理
+    """
+    from .unified_api_client import unified_client
+
+    policy = disconnect_policy or api_config.chat_disconnect_policy
+    parts = [prefix] if prefix else []
+    stream = None
+    try:
+        yield sse_event({'type': 'start', 'message': '正在生成回复...'})
+        if prefix:
+            yield sse_event({'type': 'content', 'content': prefix})
+
+        usage = None
+        finish_reason = None
+        try:
+            stream = unified_client.stream_chat(messages, **kwargs)
+            for event in stream:
+                if event['type'] == 'content':
+                    parts.append(event['content'])
+                    yield sse_event({'type': 'content', 'content': event['content']})
+                elif event['type'] == 'usage':
+                    usage = {key: value for key, value in event.items() if key != 'type'}
+                elif event['type'] == 'finish':
+                    finish_reason = event['finish_reason']
+            stream = None
+
+            full_text = "".join(parts)
+            complete = {
+                'type': 'complete',
+                'response': full_text,
+                'finish_reason': finish_reason,
+                'usage': usage
+            }
+            if on_complete:
+                complete.update(on_complete(full_text) or {})
+            yield sse_event(complete)
+
+        except Exception as e:
+            stream = None
+            logger.error(f"流式生成失败: {type(e).__name__}: {e}")
+            yield sse_event({'type': 'error', 'message': f'生成回复时出错：{str(e)}'})
+
+    except GeneratorExit:
+        # 服务器在写入失败（客户端已断开）时关闭响应迭代器，立即释放当前工作线程
+        if stream is not None:
+            if policy == DISCONNECT_DETACH and detached_streams.submit(stream, parts, on_complete):
+                logger.info("客户端已断开，后台继续完成生成")
+            else:
+                logger.info("客户端已断开，取消上游生成")
+                stream.close()
+        raise
+
+
+class DetachedStreamPool:
+    """
+    客户端断开后在后台读完上游流的有界线程池（DISCONNECT_DETACH 策略）。
+    上游流是进程内的连接，无法交给持久化任务队列；同时进行的后台读取超过 max_pending 时不再接收，
+    由调用方改为取消上游生成。进程重启时进行中的后台读取随之丢失。
+    """
+
+    def __init__(self, max_workers: int = 4, max_pending: int = 16):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self._stats = {'detached': 0, 'completed': 0, 'failed': 0, 'rejected': 0}
+
+    def submit(self, stream: Iterator[Dict[str, Any]], parts: List[str],
+               on_complete: Optional[Callable[[str], Dict[str, Any]]] = None) -> bool:
+        """交给后台读完上游流并以完整文本调用 on_complete；已满时返回False"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._stats['rejected'] += 1
+                return False
+            self._pending += 1
+            self._stats['detached'] += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='sse-detached')
+            executor = self._executor
+        executor.submit(self._drain, stream, parts, on_complete)
+        return True
+
+    def _drain(self, stream: Iterator[Dict[str, Any]], parts: List[str],
+               on_complete: Optional[Callable[[str], Dict[str, Any]]]):
+        result = 'failed'
+        try:
+            for event in stream:
+                if event['type'] == 'content':
+                    parts.append(event['content'])
+            if on_complete:
+                on_complete("".join(parts))
+            result = 'completed'
+            logger.info(f"断开后的后台生成已完成，共{len(''.join(parts))}字")
+        except Exception as e:
+            logger.error(f"断开后的后台生成失败: {type(e).__name__}: {e}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._stats[result] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'pending': self._pending, 'max_pending': self.max_pending, **self._stats}
+
+
+# 全局后台读取线程池
+detached_streams = DetachedStreamPool(
+    max_workers=api_config.sse_detach_workers,
+    max_pending=api_config.sse_detach_max_pending
+)
+
+
+def single_reply_events(text: str, **extra) -> Iterator[str]:
+    """把一次性生成的完整回复包装成与流式接口一致的帧序列"""
+    yield sse_event({'type': 'content', 'content': text})
+    yield sse_event({'type': 'complete', 'response': text, **extra})
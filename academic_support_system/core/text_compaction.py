@@ -0,0 +1,227 @@
+"""
+提示词前的文本压缩
+
+课件和PDF的每一页都重复页眉、页脚、课程名和页码，解析后全部进入提示词，每次笔记、出题都要为它们付费。
+本模块在组装提示词之前按页处理文本：
+- 规范化：全角字母数字和全角空格转为半角，合并多余空白（中文标点保持不变）
+- 跨页重复行：在足够多页中出现的短行（数字视为同一模式，覆盖页码）视为页眉页脚删除；
+  只在开头的 sample_pages 页上统计，其余页逐页流式处理，内存不随文档页数增长
+- 近重复段落：按字符 shingle 计算 MinHash，LSH 分桶后估计相似度，删除与前文高度相似的段落
+并统计压缩前后的token数。
+"""
+import logging
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from .token_budget import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 全角字母数字 -> 半角；全角空格 -> 半角空格
+_FULLWIDTH_TABLE = {code: code - 0xFEE0 for code in range(0xFF10, 0xFF1A)}
+_FULLWIDTH_TABLE.update({code: code - 0xFEE0 for code in range(0xFF21, 0xFF3B)})
+_FULLWIDTH_TABLE.update({code: code - 0xFEE0 for code in range(0xFF41, 0xFF5B)})
+_FULLWIDTH_TABLE[0x3000] = 0x20
+
+_SPACES = re.compile(r'[ \t\u00a0]+')
+_DIGITS = re.compile(r'\d+')
+
+
+def normalize_text(text: str) -> str:
+    """全角字母数字转半角，行内连续空白合并为一个空格，去掉行首尾空白和多余空行"""
+    lines = [_SPACES.sub(' ', line).strip() for line in text.translate(_FULLWIDTH_TABLE).split('\n')]
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
+
+
+def _line_pattern(line: str) -> str:
+    """重复行的匹配模式：数字统一替换，使"第3页""3 / 20"等页码行归为同一模式"""
+    return _DIGITS.sub('#', line.lower())
+
+
+@dataclass
+class CompactionReport:
+    """一份文档的压缩统计"""
+    tokens_before: int = 0
+    tokens_after: int = 0
+    boilerplate_lines: int = 0
+    duplicate_paragraphs: int = 0
+    boilerplate_samples: List[str] = field(default_factory=list)
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            'tokens_before': self.tokens_before,
+            'tokens_after': self.tokens_after,
+            'tokens_saved': self.tokens_saved,
+            'boilerplate_lines': self.boilerplate_lines,
+            'duplicate_paragraphs': self.duplicate_paragraphs,
+            'boilerplate_samples': self.boilerplate_samples,
+        }
+
+
+class MinHasher:
+    """
+    字符 shingle 的 MinHash 签名。
+    使用单次哈希分桶（one permutation hashing）：每个 shingle 只哈希一次，按哈希值分到 num_perm 个桶中取最小值，
+    代价与段落长度成线性，不随签名长度增加。签名只在同一进程内比较，可以直接使用内置 hash。
+    """
+
+    _EMPTY = 1 << 64
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 5):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+
+    def shingles(self, text: str) -> set:
+        text = re.sub(r'\s+', '', text)
+        if len(text) <= self.shingle_size:
+            return {text}
+        return {text[i:i + self.shingle_size] for i in range(len(text) - self.shingle_size + 1)}
+
+    def signature(self, shingles: set) -> Tuple[int, ...]:
+        bins = [self._EMPTY] * self.num_perm
+        for shingle in shingles:
+            value = hash(shingle) & 0xFFFFFFFFFFFFFFFF
+            index = value % self.num_perm
+            if value < bins[index]:
+                bins[index] = value
+        return tuple(bins)
+
+    @staticmethod
+    def similarity(left: Sequence[int], right: Sequence[int]) -> float:
+        """两个签名相同位置相等的比例，即 Jaccard 相似度的估计"""
+        return sum(1 for a, b in zip(left, right) if a == b) / len(left)
+
+
+class TextCompactor:
+    """按页去除页眉页脚等重复行和近重复段落"""
+
+    def __init__(
+        self,
+        repeat_ratio: float = 0.5,
+        min_repeat_pages: int = 3,
+        max_line_length: int = 80,
+        near_duplicate_threshold: float = 0.8,
+        min_paragraph_chars: int = 40,
+        num_perm: int = 64,
+        bands: int = 16,
+        sample_pages: int = 30
+    ):
+        self.repeat_ratio = repeat_ratio
+        self.min_repeat_pages = min_repeat_pages
+        self.max_line_length = max_line_length
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.min_paragraph_chars = min_paragraph_chars
+        self.bands = bands
+        self.sample_pages = sample_pages
+        self.hasher = MinHasher(num_perm=num_perm)
+
+    def compact_pages(self, pages: List[Tuple[str, List[str]]]) -> Tuple[List[Tuple[str, List[str]]], CompactionReport]:
+        """
+        pages: [(页码, [该页的文本段落, ...]), ...]
+        返回压缩后的页列表（结构不变，段落可能被删除）和统计
+        """
+        report = CompactionReport()
+        return list(self.iter_compact(pages, report)), report
+
+    def iter_compact(self, pages: Iterable[tuple], report: CompactionReport) -> Iterator[tuple]:
+        """
+        逐页压缩：pages 的每项为 (页码, [文本段落, ...], ...)，页码和文本之后的字段原样保留。
+        只缓存开头 sample_pages 页用于识别页眉页脚，统计随产出累加到 report 中。
+        """
+        pages = iter(pages)
+        sample = [self._normalize_page(entry) for entry in islice(pages, self.sample_pages)]
+        boilerplate = self._find_boilerplate([(entry[0], entry[2]) for entry in sample])
+        report.boilerplate_samples = sorted(boilerplate)[:5]
+
+        buckets: Dict[Tuple[int, Tuple[int, ...]], List[Tuple[int, ...]]] = {}
+        for entry in sample:
+            yield self._compact_page(entry, boilerplate, buckets, report)
+        for entry in pages:
+            yield self._compact_page(self._normalize_page(entry), boilerplate, buckets, report)
+
+    @staticmethod
+    def _normalize_page(entry: tuple) -> tuple:
+        page, texts, *rest = entry
+        return (page, texts, [normalize_text(text) for text in texts], *rest)
+
+    def _compact_page(self, entry: tuple, boilerplate: set,
+                      buckets: Dict[Tuple[int, Tuple[int, ...]], List[Tuple[int, ...]]],
+                      report: CompactionReport) -> tuple:
+        """压缩一页（entry 为规范化后的 (页码, 原文段落, 规范化段落, ...)），返回 (页码, 保留的段落, ...)"""
+        page, original, texts, *rest = entry
+        report.tokens_before += sum(estimate_tokens(text) for text in original)
+        stripped, removed = self._strip_boilerplate(texts, boilerplate)
+        if not stripped:
+            # 整页都是重复行（或页码规律相同的正文）时保留原文，避免误删整页内容
+            stripped, removed = [text for text in texts if text], 0
+        report.boilerplate_lines += removed
+
+        kept_texts = []
+        for text in stripped:
+            # 段落以空行分隔，逐段判断近重复
+            paragraphs = []
+            for paragraph in text.split('\n\n'):
+                if len(paragraph) >= self.min_paragraph_chars and self._is_near_duplicate(paragraph, buckets):
+                    report.duplicate_paragraphs += 1
+                    continue
+                paragraphs.append(paragraph)
+            if paragraphs:
+                kept_texts.append('\n\n'.join(paragraphs))
+        report.tokens_after += sum(estimate_tokens(text) for text in kept_texts)
+        return (page, kept_texts, *rest)
+
+    def _strip_boilerplate(self, texts: List[str], boilerplate: set) -> Tuple[List[str], int]:
+        """删除一页中的重复行，返回剩余的非空段落和删除的行数"""
+        result, removed = [], 0
+        for text in texts:
+            lines = []
+            for line in text.split('\n'):
+                if line and len(line) <= self.max_line_length and _line_pattern(line) in boilerplate:
+                    removed += 1
+                    continue
+                lines.append(line)
+            text = '\n'.join(lines).strip()
+            if text:
+                result.append(text)
+        return result, removed
+
+    def _find_boilerplate(self, pages: List[Tuple[str, List[str]]]) -> set:
+        """在足够多页中出现的短行模式"""
+        page_count = len(pages)
+        min_pages = max(self.min_repeat_pages, int(page_count * self.repeat_ratio + 0.999))
+        if page_count < min_pages:
+            return set()
+        counts: Counter = Counter()
+        for _, texts in pages:
+            patterns = {
+                _line_pattern(line)
+                for text in texts for line in text.split('\n')
+                if line and len(line) <= self.max_line_length
+            }
+            counts.update(patterns)
+        return {pattern for pattern, count in counts.items() if count >= min_pages}
+
+    def _is_near_duplicate(self, text: str, buckets: Dict[Tuple[int, Tuple[int, ...]], List[Tuple[int, ...]]]) -> bool:
+        """与已保留段落的估计相似度达到阈值时返回True，否则登记到LSH桶中"""
+        shingles = self.hasher.shingles(text)
+        if len(shingles) < self.min_paragraph_chars // 2:
+            # 不同 shingle 太少（如同一短句反复出现）时签名估计不可靠，不参与判断
+            return False
+        signature = self.hasher.signature(shingles)
+        rows = len(signature) // self.bands
+        keys = [(band, signature[band * rows:(band + 1) * rows]) for band in range(self.bands)]
+        for key in keys:
+            for other in buckets.get(key, ()):
+                if MinHasher.similarity(signature, other) >= self.near_duplicate_threshold:
+                    return True
+        for key in keys:
+            buckets.setdefault(key, []).append(signature)
+        return False
+
@@ -0,0 +1,181 @@
+"""
+Token预算估算
+
+本地估算中英文混合文本的token数，并根据模型上下文窗口约束 max_tokens，
+在请求发出前拒绝或裁剪超长提示词，避免长时间等待后才被服务端拒绝。
+"""
+import logging
+import math
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .api_config import api_config
+
+logger = logging.getLogger(__name__)
+
+# 模型上下文窗口: (最大上下文token数, 最大输出token数)
+MODEL_CONTEXT_WINDOWS: Dict[str, Tuple[int, int]] = {
+    'gemini-2.5-pro': (1048576, 65536),
+    'gemini-2.5-flash': (1048576, 65536),
+    'gemini-2.0-flash': (1048576, 8192),
+    'gemini-1.5-pro': (2097152, 8192),
+    'gemini-1.5-flash': (1048576, 8192),
+    'gpt-4o': (128000, 16384),
+    'gpt-4o-mini': (128000, 16384),
+    'deepseek-chat': (65536, 8192),
+}
+DEFAULT_CONTEXT_WINDOW = (128000, 8192)
+
+# 每条消息的格式开销与每张图片的估算开销
+MESSAGE_OVERHEAD_TOKENS = 4
+IMAGE_TOKENS = 258
+# 为估算误差预留的安全余量
+SAFETY_MARGIN_RATIO = 0.05
+
+_TOKEN_PATTERN = re.compile(
+    r'[\u3400-\u9fff\uf900-\ufaff]'  # 中日韩统一表意文字：约1字1token
+    r'|[\u3000-\u303f\uff00-\uffef]'  # 全角标点与全角字符
+    r'|[A-Za-z]+'                      # 英文单词
+    r'|\d+'                            # 数字串
+    r'|[^\sA-Za-z\d]'                  # 其他符号
+)
+
+
+class PromptTooLargeError(ValueError):
+    """提示词超出模型上下文窗口"""
+    pass
+
+
+def _piece_tokens(piece: str) -> int:
+    if piece.isascii() and piece.isalpha():
+        # 常见BPE词表中英文约4个字符一个token
+        return max(1, math.ceil(len(piece) / 4))
+    if piece.isdigit():
+        return max(1, math.ceil(len(piece) / 3))
+    return 1
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的token数（中文按字、英文按词片段计）"""
+    if not text:
+        return 0
+    return sum(_piece_tokens(match.group(0)) for match in _TOKEN_PATTERN.finditer(text))
+
+
+def estimate_messages_tokens(messages: Iterable[Dict[str, Any]]) -> int:
+    """估算OpenAI格式消息列表的token数（支持多模态content列表）"""
+    total = 0
+    for message in messages:
+        total += MESSAGE_OVERHEAD_TOKENS
+        content = message.get('content')
+        if isinstance(content, str):
+            total += estimate_tokens(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get('type') == 'text':
+                    total += estimate_tokens(part.get('text', ''))
+                elif part.get('type') == 'image_url':
+                    total += IMAGE_TOKENS
+    return total
+
+
+def get_context_window(model: Optional[str]) -> Tuple[int, int]:
+    """获取模型的 (上下文窗口, 最大输出)，支持通过配置覆盖"""
+    context, max_output = DEFAULT_CONTEXT_WINDOW
+    if model:
+        name = model.lower()
+        for prefix, window in sorted(MODEL_CONTEXT_WINDOWS.items(), key=lambda item: -len(item[0])):
+            if name.startswith(prefix):
+                context, max_output = window
+                break
+
+    return (
+        api_config.context_window or context,
+        api_config.max_output_tokens or max_output
+    )
+
+
+def plan_max_tokens(
+    prompt_tokens: int,
+    requested: Optional[int],
+    model: Optional[str],
+    min_output_tokens: int = 256
+) -> int:
+    """
+    根据提示词大小计算实际可用的 max_tokens。
+    剩余空间不足 min_output_tokens 时抛出 PromptTooLargeError。
+    """
+    context, max_output = get_context_window(model)
+    available = int(context * (1 - SAFETY_MARGIN_RATIO)) - prompt_tokens
+    if available < min_output_tokens:
+        raise PromptTooLargeError(
+            f"提示词约{prompt_tokens}个token，超出模型{model}的上下文窗口({context})"
+        )
+
+    limit = min(max_output, available)
+    if requested is None:
+        return limit
+    return max(1, min(requested, limit))
+
+
+def budget_for_prompt(model: Optional[str], reserve_output_tokens: Optional[int] = None) -> int:
+    """计算提示词最多可占用的token数（预留输出空间后）"""
+    context, max_output = get_context_window(model)
+    reserve = reserve_output_tokens if reserve_output_tokens is not None else max_output
+    return max(0, int(context * (1 - SAFETY_MARGIN_RATIO)) - min(reserve, max_output))
+
+
+def plan_request(
+    messages: List[Dict[str, Any]],
+    requested_max_tokens: Optional[int],
+    model: Optional[str],
+    label: str = "API"
+) -> int:
+    """估算请求大小、约束 max_tokens 并记录日志"""
+    prompt_tokens = estimate_messages_tokens(messages)
+    max_tokens = plan_max_tokens(prompt_tokens, requested_max_tokens, model)
+    context, _ = get_context_window(model)
+    logger.info(
+        f"{label} token预估: 提示词≈{prompt_tokens}, max_tokens={max_tokens}"
+        f"(请求{requested_max_tokens}), 上下文窗口={context}"
+    )
+    return max_tokens
+
+
+def trim_to_token_budget(text: str, max_tokens: int) -> str:
+    """将文本裁剪到预算以内，尽量在换行处截断"""
+    tokens = 0
+    cut = None
+    for match in _TOKEN_PATTERN.finditer(text or ""):
+        tokens += _piece_tokens(match.group(0))
+        if tokens > max_tokens:
+            cut = match.start()
+            break
+
+    if cut is None:
+        return text
+
+    trimmed = text[:cut]
+    newline = trimmed.rfind('\n')
+    if newline > cut * 0.8:
+        trimmed = trimmed[:newline]
+    return trimmed
+
+
+def split_by_token_budget(blocks: Iterable[str], max_tokens: int) -> List[List[str]]:
+    """将文本块按顺序分组，每组估算token数不超过预算（单块超限时独占一组）"""
+    groups: List[List[str]] = []
+    current: List[str] = []
+    current_tokens = 0
+
+    for block in blocks:
+        block_tokens = estimate_tokens(block)
+        if current and current_tokens + block_tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(block)
+        current_tokens += block_tokens
+
+    if current:
+        groups.append(current)
+    return groups
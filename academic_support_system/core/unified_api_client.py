@@ -3,12 +3,62 @@
 """
 import json
 import logging
-from typing import Optional, List, Dict, Any
-from openai import OpenAI
+from typing import Optional, List, Dict, Any, Iterator
 from .api_config import api_config
+from .client_registry import client_registry
+from .resilience import resilience, CircuitOpenError, LLMUnavailableError
+from .response_cache import response_cache, make_cache_key
+from .single_flight import single_flight
+from .token_budget import plan_request
 
 logger = logging.getLogger(__name__)
 
+def get_mock_response(prompt: str) -> str:
+    """获取模拟响应（用于API不可用时）"""
+    logger.warning("使用模拟响应")
+
+    # 根据提示词类型返回不同的模拟响应
+    if "选择题" in prompt:
+        return '''```json
+{
+    "text": "这是一道模拟选择题，用于测试系统功能。",
+    "type": "选择题",
+    "options": ["A. 选项1", "B. 选项2", "C. 选项3", "D. 选项4"],
+    "answer": "A",
+    "explanation": "这是模拟解析，实际使用时请配置正确的API。"
+}
+```'''
+    elif "填空题" in prompt:
+        return '''```json
+{
+    "text": "这是一道模拟填空题：请填写______。",
+    "type": "填空题",
+    "answer": "答案",
+    "explanation": "这是模拟解析，实际使用时请配置正确的API。"
+}
+```'''
+    elif "判断题" in prompt:
+        return '''```json
+{
+    "text": "这是一道模拟判断题。",
+    "type": "判断题",
+    "options": ["A. 正确", "B. 错误"],
+    "answer": "A",
+    "explanation": "这是模拟解析，实际使用时请配置正确的API。"
+}
+```'''
+    elif "解答题" in prompt:
+        return '''```json
+{
+    "text": "这是一道模拟解答题。",
+    "type": "解答题",
+    "answer": "这是模拟答案。",
+    "explanation": "这是模拟解析，实际使用时请配置正确的API。"
+}
+```'''
+    else:
+        return "这是一个模拟响应，请配置正确的API密钥。"
+
 class UnifiedAPIClient:
     """统一的API客户端"""
     
@@ -24,7 +74,7 @@ class UnifiedAPIClient:
             return
             
         try:
-            self._client = OpenAI(
+            self._client = client_registry.get_openai_client(
                 api_key=self.config.api_key,
                 base_url=self.config.base_url
             )
@@ -43,9 +93,16 @@ class UnifiedAPIClient:
         model: Optional[str] = None,
         max_tokens: int = 4000,
         temperature: float = 0.7,
-        timeout: int = 60
+        timeout: int = 60,
+        use_cache: bool = True,
+        refresh_cache: bool = False
     ) -> str:
-        """调用API生成文本"""
+        """
+        调用API生成文本
+
+        use_cache: 为False时绕过响应缓存
+        refresh_cache: 为True时跳过缓存读取并用新结果覆盖
+        """
         if not self.is_available():
             logger.error("API服务不可用，检查配置")
             # 提供模拟响应用于测试
@@ -54,28 +111,36 @@ class UnifiedAPIClient:
         if model is None:
             model = self.config.default_model
 
+        messages = [{"role": "user", "content": prompt}]
+        # 按提示词大小约束max_tokens，超出上下文窗口时在发送前拒绝
+        max_tokens = plan_request(messages, max_tokens, model)
+        request_key = make_cache_key(model, messages, temperature, max_tokens)
+        cache_key = request_key if use_cache else None
+        if cache_key and not refresh_cache:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"命中响应缓存，模型: {model}")
+                return cached
+
         try:
             logger.info(f"调用API，模型: {model}, 提示词长度: {len(prompt)}")
 
-            response = self._client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=max_tokens,
-                temperature=temperature,
-                timeout=timeout
+            # 相同请求并发到达时只调用一次上游
+            result = single_flight.do(
+                request_key,
+                lambda: self._request(model, messages, max_tokens, temperature, timeout)
             )
 
-            # 兼容不同的响应格式
-            if isinstance(response, str):
-                result = response.strip()
-            else:
-                result = response.choices[0].message.content.strip()
-
             logger.info(f"API调用成功，响应长度: {len(result)}")
+            if cache_key:
+                response_cache.set(cache_key, result)
             return result
 
+        except CircuitOpenError as e:
+            # 熔断期间快速失败，不再等待超时
+            logger.warning(str(e))
+            return self._handle_failure(prompt, e)
+
         except Exception as e:
             error_type = type(e).__name__
             error_msg = str(e)
@@ -89,86 +154,161 @@ class UnifiedAPIClient:
                 logger.error("3. 防火墙阻止连接")
                 logger.error(f"API URL: {self.config.base_url}")
 
-            # 在API失败时提供备用响应
-            logger.warning("API调用失败，使用模拟响应作为备用方案")
-            return self._get_mock_response(prompt)
+            return self._handle_failure(prompt, e)
+
+    def _request(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        max_tokens: int,
+        temperature: float,
+        timeout: Optional[int] = None
+    ) -> str:
+        """实际调用上游（带重试与熔断），返回去除首尾空白的文本"""
+        kwargs = {'timeout': timeout} if timeout is not None else {}
+        response = resilience.call(
+            lambda: self._client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                **kwargs
+            ),
+            endpoint=self.config.base_url
+        )
+
+        # 兼容不同的响应格式
+        if isinstance(response, str):
+            return response.strip()
+        return response.choices[0].message.content.strip()
+
+    def _handle_failure(self, prompt: str, error: Exception) -> str:
+        """按失败策略返回模拟响应或抛出 LLMUnavailableError"""
+        if not resilience.should_fallback_to_mock():
+            raise LLMUnavailableError(f"API调用失败: {error}") from error
+
+        # 在API失败时提供备用响应
+        logger.warning("API调用失败，使用模拟响应作为备用方案")
+        return self._get_mock_response(prompt)
 
     def _get_mock_response(self, prompt: str) -> str:
         """获取模拟响应（用于API不可用时）"""
-        logger.warning("使用模拟响应")
-
-        # 根据提示词类型返回不同的模拟响应
-        if "选择题" in prompt:
-            return '''```json
-{
-    "text": "这是一道模拟选择题，用于测试系统功能。",
-    "type": "选择题",
-    "options": ["A. 选项1", "B. 选项2", "C. 选项3", "D. 选项4"],
-    "answer": "A",
-    "explanation": "这是模拟解析，实际使用时请配置正确的API。"
-}
-```'''
-        elif "填空题" in prompt:
-            return '''```json
-{
-    "text": "这是一道模拟填空题：请填写______。",
-    "type": "填空题",
-    "answer": "答案",
-    "explanation": "这是模拟解析，实际使用时请配置正确的API。"
-}
-```'''
-        elif "判断题" in prompt:
-            return '''```json
-{
-    "text": "这是一道模拟判断题。",
-    "type": "判断题",
-    "options": ["A. 正确", "B. 错误"],
-    "answer": "A",
-    "explanation": "这是模拟解析，实际使用时请配置正确的API。"
-}
-```'''
-        elif "解答题" in prompt:
-            return '''```json
-{
-    "text": "这是一道模拟解答题。",
-    "type": "解答题",
-    "answer": "这是模拟答案。",
-    "explanation": "这是模拟解析，实际使用时请配置正确的API。"
-}
-```'''
-        else:
-            return "这是一个模拟响应，请配置正确的API密钥。"
+        return get_mock_response(prompt)
     
     def chat_completion(
         self,
         messages: List[Dict[str, str]],
         model: Optional[str] = None,
         max_tokens: int = 4000,
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        use_cache: bool = True,
+        refresh_cache: bool = False,
+        timeout: Optional[int] = None
     ) -> str:
-        """聊天完成API"""
+        """
+        聊天完成API
+
+        timeout: 读取超时（秒），未指定时使用连接池的默认值；长输出的非流式调用应传入足够长的超时，
+                 否则超时后会被重试层重复调用
+        """
         if not self.is_available():
             raise Exception("API服务不可用")
         
         if model is None:
             model = self.config.default_model
-        
+
+        max_tokens = plan_request(messages, max_tokens, model)
+        request_key = make_cache_key(model, messages, temperature, max_tokens)
+        cache_key = request_key if use_cache else None
+        if cache_key and not refresh_cache:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
         try:
-            response = self._client.chat.completions.create(
-                model=model,
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=temperature
+            result = single_flight.do(
+                request_key,
+                lambda: self._request(model, messages, max_tokens, temperature, timeout)
             )
-            
-            if isinstance(response, str):
-                return response.strip()
-            return response.choices[0].message.content.strip()
+
+            if cache_key:
+                response_cache.set(cache_key, result)
+            return result
             
         except Exception as e:
             logger.error(f"聊天API调用失败: {e}")
             raise Exception(f"聊天API调用失败: {str(e)}")
     
+    def stream_chat(
+        self,
+        messages: List[Dict[str, Any]],
+        model: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        temperature: float = 0.7,
+        timeout: int = 300
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        流式聊天，逐个产出标准化事件：
+        - {'type': 'content', 'content': 文本增量}
+        - {'type': 'usage', 'prompt_tokens': ..., 'completion_tokens': ..., 'total_tokens': ...}
+        - {'type': 'finish', 'finish_reason': 'stop' | 'length' | ...}
+        建立连接阶段经过重试与熔断；流中途出错时直接抛出异常。
+        """
+        if not self.is_available():
+            raise Exception("API服务不可用")
+
+        if model is None:
+            model = self.config.default_model
+
+        max_tokens = plan_request(messages, max_tokens, model, label="流式API")
+        kwargs = {}
+        if self.config.stream_include_usage:
+            kwargs['stream_options'] = {'include_usage': True}
+
+        stream = resilience.call(
+            lambda: self._client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                timeout=timeout,
+                stream=True,
+                **kwargs
+            ),
+            endpoint=self.config.base_url
+        )
+
+        finish_reason = None
+        try:
+            for chunk in stream:
+                usage = getattr(chunk, 'usage', None)
+                if usage:
+                    yield {
+                        'type': 'usage',
+                        'prompt_tokens': getattr(usage, 'prompt_tokens', None),
+                        'completion_tokens': getattr(usage, 'completion_tokens', None),
+                        'total_tokens': getattr(usage, 'total_tokens', None)
+                    }
+
+                if not getattr(chunk, 'choices', None):
+                    continue
+                choice = chunk.choices[0]
+                delta = getattr(choice, 'delta', None)
+                content = getattr(delta, 'content', None) if delta is not None else None
+                if content:
+                    yield {'type': 'content', 'content': content}
+                if getattr(choice, 'finish_reason', None):
+                    finish_reason = choice.finish_reason
+        finally:
+            # 调用方提前关闭（客户端断开、任务取消）时关闭HTTP连接，服务端随即停止生成
+            close = getattr(stream, 'close', None)
+            if close is not None:
+                close()
+
+        if finish_reason == 'length':
+            logger.warning(f"流式输出达到max_tokens上限({max_tokens})被截断")
+        yield {'type': 'finish', 'finish_reason': finish_reason or 'stop'}
+
     def generate_questions_with_prompt(
         self,
         prompt: str,
@@ -12,10 +12,17 @@ urlpatterns = [
     path('api/csrf-token/', views.get_csrf_token, name='get_csrf_token'),
     path('api/upload/', views.upload_file, name='upload_file'),
     path('api/generation-status/', views.get_generation_status, name='get_generation_status'),
+    path('api/generation-status/stream/', views.generation_status_events, name='generation_status_events'),
+    path('api/jobs/', views.list_jobs, name='list_jobs'),
+    path('api/jobs/<uuid:job_id>/', views.get_job, name='get_job'),
+    path('api/jobs/<uuid:job_id>/events/', views.job_events, name='job_events'),
+    path('api/jobs/<uuid:job_id>/cancel/', views.cancel_job, name='cancel_job'),
+    path('api/jobs/<uuid:job_id>/retry/', views.retry_job, name='retry_job'),
     path('api/user-latest-notes/', views.get_user_latest_notes, name='get_user_latest_notes'),
     path('api/notes-content/', views.get_notes_content, name='get_notes_content'),
     path('api/stream-notes/', views.stream_notes_content, name='stream_notes_content'),
     path('api/chat/', views.chat_message, name='chat_message'),
+    path('api/chat/stream/', views.chat_message_stream, name='chat_message_stream'),
     path('api/questions/generate/', views.generate_questions, name='generate_questions'),
     path('api/questions/check-answer/', views.check_answer, name='check_answer'),
 ]
\ No newline at end of file
@@ -1,6 +1,5 @@
 import os
 import json
-import threading
 import time
 from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
@@ -14,6 +13,9 @@ from django.conf import settings
 import importlib.util
 from django.shortcuts import render
 from .question_generator import generate_questions_from_notes, check_answer_correctness
+from .jobs import JobCancelled, job_queue
+from .progress import progress_store
+from .streaming import sse_event, sse_response
 
 # 动态导入 file_parsers
 file_parsers_path = os.path.join(settings.BASE_DIR, 'file_parsers.py')
@@ -53,31 +55,6 @@ def get_user_output_path(user_id):
     """获取用户输出目录路径"""
     return f'media/{user_id}/output'
 
-# 全局变量存储生成状态
-generation_status = {}
-
-# 进度回调函数
-def progress_callback(current=None, total=None, message=""):
-    """进度回调函数，用于更新解析进度"""
-    try:
-        if current is not None and total is not None and total > 0:
-            progress_percent = int((current / total) * 100)
-            default_message = f"正在解析第 {current}/{total} 张图片..."
-        else:
-            progress_percent = 0
-            default_message = "正在处理..."
-
-        generation_status['current'] = {
-            'status': 'processing',
-            'progress': progress_percent,
-            'current': current,
-            'total': total,
-            'message': message or default_message
-        }
-    except Exception as e:
-        print(f"Progress callback error: {e}")
-        # 即使进度回调出错，也不影响主流程
-
 # 删除重复的get_user_id函数，使用上面定义的版本
 
 # 删除了所有认证相关的视图函数
@@ -172,10 +149,6 @@ def upload_file(request):
         # 限制最多5个文件
         existing_files = [f for f in os.listdir(upload_dir) if os.path.isfile(os.path.join(upload_dir, f))]
         if len(existing_files) >= 5:
-            generation_status['current'] = {
-                'status': 'limit_reached',
-                'message': '文件数量已达上限。每位用户最多只能上传5个文件。如需上传新文件，请先删除旧文件。'
-            }
             return Response({'success': False, 'error': '文件数量已达上限。每位用户最多只能上传5个文件。如需上传新文件，请先删除旧文件。'}, status=400)
         if request.method == 'POST' and request.FILES.get('file'):
             upload = request.FILES['file']
@@ -186,74 +159,22 @@ def upload_file(request):
             supported_formats = file_parsers.get_supported_formats()
             file_ext = os.path.splitext(file_name)[1].lower()
             if file_ext not in supported_formats:
-                generation_status['current'] = {
-                    'status': 'error',
-                    'message': f'不支持的文件格式：{file_ext}。支持的格式：{", ".join(supported_formats)}'
-                }
                 return Response({'success': False, 'error': f'不支持的文件格式：{file_ext}'}, status=400)
 
         try:
-            # 设置上传状态
-            generation_status['current'] = {
-                'status': 'uploading',
-                'message': f'正在上传文件：{file_name}...',
-                'progress': 0
-            }
-
             # 保存文件
             with open(file_path, 'wb+') as destination:
                 for chunk in upload.chunks():
                     destination.write(chunk)
 
-            # 上传成功状态
-            generation_status['current'] = {
-                'status': 'upload_success',
-                'message': f'文件"{file_name}"上传成功，正在准备解析...',
-                'progress': 100
-            }
-            # 解析文件并输出到聊天框
-            def process_file():
-                try:
-                    # 解析目录结构 - 使用文件名（不含扩展名）作为目录名
-                    file_name_without_ext = os.path.splitext(file_name)[0]
-                    parsed_dir = os.path.join(upload_dir, file_name_without_ext)
-                    os.makedirs(parsed_dir, exist_ok=True)
-                    images_dir = os.path.join(parsed_dir, 'images')
-                    os.makedirs(images_dir, exist_ok=True)
-                    # 使用统一的解析函数，传入进度回调
-                    result = file_parsers.parse_file(file_path, images_dir, progress_callback)
-                    json_path = os.path.join(parsed_dir, f'{os.path.splitext(file_name)[0]}.json')
-                    with open(json_path, 'w', encoding='utf-8') as f:
-                        json.dump(result, f, ensure_ascii=False, indent=2)
-                    # 反馈到聊天框
-                    # 获取当前已上传的文件列表
-                    uploaded_files = []
-                    for item in os.listdir(upload_dir):
-                        item_path = os.path.join(upload_dir, item)
-                        if os.path.isdir(item_path):
-                            for file in os.listdir(item_path):
-                                if file.endswith('.json'):
-                                    uploaded_files.append(os.path.splitext(file)[0])
-
-                    files_list = "、".join(uploaded_files) if uploaded_files else "无"
-                    msg = f'文件“{file_name}”已成功解析！\n\n📁 当前已上传的文件：{files_list}\n\n💡 是否开始生成学习笔记？请回复"是"或"开始生成笔记"来开始。'
-                    generation_status['current'] = {
-                        'status': 'completed',
-                        'message': msg,
-                        'result': result,
-                        'progress': 100,
-                        'ask_for_notes': True,
-                        'uploaded_files': uploaded_files
-                    }
-                except Exception as e:
-                    generation_status['current'] = {
-                        'status': 'error',
-                        'message': f'文件“{file_name}”解析失败：{str(e)}'
-                    }
-            thread = threading.Thread(target=process_file)
-            thread.daemon = True
-            thread.start()
-            return Response({'success': True, 'message': f'文件“{file_name}”上传成功，正在为您解析，请稍候...'}, status=200)
+            # 解析任务交给后台任务队列，负载高时排队执行
+            job = job_queue.enqueue(
+                'parse_file',
+                owner_id=user_id,
+                payload={'file_name': file_name, 'file_path': file_path, 'upload_dir': upload_dir},
+                progress={'status': 'upload_success', 'message': f'文件"{file_name}"上传成功，正在排队等待解析...', 'progress': 100}
+            )
+            return Response({'success': True, 'message': f'文件“{file_name}”上传成功，正在为您解析，请稍候...', 'job_id': str(job.id)}, status=200)
         except Exception as e:
             return Response({'success': False, 'error': f'文件上传失败：{str(e)}'}, status=400)
 
@@ -262,23 +183,143 @@ def upload_file(request):
     except Exception as e:
         return Response({'success': False, 'error': f'上传处理失败：{str(e)}'}, status=500)
 
+def run_parse_file_job(context):
+    """后台任务：解析上传的文件并输出JSON，解析结果反馈到聊天框"""
+    file_name = context.payload['file_name']
+    file_path = context.payload['file_path']
+    upload_dir = context.payload['upload_dir']
+
+    def job_progress_callback(current=None, total=None, message=""):
+        if current is not None and total is not None and total > 0:
+            progress_percent = int((current / total) * 100)
+            default_message = f"正在解析第 {current}/{total} 张图片..."
+        else:
+            progress_percent = 0
+            default_message = "正在处理..."
+        context.update({
+            'status': 'processing',
+            'progress': progress_percent,
+            'current': current,
+            'total': total,
+            'message': message or default_message
+        })
+        context.check_cancelled()
+
+    try:
+        # 解析目录结构 - 使用文件名（不含扩展名）作为目录名
+        file_name_without_ext = os.path.splitext(file_name)[0]
+        parsed_dir = os.path.join(upload_dir, file_name_without_ext)
+        os.makedirs(parsed_dir, exist_ok=True)
+        images_dir = os.path.join(parsed_dir, 'images')
+        os.makedirs(images_dir, exist_ok=True)
+        context.update({'status': 'processing', 'progress': 0, 'message': f'正在解析文件“{file_name}”...'}, force=True)
+        # 使用统一的解析函数，传入进度回调
+        result = file_parsers.parse_file(file_path, images_dir, job_progress_callback)
+        json_path = os.path.join(parsed_dir, f'{os.path.splitext(file_name)[0]}.json')
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    except JobCancelled:
+        raise
+    except Exception as e:
+        raise RuntimeError(f'文件“{file_name}”解析失败：{str(e)}')
+
+    # 反馈到聊天框
+    # 获取当前已上传的文件列表
+    uploaded_files = []
+    for item in os.listdir(upload_dir):
+        item_path = os.path.join(upload_dir, item)
+        if os.path.isdir(item_path):
+            for file in os.listdir(item_path):
+                if file.endswith('.json'):
+                    uploaded_files.append(os.path.splitext(file)[0])
+
+    # 按策略在后台以低优先级预先生成笔记，用户确认时直接加入该任务
+    from notes.speculative import speculative_notes
+    from notes.views import get_user_output_path
+    speculative_job = speculative_notes.maybe_enqueue(context.owner_id, upload_dir, get_user_output_path(context.owner_id))
+
+    files_list = "、".join(uploaded_files) if uploaded_files else "无"
+    msg = f'文件“{file_name}”已成功解析！\n\n📁 当前已上传的文件：{files_list}\n\n💡 是否开始生成学习笔记？请回复"是"或"开始生成笔记"来开始。'
+    if speculative_job:
+        msg += '\n\n⏳ 已在后台预先生成笔记，确认后即可更快看到结果。'
+    context.update({
+        'status': 'completed',
+        'message': msg,
+        'progress': 100,
+        'ask_for_notes': True,
+        'uploaded_files': uploaded_files,
+        'speculative_job_id': str(speculative_job.id) if speculative_job else None
+    }, force=True)
+    return {'json_path': json_path, 'uploaded_files': uploaded_files}
+
 @api_view(['GET'])
 def get_generation_status(request):
-    # 首先检查笔记生成状态
-    try:
-        from notes.views import note_generation_status
-        if 'current' in note_generation_status:
-            note_status = note_generation_status['current']
-            # 如果笔记正在生成或已完成，优先返回笔记状态
-            if note_status.get('status') in ['generating', 'completed', 'error']:
-                return Response(note_status)
-    except ImportError:
-        pass
-
-    # 如果没有笔记生成状态，返回文件处理状态
-    if 'current' not in generation_status:
+    """返回该用户最近一个后台任务（文件解析或笔记生成）的状态"""
+    status_data = job_queue.latest_status(get_user_id(request))
+    if status_data is None:
         return Response({'status': 'none', 'message': '暂无解析任务。'})
-    return Response(generation_status['current'])
+    return Response(status_data)
+
+def job_event_frames(job_id, after_seq=0):
+    """任务进度变化时推送SSE帧，任务结束后关闭"""
+    for snapshot in progress_store.subscribe(job_id, after_seq=after_seq):
+        if snapshot is None:
+            # 保活注释帧，防止代理断开空闲连接
+            yield ": keep-alive\n\n"
+            continue
+        yield sse_event(job_queue.status_for(snapshot))
+
+def job_events(request, job_id):
+    """推送后台任务进度（SSE），取代前端高频轮询"""
+    if job_queue.get(job_id, owner_id=get_user_id(request)) is None:
+        return JsonResponse({'success': False, 'error': '任务不存在'}, status=404)
+    try:
+        after_seq = int(request.GET.get('after', 0))
+    except ValueError:
+        after_seq = 0
+    return sse_response(job_event_frames(job_id, after_seq))
+
+def generation_status_events(request):
+    """推送当前用户最近一个任务的进度（SSE）"""
+    job = job_queue.latest(get_user_id(request))
+    if job is None:
+        return sse_response(iter([sse_event({'status': 'none', 'message': '暂无解析任务。'})]))
+    return sse_response(job_event_frames(job.id))
+
+@api_view(['GET'])
+def list_jobs(request):
+    """当前用户最近的后台任务"""
+    jobs = job_queue.list_jobs(get_user_id(request))
+    return Response({'success': True, 'jobs': [job.to_dict() for job in jobs]})
+
+@api_view(['GET'])
+def get_job(request, job_id):
+    """查询后台任务状态"""
+    job = job_queue.get(job_id, owner_id=get_user_id(request))
+    if job is None:
+        return Response({'success': False, 'error': '任务不存在'}, status=404)
+    return Response({'success': True, 'job': job.to_dict(), 'status': job_queue.status_for(progress_store.get(job.id))})
+
+@csrf_exempt
+@api_view(['POST'])
+def cancel_job(request, job_id):
+    """取消后台任务"""
+    if job_queue.get(job_id, owner_id=get_user_id(request)) is None:
+        return Response({'success': False, 'error': '任务不存在'}, status=404)
+    job = job_queue.cancel(job_id)
+    return Response({'success': True, 'job': job.to_dict()})
+
+@csrf_exempt
+@api_view(['POST'])
+def retry_job(request, job_id):
+    """重新执行失败或已取消的后台任务"""
+    job = job_queue.get(job_id, owner_id=get_user_id(request))
+    if job is None:
+        return Response({'success': False, 'error': '任务不存在'}, status=404)
+    if job.state not in (job.STATE_FAILED, job.STATE_CANCELLED):
+        return Response({'success': False, 'error': '只能重试失败或已取消的任务'}, status=400)
+    job = job_queue.retry(job_id)
+    return Response({'success': True, 'job': job.to_dict()})
 
 @api_view(['GET'])
 def get_notes_content(request):
@@ -508,17 +549,26 @@ def chat_message(request):
 
 def handle_section_qa_or_modification(message, request):
     """处理@章节的问答或修改请求"""
+    reply, qa_args = parse_section_request(message, request)
+    if reply is not None:
+        return reply
+    # 问答逻辑：使用系统提示词A
+    return generate_section_qa_response(*qa_args)
+
+def parse_section_request(message, request):
+    """
+    解析@章节消息。
+    返回 (直接回复, None)，或需要AI问答时返回 (None, (章节标题, 章节内容, 用户问题))
+    """
     import re
     from notes.views import get_user_id, get_latest_notes_file, extract_section_content
-    from notes.note_generator import get_api_client
-    from prompts import SECTION_QA_PROMPT, SECTION_MODIFICATION_PROMPT
 
     # 解析@章节名称
     at_pattern = r'@([^@\s]+)'
     matches = re.findall(at_pattern, message)
 
     if not matches:
-        return "请使用@符号指定要询问的章节，例如：@网络基础概念 这个概念是什么意思？"
+        return "请使用@符号指定要询问的章节，例如：@网络基础概念 这个概念是什么意思？", None
 
     section_title = matches[0]
 
@@ -526,27 +576,27 @@ def handle_section_qa_or_modification(message, request):
     user_question = re.sub(r'@[^@\s]+\s*', '', message).strip()
 
     if not user_question:
-        return f"请在@{section_title}后面提出您的问题。"
+        return f"请在@{section_title}后面提出您的问题。", None
 
     # 获取笔记内容
     user_id = get_user_id(request)
     latest_notes = get_latest_notes_file(user_id)
 
     if not latest_notes:
-        return "没有找到笔记文件，请先生成笔记。"
+        return "没有找到笔记文件，请先生成笔记。", None
 
     # 读取笔记内容
     try:
         with open(latest_notes['notes_file'], 'r', encoding='utf-8') as f:
             notes_content = f.read()
     except Exception as e:
-        return f"读取笔记文件失败：{str(e)}"
+        return f"读取笔记文件失败：{str(e)}", None
 
     # 提取指定章节的内容
     section_content = extract_section_content(notes_content, section_title)
 
     if not section_content:
-        return f"没有找到章节「{section_title}」，请检查章节名称是否正确。"
+        return f"没有找到章节「{section_title}」，请检查章节名称是否正确。", None
 
     # 检查是否是修改请求
     modification_keywords = ['修改', '更新', '改进', '完善', '调整', '重写', '优化', '补充']
@@ -564,37 +614,90 @@ def handle_section_qa_or_modification(message, request):
             'notes_file': latest_notes['notes_file']
         }
 
-        return f"您希望修改章节「{section_title}」吗？\n\n您的修改要求：{user_question}\n\n请回复\"确认修改\"来继续，或者重新描述您的需求。"
-    else:
-        # 问答逻辑：使用系统提示词A
-        return generate_section_qa_response(section_title, section_content, user_question)
+        return f"您希望修改章节「{section_title}」吗？\n\n您的修改要求：{user_question}\n\n请回复\"确认修改\"来继续，或者重新描述您的需求。", None
+
+    return None, (section_title, section_content, user_question)
+
+def build_section_qa_messages(section_title, section_content, user_question):
+    """构建章节问答的消息列表"""
+    from prompts import SECTION_QA_PROMPT
+
+    # 使用系统提示词A
+    prompt = SECTION_QA_PROMPT.format(
+        section_title=section_title,
+        section_content=section_content,
+        user_question=user_question
+    )
+    return [{"role": "user", "content": prompt}]
 
 def generate_section_qa_response(section_title, section_content, user_question):
     """生成章节问答回复"""
     try:
         from notes.note_generator import get_api_client
-        from prompts import SECTION_QA_PROMPT
 
         client = get_api_client()
         if not client:
             return "抱歉，AI服务暂时不可用。"
 
-        # 使用系统提示词A
-        prompt = SECTION_QA_PROMPT.format(
-            section_title=section_title,
-            section_content=section_content,
-            user_question=user_question
+        response = client.chat_completion(
+            build_section_qa_messages(section_title, section_content, user_question)
         )
 
-        response = client.chat_completion([
-            {"role": "user", "content": prompt}
-        ])
-
         return f"📖 关于章节「{section_title}」的解答：\n\n{response.strip()}"
 
     except Exception as e:
         return f"生成回复时出错：{str(e)}"
 
+@csrf_exempt
+@require_POST
+def chat_message_stream(request):
+    """
+    聊天接口的SSE版本：章节问答和普通对话逐字推送，
+    其余消息（生成笔记、确认修改等）按原逻辑处理后一次性返回。
+    """
+    from .streaming import sse_event, sse_response, single_reply_events, stream_chat_events
+
+    try:
+        message = json.loads(request.body or b'{}').get('message', '')
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'success': False, 'error': '请求格式错误'}, status=400)
+
+    def generate():
+        note_keywords = ['是', '开始生成笔记', '生成笔记', '开始生成', '生成', '笔记', 'yes', 'start']
+        is_note_request = any(keyword in message.lower() for keyword in note_keywords)
+        is_confirmation = message.strip() in ['确认修改', '确认', '是的', '是']
+
+        if not is_note_request and not is_confirmation:
+            if '@' in message:
+                try:
+                    reply, qa_args = parse_section_request(message, request)
+                except Exception as e:
+                    reply, qa_args = f"处理您的问题时出现错误：{str(e)}", None
+                if qa_args is not None:
+                    yield from stream_chat_events(
+                        build_section_qa_messages(*qa_args),
+                        prefix=f"📖 关于章节「{qa_args[0]}」的解答：\n\n"
+                    )
+                    return
+                yield from single_reply_events(reply)
+                return
+
+            from notes.views import get_user_id, stream_ai_chat_events
+            frames = stream_ai_chat_events(get_user_id(request), message)
+            if frames is not None:
+                yield from frames
+                return
+
+        # 不适合流式的分支复用原有的非流式逻辑
+        result = chat_message(request)
+        result_data = getattr(result, 'data', {}) or {}
+        if result_data.get('success'):
+            yield from single_reply_events(result_data.get('response', ''))
+        else:
+            yield sse_event({'type': 'error', 'message': result_data.get('error', '对话失败')})
+
+    return sse_response(generate())
+
 def generate_section_modification(section_title, section_content, modification_request):
     """生成章节修改内容"""
     try:
@@ -735,7 +838,7 @@ def generate_questions(request):
         parsed_types = parse_requirement_to_types(requirement, question_types)
 
         # 使用统一的出题服务
-        result = question_service.generate_questions(
+        result = question_service.generate_questions_concurrently(
             notes_content=notes_content,
             question_types=parsed_types,
             user_preferences=requirement,
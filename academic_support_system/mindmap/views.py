@@ -286,13 +286,8 @@ def generate_refined_mindmap(section_title, section_content):
     """调用AI生成精炼的思维导图"""
     # 这里需要集成现有的API客户端
     try:
-        # 导入API客户端
-        import sys
-        import os
-        sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        from api_client import APIClient
-
-        client = APIClient()
+        # 使用统一客户端：相同章节的并发请求会合并为一次上游调用
+        from core.unified_api_client import unified_client as client
 
         prompt = f"""
 请根据以下内容为"{section_title}"生成一个精炼的思维导图结构。
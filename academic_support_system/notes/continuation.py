@@ -0,0 +1,85 @@
+"""
+笔记生成的断点续写
+
+流式生成几分钟后连接中断，或模型因 finish_reason=length 停止时，已写出的 notes.md 以标题为检查点：
+- find_checkpoint 找到最后一个标题行的位置，之前的章节视为已完成，之后可能不完整的部分丢弃重写
+- 续写请求在原提示词后附上已完成部分的标题大纲，要求从检查点标题开始继续
+- HeadingStitcher 过滤续写输出开头重复的已完成标题及其内容和开场白，拼接时不出现重复章节
+"""
+import re
+from typing import Iterable, List, Optional, Tuple
+
+_HEADING = re.compile(r'(?m)^#{1,3} .*$')
+
+
+def completed_headings(text: str) -> List[str]:
+    """文本中的标题行（一至三级），按出现顺序"""
+    return [match.group(0).strip() for match in _HEADING.finditer(text)]
+
+
+def find_checkpoint(text: str) -> Tuple[int, Optional[str]]:
+    """
+    返回 (检查点位置, 检查点标题)：最后一个标题行的起始位置及该标题。
+    没有标题时返回 (0, None)，只能从头重新生成。
+    """
+    last = None
+    for last in _HEADING.finditer(text):
+        pass
+    if last is None:
+        return 0, None
+    return last.start(), last.group(0).strip()
+
+
+class HeadingStitcher:
+    """
+    过滤续写输出的开头：丢弃第一个新标题之前的内容（开场白、重复的已完成章节），之后原样输出。
+    输出按行判断，未满一行的内容暂存到下一次 feed。
+    """
+
+    def __init__(self, skip_headings: Iterable[str]):
+        self.skip_headings = set(skip_headings)
+        self.started = False
+        self.skipped = 0
+        self._buffer = ''
+        # 第一个标题之前的行：出现新标题时丢弃，续写没有任何标题时作为正文保留
+        self._preamble: List[str] = []
+        self._seen_heading = False
+
+    def feed(self, text: str) -> str:
+        """加入一段续写输出，返回可以写入笔记的部分"""
+        if self.started:
+            return text
+        self._buffer += text
+        while '\n' in self._buffer:
+            line, rest = self._buffer.split('\n', 1)
+            if self._is_new_heading(line):
+                self.started = True
+                self._buffer, self._preamble = '', []
+                return line + '\n' + rest
+            if not self._seen_heading:
+                self._preamble.append(line + '\n')
+            self._buffer = rest
+        return ''
+
+    def finish(self) -> str:
+        """续写结束时返回暂存的内容"""
+        buffer, self._buffer = self._buffer, ''
+        if self.started or self._is_new_heading(buffer):
+            self.started = True
+            return buffer
+        if self._seen_heading:
+            # 出现的标题全部是已完成的章节
+            return ''
+        # 续写没有输出任何标题时按正文接在检查点之后
+        preamble, self._preamble = ''.join(self._preamble), []
+        return preamble + buffer
+
+    def _is_new_heading(self, line: str) -> bool:
+        stripped = line.strip()
+        if not _HEADING.match(stripped):
+            return False
+        self._seen_heading = True
+        if stripped in self.skip_headings:
+            self.skipped += 1
+            return False
+        return True
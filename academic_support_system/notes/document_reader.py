@@ -0,0 +1,168 @@
+"""
+解析后文档JSON的流式读取
+
+解析结果是一个 [{type, page, ...}, ...] 数组，大教材可达数十MB。json.load 会一次构建完整的对象树，
+再经过按页分组的字典和拼接后的字符串，内存中同时存在好几份全文：
+- iter_json_array 按块读取文件，逐个产出数组元素，内存只与单个条目和读缓冲有关
+- PageAssembler 把按页排列的条目组装为 "=== 第N页 ===" 页块并按页码顺序产出，只缓存未结束的页；
+  多个文档依次输入时以 DOCUMENT_BOUNDARY 分隔，每个文档的页各自按页码排序，不与下一个文档合并
+"""
+import json
+import logging
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = ' \t\n\r'
+
+# 条目流中的文档分隔标记：之前文档的页全部产出，页码从下一个文档重新开始
+DOCUMENT_BOUNDARY = object()
+
+
+def iter_json_array(json_file_path: str, chunk_size: int = 16 * 1024) -> Iterator[Any]:
+    """逐个产出JSON文件顶层数组中的元素，不把整个文件读入内存"""
+    decoder = json.JSONDecoder()
+    with open(json_file_path, 'r', encoding='utf-8') as f:
+        buffer = ''
+        pos = 0
+        eof = False
+        # 状态: start 等待"["；value 等待元素或"]"；separator 等待","或"]"
+        state = 'start'
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos >= len(buffer) or (state == 'value' and not eof and len(buffer) - pos < chunk_size):
+                # 元素可能跨越缓冲区边界：丢弃已处理的部分后补读一块
+                if not eof:
+                    chunk = f.read(chunk_size)
+                    eof = not chunk
+                    buffer = buffer[pos:] + chunk
+                    pos = 0
+                    continue
+                if pos >= len(buffer):
+                    raise ValueError("JSON文件格式不正确，数组没有结束")
+
+            char = buffer[pos]
+            if state == 'start':
+                if char != '[':
+                    raise ValueError("JSON文件格式不正确，应该是一个数组")
+                pos += 1
+                state = 'value'
+            elif state == 'separator':
+                if char == ']':
+                    return
+                if char != ',':
+                    raise ValueError(f"JSON文件格式不正确，数组元素之间缺少逗号（位置 {pos}）")
+                pos += 1
+                state = 'value'
+            else:
+                if char == ']':
+                    return
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    # 元素不完整，继续补读
+                    chunk = f.read(chunk_size)
+                    eof = not chunk
+                    buffer = buffer[pos:] + chunk
+                    pos = 0
+                    continue
+                pos = end
+                state = 'separator'
+                yield item
+
+
+def _page_number(page: str) -> Optional[int]:
+    try:
+        return int(page)
+    except (ValueError, TypeError):
+        return None
+
+
+class PageAssembler:
+    """
+    把解析条目组装为页块，按页码从小到大产出。
+
+    解析器按页顺序输出条目，出现更大的页码时即可产出之前缓存的页，内存只与最大的一页有关。
+    页码回退的条目（乱序输出）会在下一次产出时作为该页的补充页块输出；
+    无法识别页码的条目在最后输出，与原先排序规则一致。
+    """
+
+    def __init__(self, describe_figure: Callable[[Dict[str, Any], str], str] = None):
+        # describe_figure(条目, 页码) 返回图片在提示词中的描述
+        self.describe_figure = describe_figure or (
+            lambda item, page: f"[图片] 路径: {item.get('path', '')}\n描述: {item.get('caption', '')}"
+        )
+        self._pages: Dict[str, Dict[str, List[str]]] = {}
+        self._max_page: Optional[int] = None
+
+    def feed(self, item: Any) -> Iterator[Tuple[str, List[str], List[str]]]:
+        """加入一个条目，产出因此确定已结束的页 (页码, 文本段落, 图片描述)"""
+        if item is DOCUMENT_BOUNDARY:
+            yield from self.finish()
+            self._max_page = None
+            return
+        if not isinstance(item, dict):
+            return
+        page = str(item.get("page", "unknown"))
+        if item.get("type") == "text" and "content" in item:
+            content = item.get("content", "").strip()
+            if not content:
+                return
+            kind, value = "text", content
+        elif item.get("type") == "figure" and "path" in item:
+            kind, value = "figures", self.describe_figure(item, page)
+        else:
+            return
+
+        number = _page_number(page)
+        if number is not None and (self._max_page is None or number > self._max_page):
+            yield from self._flush_numbered()
+            self._max_page = number
+        elif number is not None and number < self._max_page and page not in self._pages:
+            logger.debug(f"第{page}页的条目出现在第{self._max_page}页之后，将作为补充页块输出")
+        self._pages.setdefault(page, {"text": [], "figures": []})[kind].append(value)
+
+    def finish(self) -> Iterator[Tuple[str, List[str], List[str]]]:
+        """产出剩余的页（包括无法识别页码的页）"""
+        yield from self._flush_numbered()
+        for page in list(self._pages):
+            yield self._pop(page)
+
+    def iter_pages(self, items: Iterable[Any]) -> Iterator[Tuple[str, List[str], List[str]]]:
+        """按页码顺序产出 (页码, 文本段落, 图片描述)"""
+        for item in items:
+            yield from self.feed(item)
+        yield from self.finish()
+
+    def assemble(self, items: Iterable[Any]) -> Iterator[str]:
+        """按页码顺序产出页块文本"""
+        for page, texts, figures in self.iter_pages(items):
+            block = format_page(page, texts, figures)
+            if block:
+                yield block
+
+    def _flush_numbered(self) -> Iterator[Tuple[str, List[str], List[str]]]:
+        for page in sorted((p for p in self._pages if _page_number(p) is not None), key=_page_number):
+            yield self._pop(page)
+
+    def _pop(self, page: str) -> Tuple[str, List[str], List[str]]:
+        entry = self._pages.pop(page)
+        return page, entry["text"], entry["figures"]
+
+
+def format_page(page: str, texts: List[str], figures: List[str]) -> str:
+    """把一页的文本段落和图片描述格式化为 "=== 第N页 ===" 页块，没有内容时返回空字符串"""
+    sections = []
+    page_content = "\n".join(texts).strip()
+    page_figures = "\n".join(figures).strip()
+    if page_content:
+        sections.append(page_content)
+    if page_figures:
+        sections.append(page_figures)
+    if not sections:
+        return ""
+    return f"=== 第{page}页 ===\n" + "\n\n".join(sections)
@@ -0,0 +1,284 @@
+"""
+按文档增量生成笔记
+
+每个已解析的JSON文档按内容哈希记录在用户输出目录的 notes_manifest.json 中，
+清单记录文档对应的一级标题和二级章节，以及按哈希保存的单文档笔记（.note_parts/<哈希>.md）。
+再次生成时只为新增或内容变化的文档调用LLM，未变化的文档直接复用现有笔记中的对应部分
+（保留用户通过AI修改过的内容），然后拼接为新的 notes.md。
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .note_generator import NoteGenerator
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'notes_manifest.json'
+# 以"."开头，避免被按目录名排序查找最新笔记的逻辑当作时间戳目录
+PARTS_DIR_NAME = '.note_parts'
+
+
+def document_hash(json_path: str) -> str:
+    """计算文档内容的SHA-256哈希"""
+    digest = hashlib.sha256()
+    with open(json_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def split_note_blocks(notes: str) -> List[Tuple[str, str]]:
+    """按一级标题把笔记切分为 (标题, 内容) 列表，忽略代码块内的#行和水印"""
+    blocks: List[Tuple[str, List[str]]] = []
+    in_code = False
+    for line in notes.split('\n'):
+        stripped = line.strip()
+        if stripped.startswith('```'):
+            in_code = not in_code
+        if stripped == NoteGenerator.NOTES_WATERMARK:
+            continue
+        if not in_code and stripped.startswith('# '):
+            blocks.append((stripped[2:].strip(), [line]))
+        elif blocks:
+            blocks[-1][1].append(line)
+    return [(title, '\n'.join(lines).strip()) for title, lines in blocks]
+
+
+def normalize_document_notes(notes: str, fallback_title: str) -> str:
+    """单文档笔记规范为恰好一个一级标题开头，去掉水印"""
+    lines = []
+    has_title = False
+    in_code = False
+    for line in notes.strip().split('\n'):
+        stripped = line.strip()
+        if stripped.startswith('```'):
+            in_code = not in_code
+        if stripped == NoteGenerator.NOTES_WATERMARK:
+            continue
+        if not in_code and stripped.startswith('# '):
+            if has_title:
+                line = '#' + stripped
+            has_title = True
+        lines.append(line)
+    body = '\n'.join(lines).strip()
+    if not body.startswith('# '):
+        body = f"# {fallback_title}\n\n{body}"
+    return body
+
+
+def section_headings(block: str) -> List[str]:
+    """提取笔记块中的二级标题"""
+    return [line.strip()[3:].strip() for line in block.split('\n') if line.strip().startswith('## ')]
+
+
+class NotesManifest:
+    """文档 -> 笔记章节的清单"""
+
+    def __init__(self, output_dir: str):
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.notes_file: Optional[str] = None
+        self.documents: List[Dict[str, Any]] = []
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.notes_file = data.get('notes_file')
+            self.documents = data.get('documents', [])
+        except Exception as e:
+            logger.warning(f"笔记清单读取失败，将全部重新生成: {e}")
+            self.notes_file = None
+            self.documents = []
+
+    def save(self):
+        """先写临时文件再替换，避免中断时留下半个清单"""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': 1,
+                'notes_file': self.notes_file,
+                'updated_at': datetime.now().isoformat(),
+                'documents': self.documents
+            }, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        for entry in self.documents:
+            if entry['key'] == key:
+                return entry
+        return None
+
+
+class IncrementalNoteBuilder:
+    """为一组文档增量生成并拼接笔记，产出与 NoteGenerator.generate_notes_streaming 相同的事件"""
+
+    def __init__(self, output_dir: str, generator: NoteGenerator = None):
+        self.output_dir = output_dir
+        self.parts_dir = os.path.join(output_dir, PARTS_DIR_NAME)
+        self.generator = generator or NoteGenerator()
+
+    def plan(self, json_files: List[Dict[str, str]], force: bool = False) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        比较文档哈希与清单，返回 reused（可复用）、generate（需要生成）和 removed（已删除）三组文档。
+        json_files 中每项包含 key（文档标识）和 path。
+        """
+        manifest = NotesManifest(self.output_dir)
+        documents = []
+        for json_file in json_files:
+            documents.append({**json_file, 'hash': document_hash(json_file['path'])})
+
+        current_keys = {doc['key'] for doc in documents}
+        reused, generate = [], []
+        for doc in documents:
+            entry = manifest.get(doc['key'])
+            part_exists = os.path.exists(self._part_path(doc['hash']))
+            if not force and part_exists:
+                # 内容哈希未变（或同一内容曾经生成过）时复用
+                reused.append({**doc, 'entry': entry if entry and entry['hash'] == doc['hash'] else None})
+            else:
+                generate.append(doc)
+
+        # 复用的文档保持清单中的原有顺序
+        order = {entry['key']: index for index, entry in enumerate(manifest.documents)}
+        reused.sort(key=lambda doc: order.get(doc['key'], len(order)))
+        removed = [entry for entry in manifest.documents if entry['key'] not in current_keys]
+        return {'reused': reused, 'generate': generate, 'removed': removed, 'manifest': manifest}
+
+    def _part_path(self, digest: str) -> str:
+        return os.path.join(self.parts_dir, f"{digest}.md")
+
+    def generate(self, json_files: List[Dict[str, str]], mode: str = None, force: bool = False) -> Iterator[Dict[str, Any]]:
+        """只为新增或变化的文档生成笔记，并与复用部分拼接为新的 notes.md"""
+        try:
+            plan = self.plan(json_files, force=force)
+        except Exception as e:
+            yield {"type": "error", "content": f"读取文档失败: {str(e)}"}
+            return
+
+        manifest: NotesManifest = plan['manifest']
+        reused, to_generate = plan['reused'], plan['generate']
+
+        # 文档集合和内容都没有变化，直接使用已有笔记
+        if not to_generate and not plan['removed'] and all(doc['entry'] for doc in reused) \
+                and [doc['key'] for doc in reused] == [entry['key'] for entry in manifest.documents] \
+                and manifest.notes_file and os.path.exists(manifest.notes_file):
+            logger.info("文档均未变化，复用已有笔记")
+            yield {"type": "start", "content": "文档均未变化，直接使用已有笔记"}
+            with open(manifest.notes_file, 'r', encoding='utf-8') as f:
+                yield {"type": "content", "content": f.read()}
+            yield self.generator._finalize_notes(Path(manifest.notes_file), Path(manifest.notes_file).parent)
+            return
+
+        blocks = self._reused_blocks(reused, manifest)
+        if reused:
+            yield {"type": "start", "content": f"{len(reused)}个文档未变化，复用已有笔记；正在为{len(to_generate)}个文档生成笔记..."}
+            yield {"type": "content", "content": "\n\n".join(block for _, block in blocks) + "\n\n"}
+
+        os.makedirs(self.parts_dir, exist_ok=True)
+        generated = []
+        continuations = 0
+        for doc in to_generate:
+            block = None
+            for event in self.generator.generate_notes_streaming(doc['path'], self.output_dir, mode=mode):
+                if event['type'] == 'complete':
+                    block = self._store_part(doc, event)
+                    continuations += event.get('continuations', 0)
+                    break
+                if event['type'] == 'error':
+                    yield event
+                    return
+                yield event
+            if block is None:
+                yield {"type": "error", "content": f"文档 {doc['key']} 的笔记生成未完成"}
+                return
+            blocks.append((doc, block))
+            generated.append(doc)
+
+        complete = self._write_combined(blocks, manifest, len(reused), len(generated))
+        complete['continuations'] = continuations
+        yield complete
+
+    def _reused_blocks(self, reused: List[Dict[str, Any]], manifest: NotesManifest) -> List[Tuple[Dict[str, Any], str]]:
+        """从现有笔记中取出复用文档对应的部分（含用户修改），取不到时使用单文档笔记缓存"""
+        existing_blocks: List[Tuple[str, str]] = []
+        if manifest.notes_file and os.path.exists(manifest.notes_file):
+            with open(manifest.notes_file, 'r', encoding='utf-8') as f:
+                existing_blocks = split_note_blocks(f.read())
+
+        result = []
+        for doc in reused:
+            block = None
+            entry = doc['entry']
+            if entry is not None:
+                for index, (title, content) in enumerate(existing_blocks):
+                    if title == entry.get('title'):
+                        block = content
+                        del existing_blocks[index]
+                        break
+            if block is None:
+                with open(self._part_path(doc['hash']), 'r', encoding='utf-8') as f:
+                    block = f.read().strip()
+            result.append((doc, block))
+        return result
+
+    def _store_part(self, doc: Dict[str, Any], complete: Dict[str, Any]) -> str:
+        """保存单文档笔记到按哈希命名的缓存，并删除生成过程的临时输出目录"""
+        with open(complete['file_path'], 'r', encoding='utf-8') as f:
+            fallback_title = os.path.splitext(os.path.basename(doc['key']))[0]
+            block = normalize_document_notes(f.read(), fallback_title)
+        with open(self._part_path(doc['hash']), 'w', encoding='utf-8') as f:
+            f.write(block)
+        shutil.rmtree(complete['output_dir'], ignore_errors=True)
+        return block
+
+    def _write_combined(self, blocks: List[Tuple[Dict[str, Any], str]], manifest: NotesManifest,
+                        reused_count: int, generated_count: int) -> Dict[str, Any]:
+        """拼接各文档笔记写入新的输出目录，更新清单，返回 complete 事件"""
+        notes_output_path = NoteGenerator.create_output_dir(self.output_dir)
+        md_file_path = notes_output_path / "notes.md"
+        with open(md_file_path, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(block for _, block in blocks) + f"\n\n{NoteGenerator.NOTES_WATERMARK}\n")
+
+        manifest.notes_file = str(md_file_path)
+        manifest.documents = [
+            {
+                'key': doc['key'],
+                'hash': doc['hash'],
+                'title': split_note_blocks(block)[0][0] if block.startswith('# ') else '',
+                'sections': section_headings(block),
+                'part_file': os.path.join(PARTS_DIR_NAME, f"{doc['hash']}.md")
+            }
+            for doc, block in blocks
+        ]
+        manifest.save()
+        logger.info(f"笔记增量更新完成: 复用{reused_count}个文档，新生成{generated_count}个文档")
+
+        complete = self.generator._finalize_notes(md_file_path, notes_output_path)
+        complete.update({'reused_documents': reused_count, 'generated_documents': generated_count})
+        return complete
+
+
+def find_parsed_documents(upload_dir: str) -> List[Dict[str, str]]:
+    """列出上传目录下各文件夹中的已解析JSON文档"""
+    documents = []
+    for item in sorted(os.listdir(upload_dir)):
+        item_path = os.path.join(upload_dir, item)
+        if os.path.isdir(item_path):
+            for file in sorted(os.listdir(item_path)):
+                if file.endswith('.json'):
+                    documents.append({
+                        'key': f"{item}/{file}",
+                        'name': file,
+                        'folder': item,
+                        'path': os.path.join(item_path, file)
+                    })
+    return documents
@@ -1,40 +1,88 @@
 import json
 import os
 import sys
+import threading
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 import importlib.util
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .continuation import HeadingStitcher, completed_headings, find_checkpoint
+from .document_reader import DOCUMENT_BOUNDARY, PageAssembler, format_page, iter_json_array
+from core.streaming import BufferedTextWriter, coalesce_deltas
+from core.text_compaction import CompactionReport, TextCompactor
+from core.unified_api_client import unified_client
+from core.token_budget import (
+    PromptTooLargeError,
+    budget_for_prompt,
+    estimate_tokens,
+    plan_request,
+    split_by_token_budget,
+    trim_to_token_budget,
+)
+
+logger = logging.getLogger(__name__)
 
 # 导入集中管理的提示词
 try:
-    from prompts import NOTE_GENERATION_SYSTEM_PROMPT
+    from prompts import (
+        NOTE_GENERATION_SYSTEM_PROMPT,
+        NOTE_CHUNK_GENERATION_PROMPT,
+        NOTE_MERGE_PROMPT,
+        NOTE_OUTLINE_PROMPT,
+        NOTE_SECTION_EXPAND_PROMPT,
+        NOTE_CONTINUATION_PROMPT,
+    )
 except ImportError:
     # 如果导入失败，使用默认提示词
     NOTE_GENERATION_SYSTEM_PROMPT = "你是一个专业的学术笔记生成助手。请根据提供的文档内容，生成结构化、易于理解的学习笔记。"
+    NOTE_CHUNK_GENERATION_PROMPT = "以下是一份长文档的第{index}/{total}部分，请只针对这一部分整理笔记，使用##和###标题。\n"
+    NOTE_MERGE_PROMPT = "请把以下按顺序分段整理的部分笔记合并为一份标题层级统一的完整Markdown笔记：\n\n"
+    NOTE_OUTLINE_PROMPT = "请为以下内容设计笔记大纲：第一行为#标题，用##划分章节并在行末标注【页码: 起始页-结束页】，用###列出小节，只输出大纲。\n\n"
+    NOTE_SECTION_EXPAND_PROMPT = "笔记《{title}》的大纲如下：\n{outline}\n\n请只编写以下章节，以##标题开头：\n{section_outline}\n"
+    NOTE_CONTINUATION_PROMPT = "\n\n已完成部分的标题如下：\n{outline}\n\n请从\"{heading}\"开始继续编写剩余的笔记，不要重复已完成的内容。\n"
+
+# 笔记来源：JSON文件路径、JSON文件路径列表，或解析条目的可迭代对象
+NoteSource = Union[str, os.PathLike, Iterable[Union[str, os.PathLike, Dict[str, Any]]]]
+
+# 进程级共享的 API 客户端
+_api_client = None
+_api_client_lock = threading.Lock()
 
-# 动态导入 API 客户端
 def get_api_client():
-    """动态导入API客户端"""
-    try:
-        # 添加项目根目录到Python路径
-        project_root = Path(__file__).parent.parent.parent
-        sys.path.append(str(project_root))
-        
-        from api_client import APIClient
-        from config import API_KEY, BASE_URL, DEFAULT_MODEL
-        
-        return APIClient(
-            api_key=API_KEY,
-            base_url=BASE_URL,
-            default_model=DEFAULT_MODEL
-        )
-    except ImportError as e:
-        print(f"Warning: API配置文件未找到 - {e}")
-        return None
-    except Exception as e:
-        print(f"Warning: API客户端初始化失败 - {e}")
-        return None
+    """获取进程内共享的API客户端（首次调用时创建）"""
+    global _api_client
+    if _api_client is not None:
+        return _api_client
+
+    with _api_client_lock:
+        if _api_client is not None:
+            return _api_client
+        try:
+            # 添加项目根目录到Python路径（只添加一次）
+            project_root = str(Path(__file__).parent.parent.parent)
+            if project_root not in sys.path:
+                sys.path.append(project_root)
+
+            from api_client import APIClient
+            from core.api_config import api_config
+
+            # 与统一客户端使用同一份配置（环境变量优先，其次 config.py）
+            _api_client = APIClient(
+                api_key=api_config.api_key,
+                base_url=api_config.base_url,
+                default_model=api_config.default_model
+            )
+            return _api_client
+        except ImportError as e:
+            print(f"Warning: API配置文件未找到 - {e}")
+            return None
+        except Exception as e:
+            print(f"Warning: API客户端初始化失败 - {e}")
+            return None
 
 class NoteGenerator:
     """
@@ -44,25 +92,37 @@ class NoteGenerator:
 
     # 使用集中管理的系统提示词
     SYSTEM_PROMPT = NOTE_GENERATION_SYSTEM_PROMPT
+    # 为笔记输出预留的token数
+    NOTE_OUTPUT_RESERVE_TOKENS = 50000
+    # 大纲阶段的输出token上限
+    NOTE_OUTLINE_MAX_TOKENS = 2000
+    # 笔记生成请求的读取超时（秒）：分块/章节等长输出的非流式调用需要较长时间才返回
+    NOTE_REQUEST_TIMEOUT = 300
+    NOTES_WATERMARK = "本笔记由知悟·启明学业问答系统生成，AI可能会出错，请仔细鉴别。"
 
     def __init__(self):
         """初始化笔记生成器"""
-        self.api_client = get_api_client()
-
-    def generate_notes_streaming(self, json_file_path: str, output_dir: str = None) -> Dict[str, Any]:
-        """流式生成笔记，返回生成器用于实时传输"""
+        self.client = unified_client
+        self.compactor = TextCompactor(near_duplicate_threshold=self.client.config.notes_compaction_threshold)
+
+    def generate_notes_streaming(self, source: "NoteSource", output_dir: str = None, mode: str = None) -> Dict[str, Any]:
+        """
+        流式生成笔记，返回生成器用于实时传输
+
+        source: 单个解析后的JSON文件路径、JSON文件路径列表（按顺序合并），
+                或解析条目（{type, page, ...} 字典）的可迭代对象，条目直接进入提示词组装，不落盘
+        mode: single 一次性生成 / chunked 分块生成后合并 / outline 先生成大纲再并行展开各章节 /
+              auto 超出分块预算时自动分块（默认取配置）
+        """
         try:
             # 创建输出目录
-            timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
             if output_dir is None:
                 output_dir = "media/output"  # 默认路径，但应该由调用者指定用户特定路径
 
-            notes_output_path = Path(output_dir) / timestamp
-
-            notes_output_path.mkdir(parents=True, exist_ok=True)
+            notes_output_path = self.create_output_dir(output_dir)
             
             # 提取文本内容和图片信息
-            extracted_data = self._extract_text_from_json(json_file_path, str(notes_output_path))
+            extracted_data = self._extract_text(self._iter_source_items(source), str(notes_output_path))
             text_content = extracted_data["text_content"]
             images_info = extracted_data["images_info"]
             
@@ -70,81 +130,454 @@ class NoteGenerator:
                 yield {"type": "error", "content": "JSON文件中没有找到文本内容"}
                 return
             
-            # 构建图片信息部分
-            images_section = ""
-            if images_info:
-                images_section = "\n\n可用图片信息：\n"
-                for i, img in enumerate(images_info, 1):
-                    images_section += f"{i}. 页面{img['page']} - 路径: {img['rel_path']}\n"
-                    images_section += f"   描述: {img['caption']}\n"
-            
+            images_section = self._build_images_section(images_info)
             prompt = self.SYSTEM_PROMPT + images_section + "\n\n文本内容:\n" + text_content
             
             # 保存提取的文本内容和提示词
             init_path = notes_output_path / "extracted_content.txt"
             with open(init_path, "w", encoding="utf-8") as f:
                 f.write(text_content)
+
+            compaction = extracted_data["compaction"]
+            if compaction:
+                with open(notes_output_path / "compaction_report.json", "w", encoding="utf-8") as f:
+                    json.dump(compaction, f, ensure_ascii=False, indent=2)
+                if compaction["tokens_saved"] > 0:
+                    yield {"type": "start", "content": f"已去除重复的页眉页脚等内容，节省约{compaction['tokens_saved']}个token"}
             
             prompt_path = notes_output_path / "full_prompt.txt"
             with open(prompt_path, "w", encoding="utf-8") as f:
                 f.write(prompt)
             
             # 检查API客户端是否可用
-            if not self.api_client:
+            if not self.client.is_available():
                 yield {"type": "error", "content": "API客户端不可用"}
                 return
-            
-            # 流式生成
-            md_file_path = notes_output_path / "notes.md"
-            
+
+            model = self.client.config.default_model
+            mode = (mode or self.client.config.notes_generation_mode).lower()
+            if mode == "outline":
+                outline_prompt = NOTE_OUTLINE_PROMPT + images_section + text_content
+                if estimate_tokens(outline_prompt) <= budget_for_prompt(model, self.NOTE_OUTLINE_MAX_TOKENS):
+                    yield from self._generate_notes_outlined(text_content, images_info, notes_output_path, model)
+                    return
+                # 大纲阶段需要通读全文，放不下时退回分块生成
+                logger.warning("文档超出大纲阶段的预算，改用分块生成")
+                mode = "chunked"
+            if mode == "chunked" or (mode == "auto" and estimate_tokens(prompt) > self.client.config.notes_chunk_tokens):
+                yield from self._generate_notes_chunked(text_content, images_info, notes_output_path, model)
+                return
+
+            # 提示词超出上下文窗口时裁剪文本内容，避免请求在长时间等待后失败
+            prompt_budget = budget_for_prompt(model, self.NOTE_OUTPUT_RESERVE_TOKENS)
+            prompt_tokens = estimate_tokens(prompt)
+            if prompt_tokens > prompt_budget:
+                overhead = prompt_tokens - estimate_tokens(text_content)
+                text_content = trim_to_token_budget(text_content, max(prompt_budget - overhead, 0))
+                prompt = self.SYSTEM_PROMPT + images_section + "\n\n文本内容:\n" + text_content
+                logger.warning(f"笔记提示词约{prompt_tokens}个token，超出预算{prompt_budget}，已裁剪文本内容")
+                yield {"type": "start", "content": "文档内容较长，已截取可处理的部分生成笔记..."}
+
             yield {"type": "start", "content": "开始生成笔记..."}
-            
+            yield from self._stream_notes_to_file(
+                [{"role": "user", "content": prompt}], notes_output_path, model
+            )
+                
+        except Exception as e:
+            yield {"type": "error", "content": f"笔记生成失败: {str(e)}"}
+
+    @staticmethod
+    def create_output_dir(output_dir: str) -> Path:
+        """创建以时间戳命名的输出目录，同一秒内重复创建时追加序号，避免覆盖已有笔记"""
+        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        notes_output_path = Path(output_dir) / timestamp
+        suffix = 1
+        while True:
+            try:
+                notes_output_path.mkdir()
+                return notes_output_path
+            except FileExistsError:
+                suffix += 1
+                notes_output_path = Path(output_dir) / f"{timestamp}-{suffix}"
+
+    def _build_images_section(self, images_info: List[Dict[str, str]]) -> str:
+        """构建提示词中的图片信息部分"""
+        if not images_info:
+            return ""
+        images_section = "\n\n可用图片信息：\n"
+        for i, img in enumerate(images_info, 1):
+            images_section += f"{i}. 页面{img['page']} - 路径: {img['rel_path']}\n"
+            images_section += f"   描述: {img['caption']}\n"
+        return images_section
+
+    def _stream_notes_to_file(self, messages: List[Dict[str, Any]], notes_output_path: Path, model: str):
+        """
+        流式生成并写入 notes.md，结束后生成目录并产出 complete 事件。
+        流中途出错或因 finish_reason=length 截断时，以最后一个标题为检查点：
+        丢弃检查点之后可能不完整的内容（产出 rewind 事件），附上已完成部分的标题大纲续写，
+        最多续写 NOTES_MAX_CONTINUATIONS 次，complete 事件中记录续写次数
+        """
+        md_file_path = notes_output_path / "notes.md"
+        config = self.client.config
+        written = ""
+        continuations = 0
+        request_messages = messages
+        stitcher = None
+        while True:
             try:
-                stream = self.api_client.client.chat.completions.create(
-                    model=self.api_client.default_model,
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=50000,
+                max_tokens = plan_request(request_messages, None, model, label="笔记生成")
+            except PromptTooLargeError as e:
+                yield {"type": "error", "content": str(e)}
+                return
+
+            parts: List[str] = []
+            finish_reason = None
+            failure = None
+            try:
+                stream = self.client.stream_chat(
+                    request_messages,
+                    model=model,
+                    max_tokens=max_tokens,
                     temperature=0.5,
-                    timeout=300,  # 增加到5分钟
-                    stream=True,
-                    stream_options={"include_usage": True}
+                    timeout=self.NOTE_REQUEST_TIMEOUT
                 )
-                
-                with open(md_file_path, "w", encoding="utf-8") as f:
-                    for chunk in stream:
-                        content_piece = None
-                        if hasattr(chunk, "choices") and chunk.choices:
-                            delta = chunk.choices[0].delta
-                            if hasattr(delta, "content") and delta.content is not None:
-                                content_piece = delta.content
-                            elif isinstance(delta, dict) and "content" in delta and delta["content"] is not None:
-                                content_piece = delta["content"]
-                        
-                        if content_piece:
-                            f.write(content_piece)
-                            f.flush()
-                            yield {"type": "content", "content": content_piece}
-                
-                # 生成目录文件
-                toc_content = self._generate_table_of_contents(str(md_file_path))
-                toc_file_path = notes_output_path / "contents.md"
-                with open(toc_file_path, "w", encoding="utf-8") as f:
-                    f.write(toc_content)
-
-                yield {
-                    "type": "complete",
-                    "content": "笔记生成完成！",
-                    "file_path": str(md_file_path),
-                    "output_dir": str(notes_output_path),
-                    "toc_file_path": str(toc_file_path),
-                    "toc_content": toc_content
-                }
-                
+
+                # 增量按阈值合并后再落盘和推送，避免每个token一次写入和一帧
+                try:
+                    with BufferedTextWriter(
+                        md_file_path,
+                        flush_interval=config.notes_flush_interval_ms / 1000,
+                        flush_bytes=config.notes_flush_bytes,
+                        mode="a" if written else "w"
+                    ) as writer:
+                        for event in coalesce_deltas(
+                            stream,
+                            interval=config.notes_frame_interval_ms / 1000,
+                            max_bytes=config.notes_frame_max_bytes
+                        ):
+                            if event["type"] == "content":
+                                # 续写时先过滤开头重复的已完成章节
+                                text = stitcher.feed(event["content"]) if stitcher else event["content"]
+                                if text:
+                                    writer.write(text)
+                                    parts.append(text)
+                                    yield {"type": "content", "content": text}
+                            elif event["type"] == "usage":
+                                logger.info(f"笔记生成token用量: {event}")
+                            elif event["type"] == "finish":
+                                finish_reason = event["finish_reason"]
+                        tail = stitcher.finish() if stitcher else ""
+                        if tail:
+                            writer.write(tail)
+                            parts.append(tail)
+                            yield {"type": "content", "content": tail}
+                finally:
+                    # 任务取消时本生成器被提前关闭，同时关闭上游模型流
+                    stream.close()
             except Exception as e:
-                yield {"type": "error", "content": f"API调用失败: {str(e)}"}
-                
+                failure = e
+
+            if failure is None and finish_reason != "length":
+                break
+            if continuations >= config.notes_max_continuations:
+                if failure is not None:
+                    yield {"type": "error", "content": f"API调用失败: {str(failure)}"}
+                    return
+                logger.warning(f"笔记续写{continuations}次后仍达到输出上限，保留截断的笔记")
+                break
+
+            # 以最后一个标题为检查点，丢弃其后可能不完整的内容
+            text = written + "".join(parts)
+            checkpoint, heading = find_checkpoint(text)
+            written, discarded = text[:checkpoint], text[checkpoint:]
+            with open(md_file_path, "w", encoding="utf-8") as f:
+                f.write(written)
+            if discarded:
+                yield {"type": "rewind", "content": discarded}
+
+            continuations += 1
+            reason = "笔记输出达到长度上限" if failure is None else f"笔记生成中断（{str(failure)}）"
+            logger.warning(f"{reason}，第{continuations}次续写，检查点: {heading or '开头'}")
+            if checkpoint == 0:
+                # 还没有完整的章节，重新生成
+                request_messages, stitcher = messages, None
+                yield {"type": "start", "content": f"{reason}，正在重新生成..."}
+                continue
+            headings = completed_headings(written)
+            request_messages = messages[:-1] + [{
+                "role": messages[-1]["role"],
+                "content": messages[-1]["content"] + NOTE_CONTINUATION_PROMPT.format(
+                    outline="\n".join(headings), heading=heading
+                )
+            }]
+            stitcher = HeadingStitcher(headings)
+            yield {"type": "start", "content": f"{reason}，正在从“{heading.lstrip('#').strip()}”继续生成..."}
+
+        if continuations:
+            logger.info(f"笔记生成完成，共续写{continuations}次")
+        complete = self._finalize_notes(md_file_path, notes_output_path)
+        complete["continuations"] = continuations
+        yield complete
+
+    def _finalize_notes(self, md_file_path: Path, notes_output_path: Path) -> Dict[str, Any]:
+        """生成目录文件，返回 complete 事件"""
+        toc_content = self._generate_table_of_contents(str(md_file_path))
+        toc_file_path = notes_output_path / "contents.md"
+        with open(toc_file_path, "w", encoding="utf-8") as f:
+            f.write(toc_content)
+
+        return {
+            "type": "complete",
+            "content": "笔记生成完成！",
+            "file_path": str(md_file_path),
+            "output_dir": str(notes_output_path),
+            "toc_file_path": str(toc_file_path),
+            "toc_content": toc_content
+        }
+
+    def _split_into_chunks(self, text_content: str) -> List[str]:
+        """按“=== 第N页 ===”切分页面，再按token预算合并为若干块"""
+        pages = [page for page in re.split(r'(?m)^(?==== 第.+?页 ===$)', text_content) if page.strip()]
+        groups = split_by_token_budget(pages, self.client.config.notes_chunk_tokens)
+        return ["\n\n".join(page.strip() for page in group) for group in groups]
+
+    def _chunk_images_section(self, chunk: str, images_info: List[Dict[str, str]]) -> str:
+        """只保留出现在该块页面中的图片"""
+        pages = set(re.findall(r'(?m)^=== 第(.+?)页 ===$', chunk))
+        return self._build_images_section([img for img in images_info if img['page'] in pages])
+
+    def _generate_chunk_notes(self, index: int, total: int, chunk: str, images_info: List[Dict[str, str]], model: str) -> str:
+        """生成单个分块的部分笔记"""
+        prompt = (
+            NOTE_CHUNK_GENERATION_PROMPT.format(index=index, total=total)
+            + self.SYSTEM_PROMPT
+            + self._chunk_images_section(chunk, images_info)
+            + "\n\n文本内容:\n" + chunk
+        )
+        return self.client.chat_completion(
+            [{"role": "user", "content": prompt}],
+            model=model,
+            max_tokens=self.client.config.notes_chunk_output_tokens,
+            temperature=0.5,
+            timeout=self.NOTE_REQUEST_TIMEOUT
+        )
+
+    def _generate_notes_chunked(self, text_content: str, images_info: List[Dict[str, str]], notes_output_path: Path, model: str):
+        """
+        长文档 map-reduce 生成：
+        map 阶段并发为每个分块生成部分笔记，reduce 阶段合并为统一标题层级的完整笔记
+        """
+        chunks = self._split_into_chunks(text_content)
+        total = len(chunks)
+        logger.info(f"长文档分块生成笔记: {total}个分块")
+        yield {"type": "start", "content": f"文档较长，已分为{total}个部分并行生成笔记..."}
+
+        partial_notes: List[Optional[str]] = [None] * total
+        tasks = [
+            (lambda index=index, chunk=chunk: self._generate_chunk_notes(index + 1, total, chunk, images_info, model))
+            for index, chunk in enumerate(chunks)
+        ]
+        done = 0
+        for index, result, error in self._run_parallel(tasks, "notes-chunk"):
+            if error is not None:
+                yield {"type": "error", "content": f"第{index + 1}部分笔记生成失败: {str(error)}"}
+                return
+            partial_notes[index] = result.strip()
+            done += 1
+            yield {"type": "start", "content": f"已完成{done}/{total}个部分的笔记..."}
+
+        partials_path = notes_output_path / "partial_notes.md"
+        with open(partials_path, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(partial_notes))
+
+        merge_prompt = NOTE_MERGE_PROMPT + "\n\n".join(
+            f"【第{index}部分】\n{notes}" for index, notes in enumerate(partial_notes, 1)
+        )
+        if estimate_tokens(merge_prompt) <= budget_for_prompt(model, self.NOTE_OUTPUT_RESERVE_TOKENS):
+            yield {"type": "start", "content": "正在合并各部分笔记并统一标题..."}
+            yield from self._stream_notes_to_file(
+                [{"role": "user", "content": merge_prompt}], notes_output_path, model
+            )
+            return
+
+        # 部分笔记总量超出单次合并的预算时，直接按顺序拼接并统一标题层级
+        logger.warning("部分笔记总量超出合并预算，使用本地拼接")
+        merged = self._merge_partial_notes_locally(partial_notes)
+        md_file_path = notes_output_path / "notes.md"
+        with open(md_file_path, "w", encoding="utf-8") as f:
+            f.write(merged)
+        yield {"type": "content", "content": merged}
+        yield self._finalize_notes(md_file_path, notes_output_path)
+
+    def _run_parallel(self, tasks: List[Callable[[], str]], thread_name_prefix: str):
+        """
+        并发执行任务，按完成顺序产出 (序号, 结果, 异常)。
+        某个任务失败时取消尚未开始的任务，产出该失败后结束。
+        调用方提前关闭生成器（任务取消、客户端断开）时同样取消尚未开始的任务，且不等待进行中的调用结束。
+        """
+        workers = max(1, min(len(tasks), self.client.config.async_max_concurrency))
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=thread_name_prefix)
+        finished = False
+        try:
+            futures = {executor.submit(task): index for index, task in enumerate(tasks)}
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    for pending in futures:
+                        pending.cancel()
+                    yield index, None, e
+                    return
+                yield index, result, None
+            finished = True
+        finally:
+            # 正常结束时所有任务已完成；提前结束时丢弃排队中的任务，进行中的调用在后台结束后释放线程
+            executor.shutdown(wait=finished, cancel_futures=True)
+
+    @staticmethod
+    def _parse_outline(outline: str) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        解析大纲，返回 (一级标题, 章节列表)。
+        每个章节包含 heading（不含页码的二级标题）、outline（二级及其下的三级标题）和 pages（起止页码或None）
+        """
+        title = ""
+        sections: List[Dict[str, Any]] = []
+        for line in outline.split("\n"):
+            stripped = line.strip()
+            if stripped.startswith("# ") and not title:
+                title = stripped[2:].strip()
+            elif stripped.startswith("## "):
+                pages = None
+                match = re.search(r'【页码[:：]\s*(\d+)\s*(?:[-~—–至]\s*(\d+))?\s*】', stripped)
+                if match:
+                    start = int(match.group(1))
+                    end = int(match.group(2) or start)
+                    pages = (min(start, end), max(start, end))
+                    stripped = (stripped[:match.start()] + stripped[match.end():]).strip()
+                sections.append({"heading": stripped, "outline": [stripped], "pages": pages})
+            elif stripped.startswith("### ") and sections:
+                sections[-1]["outline"].append(stripped)
+
+        for section in sections:
+            section["outline"] = "\n".join(section["outline"])
+        return title or "学习笔记", sections
+
+    def _section_source(self, text_content: str, pages: Optional[Tuple[int, int]]) -> str:
+        """取出章节标注页码范围内的原文，没有标注或范围内无内容时使用全文"""
+        if pages is None:
+            return text_content
+        selected = []
+        for block in re.split(r'(?m)^(?==== 第.+?页 ===$)', text_content):
+            match = re.match(r'=== 第(\d+)页 ===', block)
+            if match and pages[0] <= int(match.group(1)) <= pages[1]:
+                selected.append(block.strip())
+        return "\n\n".join(selected) if selected else text_content
+
+    def _expand_section(self, title: str, outline: str, section: Dict[str, Any], text_content: str,
+                        images_info: List[Dict[str, str]], model: str) -> str:
+        """按大纲展开单个二级章节"""
+        source = self._section_source(text_content, section["pages"])
+        prompt = (
+            NOTE_SECTION_EXPAND_PROMPT.format(title=title, outline=outline, section_outline=section["outline"])
+            + self.SYSTEM_PROMPT
+            + self._chunk_images_section(source, images_info)
+            + "\n\n文本内容:\n" + source
+        )
+        content = self.client.chat_completion(
+            [{"role": "user", "content": prompt}],
+            model=model,
+            max_tokens=self.client.config.notes_chunk_output_tokens,
+            temperature=0.5,
+            timeout=self.NOTE_REQUEST_TIMEOUT
+        ).strip()
+
+        # 统一章节格式：一级标题降为二级，缺少章节标题时补上
+        lines = ["#" + line if line.startswith("# ") else line for line in content.split("\n")]
+        content = "\n".join(lines).strip()
+        if not content.startswith("## "):
+            content = section["heading"] + "\n\n" + content
+        return content
+
+    def _generate_notes_outlined(self, text_content: str, images_info: List[Dict[str, str]], notes_output_path: Path, model: str):
+        """
+        先大纲后展开：一次快速调用生成标题大纲，再为每个二级章节并发展开，
+        章节完成即推送 section 事件，全部完成后按大纲顺序拼接为 notes.md
+        """
+        yield {"type": "start", "content": "正在生成笔记大纲..."}
+        try:
+            outline_text = self.client.chat_completion(
+                [{"role": "user", "content": NOTE_OUTLINE_PROMPT + self._build_images_section(images_info) + text_content}],
+                model=model,
+                max_tokens=self.NOTE_OUTLINE_MAX_TOKENS,
+                temperature=0.3,
+                timeout=self.NOTE_REQUEST_TIMEOUT
+            )
         except Exception as e:
-            yield {"type": "error", "content": f"笔记生成失败: {str(e)}"}
+            yield {"type": "error", "content": f"笔记大纲生成失败: {str(e)}"}
+            return
+
+        title, sections = self._parse_outline(outline_text)
+        if not sections:
+            logger.warning("未能从大纲中解析出章节，改为一次性生成")
+            yield {"type": "start", "content": "大纲解析失败，改为一次性生成笔记..."}
+            prompt = self.SYSTEM_PROMPT + self._build_images_section(images_info) + "\n\n文本内容:\n" + text_content
+            yield from self._stream_notes_to_file(
+                [{"role": "user", "content": prompt}], notes_output_path, model
+            )
+            return
+
+        outline = "\n\n".join(section["outline"] for section in sections)
+        with open(notes_output_path / "outline.md", "w", encoding="utf-8") as f:
+            f.write(f"# {title}\n\n{outline}\n")
+
+        total = len(sections)
+        logger.info(f"按大纲并行展开笔记: {total}个章节")
+        yield {"type": "start", "content": f"大纲已生成，共{total}个章节，正在并行展开..."}
+
+        section_notes: List[Optional[str]] = [None] * total
+        tasks = [
+            (lambda section=section: self._expand_section(title, outline, section, text_content, images_info, model))
+            for section in sections
+        ]
+        for index, result, error in self._run_parallel(tasks, "notes-section"):
+            if error is not None:
+                yield {"type": "error", "content": f"章节“{sections[index]['heading'][3:]}”生成失败: {str(error)}"}
+                return
+            section_notes[index] = result
+            yield {
+                "type": "section",
+                "index": index,
+                "total": total,
+                "title": title,
+                "content": result
+            }
+
+        md_file_path = notes_output_path / "notes.md"
+        with open(md_file_path, "w", encoding="utf-8") as f:
+            f.write(f"# {title}\n\n" + "\n\n".join(section_notes) + f"\n\n{self.NOTES_WATERMARK}\n")
+        yield self._finalize_notes(md_file_path, notes_output_path)
+
+    @staticmethod
+    def _merge_partial_notes_locally(partial_notes: List[str]) -> str:
+        """本地合并部分笔记：一级标题降为二级，去掉重复的二级标题"""
+        merged_lines = ["# 学习笔记", ""]
+        seen_headings = set()
+        for notes in partial_notes:
+            for line in notes.split("\n"):
+                stripped = line.strip()
+                if stripped.startswith("# "):
+                    line = "#" + stripped
+                    stripped = line
+                if stripped.startswith("## "):
+                    if stripped in seen_headings:
+                        continue
+                    seen_headings.add(stripped)
+                merged_lines.append(line)
+            merged_lines.append("")
+        merged_lines.append(NoteGenerator.NOTES_WATERMARK)
+        return "\n".join(merged_lines)
 
     def _generate_table_of_contents(self, md_file_path: str) -> str:
         """从Markdown文件生成目录"""
@@ -215,84 +648,73 @@ class NoteGenerator:
         except Exception as e:
             return f'# 📚 笔记目录\n\n生成目录时出错: {str(e)}'
 
+    def _iter_source_items(self, source: "NoteSource") -> Iterator[Dict[str, Any]]:
+        """
+        把笔记来源统一为解析条目流：路径逐个流式读取，条目原样产出。
+        每个路径是一个独立的文档，前后以 DOCUMENT_BOUNDARY 分隔，各文档的页不会按页码交错合并。
+        """
+        if isinstance(source, (str, os.PathLike)):
+            yield from iter_json_array(source)
+            return
+        started = False
+        for entry in source:
+            if isinstance(entry, (str, os.PathLike)):
+                if started:
+                    yield DOCUMENT_BOUNDARY
+                yield from iter_json_array(entry)
+                yield DOCUMENT_BOUNDARY
+                started = False
+            else:
+                started = True
+                yield entry
+
     def _extract_text_from_json(self, json_file_path: str, md_dir: str = None) -> Dict[str, Any]:
         """从JSON文件中提取文本内容和图片信息"""
-        try:
-            with open(json_file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-
-            if not isinstance(data, list):
-                raise ValueError("JSON文件格式不正确，应该是一个数组")
-
-            pages_text: Dict[str, List[str]] = {}
-            pages_figures: Dict[str, List[str]] = {}
-            images_info: List[Dict[str, str]] = []
-
-            for item in data:
-                if not isinstance(item, dict):
-                    continue
-
-                if item.get("type") == "text" and "content" in item:
-                    page = str(item.get("page", "unknown"))
-                    content = item.get("content", "").strip()
-                    if content:
-                        if page not in pages_text:
-                            pages_text[page] = []
-                        pages_text[page].append(content)
-
-                elif item.get("type") == "figure" and "path" in item:
-                    page = str(item.get("page", "unknown"))
-                    abs_path = item.get("path", "")
-                    caption = item.get("caption", "")
-
-                    # 生成相对于md文件的路径
-                    rel_path = abs_path
-                    if md_dir and os.path.isabs(abs_path):
-                        rel_path = os.path.relpath(abs_path, md_dir).replace("\\", "/")
-
-                    # 对于用户特定路径，需要特殊处理
-                    # 如果路径包含 media/用户ID/uploads，转换为相对路径
-                    if "media" in rel_path and "uploads" in rel_path:
-                        # 提取 uploads 后面的部分
-                        uploads_index = rel_path.find("uploads")
-                        if uploads_index != -1:
-                            # 从 uploads 开始的路径部分
-                            uploads_part = rel_path[uploads_index:]
-                            # 生成相对于笔记输出目录的路径
-                            rel_path = f"../../{uploads_part}"
-
-                    images_info.append({"page": page, "abs_path": abs_path, "rel_path": rel_path, "caption": caption})
-                    if page not in pages_figures:
-                        pages_figures[page] = []
-                    pages_figures[page].append(f"[图片] 路径: {rel_path}\n描述: {caption}")
-
-            def page_sort_key(page_str):
-                try:
-                    return int(page_str)
-                except (ValueError, TypeError):
-                    return float('inf')
-
-            organized_text = []
-            all_pages = set(list(pages_text.keys()) + list(pages_figures.keys()))
-            for page in sorted(all_pages, key=page_sort_key):
-                page_content = "\n".join(pages_text.get(page, []))
-                page_figures = "\n".join(pages_figures.get(page, []))
-                if page_content:
-                    page_content = page_content.strip()
-                if page_figures:
-                    page_figures = page_figures.strip()
-                page_sections = []
-                if page_content:
-                    page_sections.append(page_content)
-                if page_figures:
-                    page_sections.append(page_figures)
-                if page_sections:
-                    page_text = f"=== 第{page}页 ===\n" + "\n\n".join(page_sections)
-                    organized_text.append(page_text)
-
-            return {
-                "text_content": "\n\n".join(organized_text),
-                "images_info": images_info
-            }
-        except Exception as e:
-            raise e
+        return self._extract_text(iter_json_array(json_file_path), md_dir)
+
+    def _extract_text(self, items: Iterable[Dict[str, Any]], md_dir: str = None) -> Dict[str, Any]:
+        """从解析条目中提取文本内容和图片信息，按页流式组装，不再保留整份条目数组"""
+        images_info: List[Dict[str, str]] = []
+
+        def describe_figure(item: Dict[str, Any], page: str) -> str:
+            abs_path = item.get("path", "")
+            caption = item.get("caption", "")
+
+            # 生成相对于md文件的路径
+            rel_path = abs_path
+            if md_dir and os.path.isabs(abs_path):
+                rel_path = os.path.relpath(abs_path, md_dir).replace("\\", "/")
+
+            # 对于用户特定路径，需要特殊处理
+            # 如果路径包含 media/用户ID/uploads，转换为相对路径
+            if "media" in rel_path and "uploads" in rel_path:
+                # 提取 uploads 后面的部分
+                uploads_index = rel_path.find("uploads")
+                if uploads_index != -1:
+                    # 从 uploads 开始的路径部分
+                    uploads_part = rel_path[uploads_index:]
+                    # 生成相对于笔记输出目录的路径
+                    rel_path = f"../../{uploads_part}"
+
+            images_info.append({"page": page, "abs_path": abs_path, "rel_path": rel_path, "caption": caption})
+            return f"[图片] 路径: {rel_path}\n描述: {caption}"
+
+        pages = PageAssembler(describe_figure).iter_pages(items)
+        report = None
+        if self.client.config.notes_compaction_enabled:
+            # 去除页眉页脚、页码和近重复段落后再组装提示词；逐页处理，只缓存识别页眉页脚用的开头几页
+            report = CompactionReport()
+            pages = self.compactor.iter_compact(pages, report)
+
+        page_blocks = (format_page(page, texts, figures) for page, texts, figures in pages)
+        text_content = "\n\n".join(block for block in page_blocks if block)
+        if report:
+            logger.info(
+                f"文本压缩: {report.tokens_before} -> {report.tokens_after} token（节省{report.tokens_saved}），"
+                f"删除重复行{report.boilerplate_lines}行、近重复段落{report.duplicate_paragraphs}段"
+            )
+        return {
+            "text_content": text_content,
+            "images_info": images_info,
+            "compaction": report.to_dict() if report else None
+        }
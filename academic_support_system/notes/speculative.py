@@ -0,0 +1,73 @@
+"""
+文件解析完成后预先生成笔记
+
+原流程在解析完成后等待用户在聊天中回复"是"才开始生成笔记。开启 NOTES_SPECULATIVE_ENABLED 后，
+解析完成即以低优先级提交 generate_notes 任务：
+- 用户确认时 enqueue_or_join 会加入这个任务并把优先级提升为正常
+- 任务已经完成时，新任务命中增量生成的"文档均未变化"分支，直接返回已有笔记，不再调用模型
+- 每用户每小时、全站每小时的预先生成次数有上限，游客（用户ID为0，共用上传目录）不预先生成
+"""
+import logging
+from datetime import timedelta
+from typing import Optional
+
+from django.utils import timezone
+
+from core.api_config import api_config
+from core.jobs import JobQueue, job_queue
+from core.models import Job
+
+logger = logging.getLogger(__name__)
+
+
+class SpeculativeNotePolicy:
+    """预先生成笔记的开关与次数限制"""
+
+    def __init__(self, queue: JobQueue = None, enabled: bool = None,
+                 per_user_hour: int = None, per_hour: int = None):
+        self.queue = queue or job_queue
+        self.enabled = api_config.notes_speculative_enabled if enabled is None else enabled
+        self.per_user_hour = api_config.notes_speculative_per_user_hour if per_user_hour is None else per_user_hour
+        self.per_hour = api_config.notes_speculative_per_hour if per_hour is None else per_hour
+
+    def skip_reason(self, owner_id: int) -> Optional[str]:
+        """返回不预先生成的原因，允许时返回None"""
+        if not self.enabled:
+            return '未开启预先生成'
+        if not owner_id:
+            return '游客不预先生成'
+        since = timezone.now() - timedelta(hours=1)
+        # 按任务参数中的标记计数，被用户确认（优先级已提升）的预先生成任务同样计入
+        if self.queue.count_recent('generate_notes', since, owner_id=owner_id,
+                                   payload__speculative=True) >= self.per_user_hour:
+            return '已达到每用户每小时的预先生成上限'
+        if self.queue.count_recent('generate_notes', since, payload__speculative=True) >= self.per_hour:
+            return '已达到每小时的预先生成上限'
+        return None
+
+    def maybe_enqueue(self, owner_id: int, upload_dir: str, output_dir: str) -> Optional[Job]:
+        """满足策略时提交低优先级的笔记生成任务"""
+        reason = self.skip_reason(owner_id)
+        if reason:
+            logger.info(f"跳过预先生成笔记(用户{owner_id}): {reason}")
+            return None
+        # 已有进行中的笔记生成时不再提交：排队中的任务执行时会读取最新的文档，
+        # 运行中的任务结束后，用户确认时只需增量生成新文档
+        job, created = self.queue.enqueue_or_join(
+            'generate_notes',
+            owner_id=owner_id,
+            payload={'upload_dir': upload_dir, 'output_dir': output_dir, 'speculative': True},
+            progress={'status': 'queued', 'message': '正在后台预先生成笔记...'},
+            # 预先生成失败不自动重试，避免在用户未确认时重复消耗
+            max_attempts=1,
+            priority=Job.PRIORITY_SPECULATIVE
+        )
+        if not created:
+            logger.info(f"跳过预先生成笔记(用户{owner_id}): 已有进行中的笔记生成任务 {job.id}")
+            return None
+        logger.info(f"已提交预先生成笔记任务: {job.id} (用户{owner_id})")
+        return job
+
+
+# 全局预先生成策略
+speculative_notes = SpeculativeNotePolicy()
@@ -37,6 +37,7 @@ urlpatterns = [
     path('api/notes/stream/', views.stream_notes_content, name='stream_notes_content'),
     path('api/notes/simple-stream/', views.simple_stream_test, name='simple_stream_test'),
     path('api/notes/ai-chat/', views.ai_chat_with_notes, name='ai_chat_with_notes'),
+    path('api/notes/ai-chat/stream/', views.ai_chat_with_notes_stream, name='ai_chat_with_notes_stream'),
     path('api/notes/export/', views.export_notes, name='export_notes'),
     path('api/notes/export-test/', test_export_view, name='test_export'),
     path('api/notes/sections/', views.get_note_sections, name='get_note_sections'),
@@ -1,6 +1,6 @@
 import os
 import json
-import threading
+import logging
 from django.http import JsonResponse, StreamingHttpResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.decorators import api_view
@@ -8,6 +8,14 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.conf import settings
 from .note_generator import NoteGenerator
+from .incremental import IncrementalNoteBuilder, find_parsed_documents
+from core.jobs import JobCancelled, job_queue
+from core.models import Job
+from core.event_log import event_logs, format_event_id, parse_event_id
+from core.api_config import api_config
+from core.streaming import DISCONNECT_CANCEL, sse_event, sse_response
+
+logger = logging.getLogger(__name__)
 
 # 导入集中管理的提示词
 try:
@@ -15,9 +23,6 @@ try:
 except ImportError:
     CHAT_ASSISTANT_PROMPT = "你是一个学术助手，请基于提供的笔记内容回答用户问题。"
 
-# 全局变量存储笔记生成状态
-note_generation_status = {}
-
 def get_user_id(request):
     """获取用户ID，未登录返回0"""
     if request and hasattr(request, 'user') and request.user.is_authenticated:
@@ -49,255 +54,241 @@ def start_note_generation(request):
             return JsonResponse({'success': False, 'error': '没有找到上传的文件'}, status=400)
 
         # 查找所有解析后的JSON文件
-        json_files = []
-        for item in os.listdir(upload_dir):
-            item_path = os.path.join(upload_dir, item)
-            if os.path.isdir(item_path):
-                # 查找目录中的JSON文件
-                for file in os.listdir(item_path):
-                    if file.endswith('.json'):
-                        json_path = os.path.join(item_path, file)
-                        json_files.append({
-                            'name': file,
-                            'path': json_path,
-                            'folder': item
-                        })
+        json_files = find_parsed_documents(upload_dir)
 
         if not json_files:
             return JsonResponse({'success': False, 'error': '没有找到已解析的文件'}, status=400)
 
-        # 设置生成状态
-        note_generation_status['current'] = {
-            'status': 'preparing',
-            'message': '正在准备生成笔记...',
-            'files': json_files
-        }
+        # 笔记生成交给后台任务队列，负载高时排队执行；已有进行中的生成时直接加入
+        job, created = job_queue.enqueue_or_join(
+            'generate_notes',
+            owner_id=user_id,
+            payload={'upload_dir': upload_dir, 'output_dir': get_user_output_path(user_id)},
+            progress={'status': 'preparing', 'message': '正在准备生成笔记...', 'files': [f['name'] for f in json_files]}
+        )
 
-        # 异步生成笔记
-        def generate_notes():
-            try:
-                generator = NoteGenerator()
-
-                # 合并所有JSON文件的内容
-                all_content = []
-                for json_file in json_files:
-                    try:
-                        with open(json_file['path'], 'r', encoding='utf-8') as f:
-                            content = json.load(f)
-                            if isinstance(content, list):
-                                all_content.extend(content)
-                    except Exception as e:
-                        print(f"读取文件 {json_file['path']} 失败: {e}")
-
-                if not all_content:
-                    note_generation_status['current'] = {
-                        'status': 'error',
-                        'message': '没有找到有效的文件内容'
-                    }
-                    return
+        return JsonResponse({
+            'success': True,
+            'message': f'找到 {len(json_files)} 个已解析的文件，正在开始生成笔记...' if created else '笔记正在生成中，已加入当前任务...',
+            'files': [f['name'] for f in json_files],
+            'job_id': str(job.id),
+            'joined': not created
+        })
 
-                # 创建临时合并文件
-                temp_json_path = os.path.join(upload_dir, 'merged_content.json')
-                with open(temp_json_path, 'w', encoding='utf-8') as f:
-                    json.dump(all_content, f, ensure_ascii=False, indent=2)
-
-                # 开始流式生成
-                note_generation_status['current'] = {
-                    'status': 'generating',
-                    'message': '正在生成笔记...',
-                    'content': ''
-                }
-
-                print("[DEBUG] 开始调用笔记生成器")  # 调试信息
-
-                # 使用用户特定的输出目录
-                user_output_dir = get_user_output_path(user_id)
-
-                for chunk in generator.generate_notes_streaming(temp_json_path, user_output_dir):
-                    print(f"[DEBUG] 收到chunk: {chunk['type']}")  # 调试信息
-
-                    if chunk['type'] == 'start':
-                        note_generation_status['current'] = {
-                            'status': 'generating',
-                            'message': chunk['content'],
-                            'content': ''
-                        }
-                    elif chunk['type'] == 'content':
-                        # 累积内容
-                        current_status = note_generation_status.get('current', {})
-                        current_content = current_status.get('content', '')
-                        current_content += chunk['content']
-
-                        note_generation_status['current'] = {
-                            'status': 'generating',
-                            'message': '正在生成笔记...',
-                            'content': current_content,
-                            'chunk': chunk['content']  # 新增的内容块
-                        }
-                        print(f"[DEBUG] 内容长度: {len(current_content)}")  # 调试信息
-
-                    elif chunk['type'] == 'complete':
-                        final_content = note_generation_status.get('current', {}).get('content', '')
-                        note_generation_status['current'] = {
-                            'status': 'completed',
-                            'message': '笔记生成完成！您可以在右侧查看生成的笔记。有什么问题吗？',
-                            'content': final_content,
-                            'file_path': chunk['file_path'],
-                            'output_dir': chunk['output_dir']
-                        }
-                        print(f"[DEBUG] 笔记生成完成，最终内容长度: {len(final_content)}")
-                        break
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': f'启动笔记生成失败：{str(e)}'}, status=500)
 
-                    elif chunk['type'] == 'error':
-                        note_generation_status['current'] = {
-                            'status': 'error',
-                            'message': f'笔记生成失败：{chunk["content"]}'
-                        }
-                        print(f"[DEBUG] 笔记生成错误: {chunk['content']}")
-                        break
+def note_event_frame(chunk):
+    """把 NoteGenerator 产出的事件转换为前端使用的SSE帧"""
+    if chunk['type'] == 'start':
+        return {'type': 'start', 'message': chunk['content']}
+    if chunk['type'] == 'content':
+        return {'type': 'content', 'content': chunk['content']}
+    if chunk['type'] == 'section':
+        # 先大纲后展开模式：章节完成即推送，index 为该章节在大纲中的位置
+        return chunk
+    if chunk['type'] == 'rewind':
+        # 断点续写：前端从已收到的内容末尾删除这段不完整的内容
+        return {'type': 'rewind', 'content': chunk['content']}
+    if chunk['type'] == 'complete':
+        return {
+            'type': 'complete',
+            'message': chunk['content'],
+            'file_path': chunk.get('file_path', ''),
+            'output_dir': chunk.get('output_dir', ''),
+            'toc_content': chunk.get('toc_content', ''),
+            'toc_file_path': chunk.get('toc_file_path', ''),
+            'continuations': chunk.get('continuations', 0)
+        }
+    if chunk['type'] == 'error':
+        return {'type': 'error', 'message': chunk['content']}
+    return None
 
-                # 清理临时文件
-                try:
-                    os.remove(temp_json_path)
-                except:
-                    pass
+def run_note_generation_job(context):
+    """
+    后台任务：为用户上传的文档增量生成笔记。
+    每个SSE帧都写入任务的事件日志，流式接口据此推送并支持断线重连补发。
+    """
+    log = event_logs.get(context.job_id, context.owner_id)
+    finished = False
+    try:
+        if context.attempt > 1:
+            # 重试时通知客户端丢弃上一次未完成的内容
+            log.append({'type': 'reset', 'message': f'正在重新生成笔记（第{context.attempt}次尝试）...'})
 
-            except Exception as e:
-                note_generation_status['current'] = {
-                    'status': 'error',
-                    'message': f'笔记生成失败：{str(e)}'
-                }
+        json_files = find_parsed_documents(context.payload['upload_dir'])
+        if not json_files:
+            raise RuntimeError('没有找到已解析的文件')
 
-        thread = threading.Thread(target=generate_notes)
-        thread.daemon = True
-        thread.start()
-
-        return JsonResponse({
-            'success': True,
-            'message': f'找到 {len(json_files)} 个已解析的文件，正在开始生成笔记...',
-            'files': [f['name'] for f in json_files]
-        })
+        print("[DEBUG] 开始调用笔记生成器")  # 调试信息
+        log.append({'type': 'preparing', 'message': f'找到 {len(json_files)} 个文件，正在准备生成...'})
+        log.append({'type': 'start', 'message': '开始生成笔记，请耐心等待（可能需要1-2分钟）...'})
+        context.update({'status': 'generating', 'message': '正在生成笔记...'}, force=True)
 
+        # 只为新增或变化的文档生成笔记
+        builder = IncrementalNoteBuilder(context.payload['output_dir'])
+        content_length = 0
+        events = builder.generate(json_files, mode=context.payload.get('mode'), force=context.payload.get('force', False))
+        try:
+            for chunk in events:
+                context.check_cancelled()
+                if chunk['type'] == 'error':
+                    print(f"[DEBUG] 笔记生成错误: {chunk['content']}")
+                    raise RuntimeError(chunk['content'])
+
+                frame = note_event_frame(chunk)
+                if chunk['type'] == 'complete':
+                    with open(chunk['file_path'], 'r', encoding='utf-8') as f:
+                        final_content = f.read()
+                    context.update({
+                        'status': 'completed',
+                        'message': '笔记生成完成！您可以在右侧查看生成的笔记。有什么问题吗？',
+                        'content': final_content,
+                        'file_path': chunk['file_path'],
+                        'output_dir': chunk['output_dir']
+                    }, force=True)
+                    log.append(frame)
+                    finished = True
+                    print(f"[DEBUG] 笔记生成完成，最终内容长度: {len(final_content)}")
+                    return {'file_path': chunk['file_path'], 'output_dir': chunk['output_dir']}
+
+                if frame is not None:
+                    log.append(frame)
+                if chunk['type'] == 'start':
+                    context.update({'status': 'generating', 'message': chunk['content']}, force=True)
+                elif chunk['type'] in ('content', 'section'):
+                    content_length += len(chunk['content'])
+                    context.update({'status': 'generating', 'message': '正在生成笔记...', 'content_length': content_length})
+                elif chunk['type'] == 'rewind':
+                    content_length -= len(chunk['content'])
+                    context.update({'status': 'generating', 'message': '正在生成笔记...', 'content_length': content_length})
+        finally:
+            events.close()
+
+        raise RuntimeError('生成过程意外结束')
+
+    except JobCancelled:
+        log.append({'type': 'error', 'message': '笔记生成已取消'})
+        finished = True
+        raise
     except Exception as e:
-        return JsonResponse({'success': False, 'error': f'启动笔记生成失败：{str(e)}'}, status=500)
+        if context.will_retry:
+            log.append({'type': 'start', 'message': f'笔记生成失败：{str(e)}，稍后自动重试...'})
+        else:
+            log.append({'type': 'error', 'message': f'笔记生成失败：{str(e)}'})
+            finished = True
+        raise RuntimeError(f'笔记生成失败：{str(e)}')
+    finally:
+        if finished:
+            log.close()
+            logger.info(f"笔记生成任务 {context.job_id} 事件日志统计: {log.stats()}")
+            event_logs.release(context.job_id)
+            event_logs.prune()
 
 @api_view(['GET'])
 def get_note_generation_status(request):
-    """获取笔记生成状态"""
-    if 'current' not in note_generation_status:
-        return Response({'status': 'none', 'message': '暂无笔记生成任务。'})
-    return Response(note_generation_status['current'])
+    """获取笔记生成状态，附带事件日志的缓冲与追赶统计"""
+    status_data = job_queue.latest_status(get_user_id(request), kinds=['generate_notes'])
+    if status_data is None:
+        return Response({'status': 'none', 'message': '暂无笔记生成任务。', 'event_log': event_logs.stats()})
+    return Response({**status_data, 'event_log': event_logs.stats()})
 
 @csrf_exempt
 def stream_notes_content(request):
-    """流式传输笔记内容 - 直接生成模式"""
+    """
+    流式传输笔记内容。
+    生成在后台任务中进行，本接口只订阅任务的事件日志，多个连接共享同一次生成；
+    断线重连时携带 Last-Event-ID（或 last_event_id 参数），补发缺失的帧后继续实时推送。
+    客户端断开按 NOTES_STREAM_DISCONNECT_POLICY 处理。服务器只有在下一次写入失败时才发现断开，
+    模型长时间没有输出时靠保活帧写入，因此最长要经过 SSE_HEARTBEAT_SECONDS 才会处理断开（如取消任务）。
+    """
     print(f"[DEBUG] 收到流式请求: {request.method} {request.path}")
 
     # 在生成器外部获取用户信息
     user_id = get_user_id(request)
     upload_dir = get_user_upload_path(user_id)
-    print(f"[DEBUG] stream_notes - 用户ID: {user_id}")
-    print(f"[DEBUG] stream_notes - 上传目录: {upload_dir}")
-    print(f"[DEBUG] stream_notes - 目录是否存在: {os.path.exists(upload_dir)}")
+    last_event_id = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('last_event_id')
+    print(f"[DEBUG] stream_notes - 用户ID: {user_id}, Last-Event-ID: {last_event_id}")
+
+    policy = api_config.notes_stream_disconnect_policy
 
     def generate():
+        log, events, finished, job_id = None, None, False, None
         try:
-            # 发送连接成功消息
-            yield "data: " + json.dumps({'type': 'connected', 'message': '连接成功，开始生成笔记...'}, ensure_ascii=False) + "\n\n"
-
-            if not os.path.exists(upload_dir):
-                yield "data: " + json.dumps({'type': 'error', 'message': '没有找到上传的文件'}, ensure_ascii=False) + "\n\n"
-                return
-
-            # 查找所有解析后的JSON文件
-            json_files = []
-            for item in os.listdir(upload_dir):
-                item_path = os.path.join(upload_dir, item)
-                if os.path.isdir(item_path):
-                    for file in os.listdir(item_path):
-                        if file.endswith('.json'):
-                            json_path = os.path.join(item_path, file)
-                            json_files.append(json_path)
-                            print(f"[DEBUG] stream_notes - 找到JSON文件: {json_path}")
-
-            print(f"[DEBUG] stream_notes - 总共找到 {len(json_files)} 个JSON文件")
-            if not json_files:
-                yield "data: " + json.dumps({'type': 'error', 'message': '没有找到已解析的文件'}, ensure_ascii=False) + "\n\n"
-                return
-
-            yield "data: " + json.dumps({'type': 'preparing', 'message': f'找到 {len(json_files)} 个文件，正在准备生成...'}, ensure_ascii=False) + "\n\n"
-
-            # 合并所有JSON文件的内容
-            all_content = []
-            for json_file in json_files:
-                try:
-                    with open(json_file, 'r', encoding='utf-8') as f:
-                        content = json.load(f)
-                        if isinstance(content, list):
-                            all_content.extend(content)
-                except Exception as e:
-                    print(f"读取文件 {json_file} 失败: {e}")
-
-            if not all_content:
-                yield "data: " + json.dumps({'type': 'error', 'message': '没有找到有效的文件内容'}, ensure_ascii=False) + "\n\n"
-                return
-
-            # 创建临时合并文件
-            temp_json_path = os.path.join(upload_dir, 'merged_content.json')
-            with open(temp_json_path, 'w', encoding='utf-8') as f:
-                json.dump(all_content, f, ensure_ascii=False, indent=2)
-
-            # 直接开始流式生成
-            from .note_generator import NoteGenerator
-            generator = NoteGenerator()
-
-            yield "data: " + json.dumps({'type': 'start', 'message': '开始生成笔记，请耐心等待（可能需要1-2分钟）...'}, ensure_ascii=False) + "\n\n"
-
-            # 简化实现，先不使用心跳线程
-            print("[DEBUG] 开始笔记生成流程")
-
-            try:
-                # 使用用户特定的输出目录
-                user_output_dir = get_user_output_path(user_id)
-
-                for chunk in generator.generate_notes_streaming(temp_json_path, user_output_dir):
-                    if chunk['type'] == 'start':
-                        yield "data: " + json.dumps({'type': 'start', 'message': chunk['content']}, ensure_ascii=False) + "\n\n"
-                    elif chunk['type'] == 'content':
-                        yield "data: " + json.dumps({'type': 'content', 'content': chunk['content']}, ensure_ascii=False) + "\n\n"
-                    elif chunk['type'] == 'complete':
-                        yield "data: " + json.dumps({
-                            'type': 'complete',
-                            'message': chunk['content'],
-                            'file_path': chunk.get('file_path', ''),
-                            'output_dir': chunk.get('output_dir', ''),
-                            'toc_content': chunk.get('toc_content', ''),
-                            'toc_file_path': chunk.get('toc_file_path', '')
-                        }, ensure_ascii=False) + "\n\n"
-                        break
-                    elif chunk['type'] == 'error':
-                        yield "data: " + json.dumps({'type': 'error', 'message': chunk['content']}, ensure_ascii=False) + "\n\n"
-                        break
-            finally:
-                print("[DEBUG] 笔记生成流程结束")
+            resumed = parse_event_id(last_event_id)
+            if resumed and job_queue.get(resumed[0], owner_id=user_id) is not None:
+                job_id, after_seq = resumed
+                yield sse_event({'type': 'connected', 'message': '已重新连接，继续接收笔记...', 'job_id': job_id})
+            else:
+                # 发送连接成功消息
+                yield sse_event({'type': 'connected', 'message': '连接成功，开始生成笔记...'})
 
-            # 清理临时文件
-            try:
-                os.remove(temp_json_path)
-            except:
-                pass
+                if not os.path.exists(upload_dir):
+                    yield sse_event({'type': 'error', 'message': '没有找到上传的文件'})
+                    return
 
+                # 查找所有解析后的JSON文件
+                json_files = find_parsed_documents(upload_dir)
+                print(f"[DEBUG] stream_notes - 总共找到 {len(json_files)} 个JSON文件")
+                if not json_files:
+                    yield sse_event({'type': 'error', 'message': '没有找到已解析的文件'})
+                    return
+
+                # 生成模式: single / chunked / outline / auto，未指定时取配置；full=1 时全部重新生成
+                # 同一用户已有进行中的生成（其他标签页或聊天触发）时订阅该任务，不重复调用LLM
+                job, created = job_queue.enqueue_or_join(
+                    'generate_notes',
+                    owner_id=user_id,
+                    payload={
+                        'upload_dir': upload_dir,
+                        'output_dir': get_user_output_path(user_id),
+                        'mode': request.GET.get('mode') or None,
+                        'force': request.GET.get('full') == '1'
+                    },
+                    progress={'status': 'preparing', 'message': '正在准备生成笔记...'}
+                )
+                job_id, after_seq = str(job.id), 0
+                message = '笔记生成任务已提交...' if created else '笔记正在生成中，已加入当前任务...'
+                yield sse_event({'type': 'preparing', 'message': message, 'job_id': job_id})
+
+            log = event_logs.get(job_id, user_id)
+            events = log.follow(after_seq, heartbeat=api_config.sse_heartbeat_seconds)
+            for event in events:
+                if event is None:
+                    # 任务已结束但日志未关闭（排队中被取消或工作进程退出），不再等待
+                    job = job_queue.get(job_id)
+                    if job is None or (job.state in Job.FINISHED_STATES and not log.closed):
+                        yield sse_event({'type': 'error', 'message': '笔记生成任务已结束'})
+                        break
+                    # 保活注释帧，排队等待或模型思考时防止代理断开空闲连接
+                    yield ": keep-alive\n\n"
+                    continue
+                seq, frame = event
+                yield sse_event(frame, event_id=format_event_id(job_id, seq))
+                if frame['type'] in ('complete', 'error'):
+                    finished = True
+                    break
+
+        except GeneratorExit:
+            # 客户端已断开（服务器写入失败后关闭响应迭代器），立即结束订阅释放工作线程
+            if events is not None:
+                events.close()
+            if events is not None and not finished and policy == DISCONNECT_CANCEL and log.subscribers == 0:
+                logger.info(f"客户端已断开且没有其他订阅者，取消笔记生成任务 {job_id}")
+                job_queue.cancel(job_id)
+            elif job_id is not None:
+                # 默认策略：后台任务继续生成并写入 notes.md，重连时从事件日志补发
+                logger.info(f"客户端已断开，笔记生成任务 {job_id} 在后台继续")
+            else:
+                logger.info("客户端在提交笔记生成任务前已断开")
+            raise
         except Exception as e:
             print(f"[ERROR] 流式生成错误: {e}")
-            yield "data: " + json.dumps({'type': 'error', 'message': f'生成错误: {str(e)}'}, ensure_ascii=False) + "\n\n"
+            yield sse_event({'type': 'error', 'message': f'生成错误: {str(e)}'})
 
-    response = StreamingHttpResponse(generate(), content_type='text/event-stream; charset=utf-8')
-    response['Cache-Control'] = 'no-cache'
-    # 移除Connection头部，WSGI不允许设置hop-by-hop头部
+    response = sse_response(generate())
     response['Access-Control-Allow-Origin'] = '*'
-    response['Access-Control-Allow-Headers'] = 'Cache-Control'
-    # 设置更长的超时时间
-    response['X-Accel-Buffering'] = 'no'  # 禁用nginx缓冲
+    response['Access-Control-Allow-Headers'] = 'Cache-Control, Last-Event-ID'
     return response
 
 @csrf_exempt
@@ -359,20 +350,7 @@ def ai_chat_with_notes(request):
             # 调用AI生成改进内容
             improved_content = generate_improved_section(user_message, section_title, section_content)
 
-            # 替换笔记中的内容
-            updated_notes = replace_section_in_notes(notes_content, section_title, improved_content)
-
-            # 保存更新后的笔记
-            with open(notes_file_path, 'w', encoding='utf-8') as f:
-                f.write(updated_notes)
-
-            # 重新生成目录
-            from .note_generator import NoteGenerator
-            generator = NoteGenerator()
-            toc_content = generator._generate_table_of_contents(notes_file_path)
-            toc_file_path = os.path.join(os.path.dirname(notes_file_path), 'contents.md')
-            with open(toc_file_path, 'w', encoding='utf-8') as f:
-                f.write(toc_content)
+            toc_content = save_improved_section(notes_file_path, notes_content, section_title, improved_content)
 
             return Response({
                 'success': True,
@@ -394,6 +372,79 @@ def ai_chat_with_notes(request):
     except Exception as e:
         return Response({'success': False, 'error': f'AI对话失败：{str(e)}'}, status=500)
 
+@csrf_exempt
+def ai_chat_with_notes_stream(request):
+    """AI对话的SSE版本：章节改写和普通对话逐字推送，改写完成后保存笔记并返回新目录"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': '仅支持POST请求'}, status=405)
+
+    try:
+        user_message = json.loads(request.body or b'{}').get('message', '')
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'success': False, 'error': '请求格式错误'}, status=400)
+
+    if not user_message:
+        return JsonResponse({'success': False, 'error': '消息不能为空'}, status=400)
+
+    frames = stream_ai_chat_events(get_user_id(request), user_message)
+    if frames is None:
+        frames = iter([sse_event({'type': 'error', 'message': '没有找到笔记文件'})])
+    return sse_response(frames)
+
+def stream_ai_chat_events(user_id, user_message):
+    """
+    生成AI对话的SSE帧序列；没有笔记文件时返回None。
+    用户要求修改某个章节时流式输出改写内容，结束后写回笔记。
+    """
+    from core.streaming import stream_chat_events
+
+    latest_notes = get_latest_notes_file(user_id)
+    if not latest_notes:
+        return None
+
+    notes_content = latest_notes['content']
+    notes_file_path = latest_notes['file_path']
+    section_match = extract_section_from_message(user_message, notes_content)
+
+    if not section_match:
+        return stream_chat_events(build_chat_messages(user_message, notes_content))
+
+    section_title = section_match['title']
+
+    def on_complete(improved_content):
+        toc_content = save_improved_section(
+            notes_file_path, notes_content, section_title, improved_content.strip()
+        )
+        return {
+            'section_title': section_title,
+            'updated_toc': toc_content,
+            'message': f'已成功更新"{section_title}"部分的内容'
+        }
+
+    # 改写结果需要写回笔记：默认客户端断开后在后台读完并保存
+    return stream_chat_events(
+        build_improved_section_messages(user_message, section_title, section_match['content']),
+        on_complete=on_complete,
+        disconnect_policy=api_config.notes_edit_disconnect_policy
+    )
+
+def save_improved_section(notes_file_path, notes_content, section_title, improved_content):
+    """替换并保存章节内容，重新生成目录，返回目录内容"""
+    # 替换笔记中的内容
+    updated_notes = replace_section_in_notes(notes_content, section_title, improved_content)
+
+    # 保存更新后的笔记
+    with open(notes_file_path, 'w', encoding='utf-8') as f:
+        f.write(updated_notes)
+
+    # 重新生成目录
+    generator = NoteGenerator()
+    toc_content = generator._generate_table_of_contents(notes_file_path)
+    toc_file_path = os.path.join(os.path.dirname(notes_file_path), 'contents.md')
+    with open(toc_file_path, 'w', encoding='utf-8') as f:
+        f.write(toc_content)
+    return toc_content
+
 def get_latest_notes_file(user_id=0):
     """获取最新的笔记文件"""
     try:
@@ -537,17 +588,9 @@ def extract_section_content(content, section_title):
 
     return '\n'.join(section_lines)
 
-def generate_improved_section(user_message, section_title, section_content):
-    """调用AI生成改进的章节内容"""
-    try:
-        # 导入API客户端
-        from .note_generator import get_api_client
-
-        client = get_api_client()
-        if not client:
-            return f"# {section_title}\n\nAPI客户端不可用，无法生成改进内容。"
-
-        prompt = f"""
+def build_improved_section_messages(user_message, section_title, section_content):
+    """构建章节改写的消息列表"""
+    prompt = f"""
 用户对笔记中的"{section_title}"部分提出了以下要求：
 {user_message}
 
@@ -563,10 +606,21 @@ def generate_improved_section(user_message, section_title, section_content):
 
 请直接输出改进后的内容，不需要额外说明：
 """
+    return [{"role": "user", "content": prompt}]
 
-        response = client.chat_completion([
-            {"role": "user", "content": prompt}
-        ])
+def generate_improved_section(user_message, section_title, section_content):
+    """调用AI生成改进的章节内容"""
+    try:
+        # 导入API客户端
+        from .note_generator import get_api_client
+
+        client = get_api_client()
+        if not client:
+            return f"# {section_title}\n\nAPI客户端不可用，无法生成改进内容。"
+
+        response = client.chat_completion(
+            build_improved_section_messages(user_message, section_title, section_content)
+        )
 
         return response.strip()
 
@@ -605,6 +659,15 @@ def replace_section_in_notes(notes_content, section_title, new_content):
 
     return '\n'.join(new_lines)
 
+def build_chat_messages(user_message, notes_content):
+    """构建普通对话的消息列表"""
+    # 使用集中管理的提示词
+    prompt = CHAT_ASSISTANT_PROMPT.format(
+        notes_content=notes_content[:1000] + "..." if len(notes_content) > 1000 else notes_content,
+        user_question=user_message
+    )
+    return [{"role": "user", "content": prompt}]
+
 def generate_ai_response(user_message, notes_content):
     """生成普通AI对话回复"""
     try:
@@ -614,15 +677,7 @@ def generate_ai_response(user_message, notes_content):
         if not client:
             return "抱歉，AI服务暂时不可用。"
 
-        # 使用集中管理的提示词
-        prompt = CHAT_ASSISTANT_PROMPT.format(
-            notes_content=notes_content[:1000] + "..." if len(notes_content) > 1000 else notes_content,
-            user_question=user_message
-        )
-
-        response = client.chat_completion([
-            {"role": "user", "content": prompt}
-        ])
+        response = client.chat_completion(build_chat_messages(user_message, notes_content))
 
         return response.strip()
 
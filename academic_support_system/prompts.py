@@ -45,6 +45,65 @@ NOTE_GENERATION_SYSTEM_PROMPT = """
 - 生成的笔记应适合用于考研、期末复习等高强度学习场景，兼顾系统性与实用性。
 """
 
+# 分块笔记生成提示词（长文档map阶段，格式参数: index, total；使用时后接笔记生成系统提示词）
+NOTE_CHUNK_GENERATION_PROMPT = """
+以下是一份长文档的第{index}/{total}部分，请只针对这一部分的内容整理学术笔记，后续会与其他部分的笔记合并。
+- 使用二级标题（##）和三级标题（###）组织内容，不要输出一级标题（#）
+- 不要写开头的总述和结尾的总结，也不要输出水印
+- 其余要求与下面的完整笔记要求一致
+"""
+
+# 分块笔记合并提示词（长文档reduce阶段）
+NOTE_MERGE_PROMPT = """你是一名学术笔记整理专家。下面是同一份文档按顺序分段整理出的若干部分笔记，请把它们合并为一份完整的学术笔记：
+- 补充一个概括全文主题的一级标题（#），统一标题层级为 #、##、###，不要出现更深的标题
+- 合并重复或高度相似的小节，保持原有的先后逻辑顺序
+- 保留所有公式（标准LaTeX语法）、表格和图片引用 ![描述](相对路径)，不要改动图片路径
+- 不要删减知识点，也不要出现"第N部分"之类的分段痕迹
+- 在笔记结束后，在最后一行写上一行水印：本笔记由知悟·启明学业问答系统生成，AI可能会出错，请仔细鉴别。
+
+请直接输出合并后的完整Markdown笔记：
+
+"""
+
+# 笔记大纲提示词（先大纲后展开模式的第一阶段）
+NOTE_OUTLINE_PROMPT = """你是一名学术笔记整理专家。请先通读下面的原始内容，为一份完整、结构清晰的学术笔记设计标题大纲：
+- 第一行是概括全文主题的一级标题（# 标题）
+- 用二级标题（## 标题）划分4-10个主要章节，按原始材料的理论逻辑排序
+- 每个二级标题下用三级标题（### 标题）列出2-5个小节
+- 每个二级标题行末尾用【页码: 起始页-结束页】标注该章节主要依据的原始页码
+- 只输出大纲本身，不要输出正文或任何说明
+
+原始内容：
+"""
+
+# 章节展开提示词（先大纲后展开模式的第二阶段，格式参数: title, outline, section_outline；使用时后接笔记生成系统提示词）
+NOTE_SECTION_EXPAND_PROMPT = """我们正在按以下大纲编写一份学术笔记《{title}》：
+
+{outline}
+
+现在只需编写其中的这一章节，其余章节由其他人并行完成：
+
+{section_outline}
+
+- 以该章节的二级标题行开头（## 标题，去掉页码标注），按给定的三级标题展开，不要输出其他章节的内容
+- 不要输出一级标题，不要写全文总述、总结或水印
+- 其余要求与下面的完整笔记要求一致
+"""
+
+# 笔记续写提示词（生成中断或达到输出上限时接在原提示词之后，格式参数: outline, heading）
+NOTE_CONTINUATION_PROMPT = """
+
+---
+上面要求的笔记已经写了一部分，已完成的部分按以下标题组织：
+
+{outline}
+
+请从标题"{heading}"开始继续编写剩余的笔记：
+- 第一行直接输出"{heading}"，写完这一部分后按原有结构继续写完全部剩余内容
+- 不要重复上面已完成的标题和内容，不要输出开场白或任何说明
+- 其余要求与上面的笔记要求一致
+"""
+
 # 笔记修改系统提示词
 NOTE_MODIFICATION_SYSTEM_PROMPT = """你是一个专业的学术内容编辑助手。用户将提供一段笔记内容和修改要求，请根据要求对内容进行精准修改。
 
@@ -160,6 +219,20 @@ SHORT_ANSWER_GENERATION_PROMPT = """请根据提供的学习材料生成一道
   "explanation": "评分要点和解析，直接阐述相关概念，说明答题的关键点"
 }"""
 
+# 批量出题补充说明（附加在单题模板之后）
+QUESTION_BATCH_GENERATION_PROMPT = """本次请一次性生成{count}道{question_type}，忽略上文"一道"的数量要求。
+
+要求：
+- 第k道题只能基于下方【片段k】的内容出题，各题考查不同的知识点
+- 每道题的字段与上文JSON格式相同，并额外包含 "slice" 字段，取值为对应片段的编号k
+- 将所有题目按片段编号顺序放入一个JSON数组返回，不要添加任何其他文字
+
+返回格式：
+[
+  {{"slice": 1, "text": "...", "type": "{question_type}", "answer": "...", "explanation": "..."}},
+  {{"slice": 2, "text": "...", "type": "{question_type}", "answer": "...", "explanation": "..."}}
+]"""
+
 # ==================== 答题分析相关提示词 ====================
 
 # 答题报告生成提示词
@@ -150,7 +150,7 @@ def generate_structured_questions(request):
         # 使用统一的出题服务生成题目
         logger.info(f"开始生成题目，类型: {selected_types}")
 
-        result = question_service.generate_questions(
+        result = question_service.generate_questions_concurrently(
             notes_content=notes_content,
             question_types=selected_types,
             user_preferences=preferences,
@@ -660,7 +660,7 @@ def build_question_prompt(selected_types, preferences, notes_content):
 def generate_questions_with_ai(selected_types, notes_content, user_id):
     """使用AI生成题目（已弃用，重定向到统一服务）"""
     print("generate_questions_with_ai已弃用，重定向到统一服务")
-    result = question_service.generate_questions(
+    result = question_service.generate_questions_concurrently(
         notes_content=notes_content,
         question_types=selected_types,
         user_preferences="",
@@ -127,6 +127,491 @@ def test_error_handling():
         print(f"❌ 错误处理测试失败: {e}")
         return False
 
+def test_client_registry_reuse():
+    """测试客户端注册表复用连接池"""
+    try:
+        from core.client_registry import ClientRegistry
+
+        registry = ClientRegistry(max_connections=4, max_keepalive_connections=2)
+        first = registry.get_openai_client("test-key", "http://127.0.0.1:9/v1")
+        second = registry.get_openai_client("test-key", "http://127.0.0.1:9/v1/")
+        other_key = registry.get_openai_client("other-key", "http://127.0.0.1:9/v1")
+
+        same_client = first is second
+        same_transport = len(registry.stats()['transports']) == 1
+        registry.close_all()
+
+        if same_client and same_transport and other_key is not first:
+            print("✅ 同一base_url共享连接池")
+            return True
+        else:
+            print("❌ 客户端未被复用")
+            return False
+
+    except Exception as e:
+        print(f"❌ 客户端注册表测试失败: {e}")
+        return False
+
+def test_response_cache():
+    """测试响应缓存的命中、持久化与淘汰"""
+    try:
+        import tempfile
+        from core.response_cache import ResponseCache, make_cache_key
+
+        messages = [{"role": "user", "content": "请总结以下题目"}]
+        key = make_cache_key("test-model", messages, 0.7, 500)
+        other_key = make_cache_key("test-model", messages, 0.2, 500)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "cache.sqlite3")
+            cache = ResponseCache(enabled=True, memory_size=2, db_path=db_path, max_entries=10)
+            cache.set(key, "缓存的回复")
+
+            start_time = time.perf_counter()
+            memory_value = cache.get(key)
+            elapsed = time.perf_counter() - start_time
+            missed = cache.get(other_key)
+
+            # 新实例只能从磁盘层读取
+            reloaded = ResponseCache(enabled=True, memory_size=2, db_path=db_path, max_entries=10)
+            disk_value = reloaded.get(key)
+
+            expired = ResponseCache(enabled=True, db_path=db_path, ttl=0.001)
+            time.sleep(0.01)
+            expired_value = expired.get(key)
+
+        stats = cache.stats()
+        print(f"内存命中耗时: {elapsed * 1e6:.1f}微秒, 统计: {stats}")
+
+        if (memory_value == "缓存的回复" and missed is None and disk_value == "缓存的回复"
+                and expired_value is None and stats['hits'] == 1 and stats['misses'] == 1):
+            print("✅ 响应缓存测试成功")
+            return True
+        else:
+            print("❌ 响应缓存结果不符合预期")
+            return False
+
+    except Exception as e:
+        print(f"❌ 响应缓存测试失败: {e}")
+        return False
+
+def test_token_budget():
+    """测试token估算、max_tokens约束与超长提示词处理"""
+    try:
+        from core.token_budget import (
+            PromptTooLargeError, estimate_tokens, get_context_window,
+            plan_max_tokens, trim_to_token_budget
+        )
+
+        chinese = estimate_tokens("机器学习是人工智能的分支")
+        english = estimate_tokens("machine learning is a branch of AI")
+        mixed = estimate_tokens("深度学习 deep learning 模型")
+
+        context, max_output = get_context_window("gemini-2.5-flash")
+        clamped = plan_max_tokens(1000, 10 ** 7, "gemini-2.5-flash")
+        default_limit = plan_max_tokens(1000, None, "gemini-2.5-flash")
+
+        try:
+            plan_max_tokens(context, 1000, "gemini-2.5-flash")
+            rejected = False
+        except PromptTooLargeError:
+            rejected = True
+
+        long_text = "\n".join(["这是一段很长的课程文本内容"] * 200)
+        trimmed = trim_to_token_budget(long_text, 100)
+
+        print(f"估算: 中文={chinese}, 英文={english}, 混合={mixed}, 约束后max_tokens={clamped}")
+
+        if (chinese == 12 and 6 <= english <= 12 and mixed > 0
+                and clamped == max_output and default_limit == max_output and rejected
+                and estimate_tokens(trimmed) <= 100 and long_text.startswith(trimmed)):
+            print("✅ Token预算测试成功")
+            return True
+        else:
+            print("❌ Token预算结果不符合预期")
+            return False
+
+    except Exception as e:
+        print(f"❌ Token预算测试失败: {e}")
+        return False
+
+def test_resilience():
+    """测试分类重试与熔断器的快速失败、半开探测"""
+    try:
+        from core.resilience import CircuitBreaker, CircuitOpenError, ResilienceManager
+
+        manager = ResilienceManager(max_retries=2, base_delay=0, failure_threshold=3, recovery_timeout=60)
+        attempts = {'count': 0}
+
+        def flaky():
+            attempts['count'] += 1
+            if attempts['count'] < 3:
+                raise TimeoutError("read timed out")
+            return "ok"
+
+        retried = manager.call(flaky, endpoint="http://flaky")
+
+        # 不可重试的错误只调用一次
+        calls = {'count': 0}
+
+        def bad_request():
+            calls['count'] += 1
+            raise ValueError("invalid model")
+
+        try:
+            manager.call(bad_request, endpoint="http://bad")
+        except ValueError:
+            pass
+
+        # 持续故障：熔断后请求在毫秒级快速失败
+        def down():
+            raise ConnectionError("connection refused")
+
+        for _ in range(2):
+            try:
+                manager.call(down, endpoint="http://down")
+            except (ConnectionError, CircuitOpenError):
+                pass
+
+        start_time = time.perf_counter()
+        try:
+            manager.call(down, endpoint="http://down")
+            fast_failed = False
+        except CircuitOpenError:
+            fast_failed = True
+        elapsed = time.perf_counter() - start_time
+
+        # 冷却后放行一次半开探测，成功则闭合
+        now = {'t': 0.0}
+        breaker = CircuitBreaker("probe", failure_threshold=1, recovery_timeout=10, clock=lambda: now['t'])
+        breaker.record_failure()
+        blocked = not breaker.allow_request()
+        now['t'] = 11.0
+        probe_allowed = breaker.allow_request()
+        second_probe = breaker.allow_request()
+        breaker.record_success()
+
+        print(f"重试次数: {attempts['count']}, 熔断后快速失败耗时: {elapsed * 1000:.2f}毫秒")
+
+        if (retried == "ok" and attempts['count'] == 3 and calls['count'] == 1 and fast_failed
+                and elapsed < 0.05 and blocked and probe_allowed and not second_probe
+                and breaker.state == CircuitBreaker.CLOSED):
+            print("✅ 容错层测试成功")
+            return True
+        else:
+            print("❌ 容错层结果不符合预期")
+            return False
+
+    except Exception as e:
+        print(f"❌ 容错层测试失败: {e}")
+        return False
+
+def test_single_flight():
+    """测试相同在途请求在线程与协程路径下的合并"""
+    try:
+        import asyncio
+        import threading
+        from core.single_flight import SingleFlight
+
+        flight = SingleFlight()
+        upstream_calls = {'count': 0}
+
+        def slow_call():
+            upstream_calls['count'] += 1
+            time.sleep(0.2)
+            return "共享结果"
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(flight.do("same-key", slow_call)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        async def slow_async_call():
+            upstream_calls['count'] += 1
+            await asyncio.sleep(0.1)
+            return "异步共享结果"
+
+        async def run_async():
+            return await asyncio.gather(*[
+                flight.ado("async-key", slow_async_call) for _ in range(5)
+            ])
+
+        async_results = asyncio.run(run_async())
+        stats = flight.stats()
+        print(f"上游调用次数: {upstream_calls['count']}, 统计: {stats}")
+
+        if (results == ["共享结果"] * 5 and async_results == ["异步共享结果"] * 5
+                and upstream_calls['count'] == 2 and stats['coalesced'] == 8
+                and stats['in_flight'] == 0):
+            print("✅ 请求合并测试成功")
+            return True
+        else:
+            print("❌ 请求合并结果不符合预期")
+            return False
+
+    except Exception as e:
+        print(f"❌ 请求合并测试失败: {e}")
+        return False
+
+def test_stream_chat():
+    """测试流式接口的增量、用量与结束原因，以及SSE帧转换"""
+    try:
+        import json
+        from types import SimpleNamespace
+        from core.unified_api_client import UnifiedAPIClient, unified_client
+        from core.streaming import stream_chat_events
+
+        def make_chunk(content=None, finish_reason=None, usage=None):
+            choices = []
+            if content is not None or finish_reason is not None:
+                choices = [SimpleNamespace(
+                    delta=SimpleNamespace(content=content), finish_reason=finish_reason
+                )]
+            return SimpleNamespace(choices=choices, usage=usage)
+
+        chunks = [
+            make_chunk("机器"), make_chunk("学习"), make_chunk(None, "stop"),
+            make_chunk(usage=SimpleNamespace(prompt_tokens=10, completion_tokens=2, total_tokens=12))
+        ]
+        captured = {}
+
+        def fake_create(**kwargs):
+            captured.update(kwargs)
+            return iter(chunks)
+
+        client = UnifiedAPIClient()
+        client._client = SimpleNamespace(
+            chat=SimpleNamespace(completions=SimpleNamespace(create=fake_create))
+        )
+        client.is_available = lambda: True
+        events = list(client.stream_chat([{"role": "user", "content": "什么是机器学习"}], model="test-model"))
+
+        original_stream_chat = unified_client.stream_chat
+        unified_client.stream_chat = client.stream_chat
+        try:
+            frames = list(stream_chat_events(
+                [{"role": "user", "content": "什么是机器学习"}], prefix="答：", model="test-model"
+            ))
+        finally:
+            unified_client.stream_chat = original_stream_chat
+        payloads = [json.loads(frame[len("data: "):]) for frame in frames]
+
+        contents = [event['content'] for event in events if event['type'] == 'content']
+        usage = [event for event in events if event['type'] == 'usage']
+        print(f"流式事件: {[event['type'] for event in events]}, SSE帧: {[p['type'] for p in payloads]}")
+
+        if (contents == ["机器", "学习"] and usage and usage[0]['total_tokens'] == 12
+                and events[-1] == {'type': 'finish', 'finish_reason': 'stop'}
+                and captured.get('stream') is True
+                and all(frame.endswith("\n\n") for frame in frames)
+                and payloads[-1]['type'] == 'complete' and payloads[-1]['response'] == "答：机器学习"
+                and payloads[-1]['usage']['total_tokens'] == 12):
+            print("✅ 流式接口测试成功")
+            return True
+        else:
+            print("❌ 流式接口结果不符合预期")
+            return False
+
+    except Exception as e:
+        print(f"❌ 流式接口测试失败: {e}")
+        return False
+
+def test_stream_disconnect():
+    """测试客户端断开时按策略取消上游生成或转入后台完成"""
+    try:
+        import threading
+        from core.unified_api_client import unified_client
+        from core import streaming
+        from core.streaming import DISCONNECT_CANCEL, DISCONNECT_DETACH, DetachedStreamPool, stream_chat_events
+
+        upstream = {'closed': False, 'chunks': 0}
+
+        def fake_stream_chat(messages, **kwargs):
+            try:
+                for text in ["第一段", "第二段", "第三段"]:
+                    upstream['chunks'] += 1
+                    yield {'type': 'content', 'content': text}
+                yield {'type': 'finish', 'finish_reason': 'stop'}
+            finally:
+                upstream['closed'] = True
+
+        original_stream_chat = unified_client.stream_chat
+        unified_client.stream_chat = fake_stream_chat
+        try:
+            # cancel：读到第一段后客户端断开，上游流立即关闭，后续内容不再生成
+            frames = stream_chat_events([{"role": "user", "content": "改写"}], disconnect_policy=DISCONNECT_CANCEL)
+            next(frames), next(frames)
+            frames.close()
+            cancelled = dict(upstream)
+
+            # detach：断开后后台线程读完上游，并以完整文本调用 on_complete
+            upstream.update(closed=False, chunks=0)
+            saved = []
+            done = threading.Event()
+
+            def on_complete(text):
+                saved.append(text)
+                done.set()
+
+            frames = stream_chat_events([{"role": "user", "content": "改写"}], on_complete=on_complete,
+                                        disconnect_policy=DISCONNECT_DETACH)
+            next(frames), next(frames)
+            frames.close()
+            done.wait(timeout=5)
+            detached = dict(upstream)
+
+            # 后台线程池已满：detach 退化为取消上游生成
+            upstream.update(closed=False, chunks=0)
+            original_pool = streaming.detached_streams
+            streaming.detached_streams = DetachedStreamPool(max_workers=1, max_pending=0)
+            try:
+                frames = stream_chat_events([{"role": "user", "content": "改写"}], on_complete=on_complete,
+                                            disconnect_policy=DISCONNECT_DETACH)
+                next(frames), next(frames)
+                frames.close()
+                rejected = streaming.detached_streams.stats()['rejected']
+            finally:
+                streaming.detached_streams = original_pool
+        finally:
+            unified_client.stream_chat = original_stream_chat
+
+        print(f"cancel: {cancelled}, detach: {saved}, 线程池已满: {upstream}")
+        if (cancelled == {'closed': True, 'chunks': 1}
+                and saved == ["第一段第二段第三段"] and detached['chunks'] == 3
+                and rejected == 1 and upstream == {'closed': True, 'chunks': 1} and len(saved) == 1):
+            print("✅ 断开处理测试成功")
+            return True
+        else:
+            print("❌ 断开处理结果不符合预期")
+            return False
+
+    except Exception as e:
+        print(f"❌ 断开处理测试失败: {e}")
+        return False
+
+def test_llm_stub_server():
+    """测试本地LLM替身服务的流式/非流式接口、延迟配置与错误注入"""
+    try:
+        import json
+        import urllib.error
+        import urllib.request
+        from core.llm_stub_server import StubProfile, start_stub_server
+
+        profile = StubProfile(ttft=0.05, tokens_per_second=0, payloads={'chat': '你好，世界'})
+        server = start_stub_server(profile=profile)
+        url = server.base_url + "/chat/completions"
+
+        def post(body):
+            request = urllib.request.Request(
+                url, data=json.dumps(body).encode('utf-8'),
+                headers={'Content-Type': 'application/json'}
+            )
+            return urllib.request.urlopen(request, timeout=5)
+
+        try:
+            start_time = time.perf_counter()
+            with post({"model": "stub", "messages": [{"role": "user", "content": "请生成一道高质量的判断题"}]}) as resp:
+                completion = json.loads(resp.read())
+            elapsed = time.perf_counter() - start_time
+
+            with post({"model": "stub", "stream": True, "stream_options": {"include_usage": True},
+                       "messages": [{"role": "user", "content": "你好"}]}) as resp:
+                frames = [line[len(b"data: "):] for line in resp.read().split(b"\n\n") if line]
+            chunks = [json.loads(frame) for frame in frames if frame != b"[DONE]"]
+            streamed = "".join(
+                chunk['choices'][0]['delta'].get('content') or ''
+                for chunk in chunks if chunk['choices']
+            )
+
+            profile.error_rate = 1.0
+            try:
+                post({"model": "stub", "messages": [{"role": "user", "content": "你好"}]})
+                status_code = 200
+            except urllib.error.HTTPError as e:
+                status_code = e.code
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        content = completion['choices'][0]['message']['content']
+        print(f"非流式耗时: {elapsed * 1000:.0f}毫秒, 流式回复: {streamed}, 注入错误状态码: {status_code}")
+
+        if ('"判断题"' in content and elapsed >= 0.05 and streamed == "你好，世界"
+                and frames[-1] == b"[DONE]" and chunks[-1]['usage']['completion_tokens'] == 5
+                and status_code == 503 and profile.stats['errors'] == 1):
+            print("✅ LLM替身服务测试成功")
+            return True
+        else:
+            print("❌ LLM替身服务结果不符合预期")
+            return False
+
+    except Exception as e:
+        print(f"❌ LLM替身服务测试失败: {e}")
+        return False
+
+def _make_png(width, height):
+    """生成纯色PNG图片字节"""
+    import struct
+    import zlib
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+
+    raw = b"".join(b"\x00" + b"\x80\x40\x20" * width for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw))
+            + chunk(b"IEND", b""))
+
+def test_image_pipeline():
+    """测试图片MIME识别、缩放压缩与编码缓存"""
+    try:
+        import tempfile
+        from core.image_pipeline import Image, ImagePipeline, sniff_mime
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            png_path = os.path.join(tmp_dir, "figure.png")
+            with open(png_path, "wb") as f:
+                f.write(_make_png(2000, 400))
+            jpeg_path = os.path.join(tmp_dir, "photo.png")  # 扩展名与真实格式不符
+            with open(jpeg_path, "wb") as f:
+                f.write(b"\xff\xd8\xff\xe0" + b"\x00" * 64)
+
+            pipeline = ImagePipeline(max_side=512, quality=80)
+            first = pipeline.encode(png_path)
+            start_time = time.perf_counter()
+            second = pipeline.encode(png_path)
+            elapsed = time.perf_counter() - start_time
+            jpeg_url = pipeline.encode(jpeg_path)
+            stats = pipeline.stats()
+
+            resized_ok = True
+            if Image is not None:
+                import base64
+                import io
+                encoded = base64.b64decode(first.split(",", 1)[1])
+                resized_ok = max(Image.open(io.BytesIO(encoded)).size) == 512
+
+        print(f"缓存命中耗时: {elapsed * 1e6:.1f}微秒, 统计: {stats}")
+
+        if (first == second and stats['hits'] == 1 and stats['misses'] == 2
+                and jpeg_url.startswith("data:image/jpeg;base64,") and resized_ok
+                and sniff_mime(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "image/webp"):
+            print("✅ 图片预处理测试成功")
+            return True
+        else:
+            print("❌ 图片预处理结果不符合预期")
+            return False
+
+    except Exception as e:
+        print(f"❌ 图片预处理测试失败: {e}")
+        return False
+
 def run_tests():
     """运行所有API客户端测试"""
     print("🔍 开始API客户端测试...")
@@ -138,6 +623,15 @@ def run_tests():
         ("简单API调用", test_simple_api_call),
         ("API响应时间", test_api_response_time),
         ("错误处理", test_error_handling),
+        ("客户端注册表复用", test_client_registry_reuse),
+        ("响应缓存", test_response_cache),
+        ("Token预算", test_token_budget),
+        ("重试与熔断", test_resilience),
+        ("相同请求合并", test_single_flight),
+        ("流式接口", test_stream_chat),
+        ("客户端断开处理", test_stream_disconnect),
+        ("LLM替身服务", test_llm_stub_server),
+        ("图片预处理", test_image_pipeline),
     ]
     
     passed = 0
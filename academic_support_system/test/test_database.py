@@ -77,6 +77,442 @@ def test_migrations():
         print(f"❌ 迁移状态测试失败: {e}")
         return False
 
+_flaky_calls = []
+
+def _job_ok(context):
+    context.update({'status': 'completed', 'message': 'ok'}, force=True)
+    return {'echo': context.payload.get('value')}
+
+def _job_flaky(context):
+    _flaky_calls.append(context.job_id)
+    if len(_flaky_calls) == 1:
+        raise RuntimeError('暂时失败')
+    return {'attempt': len(_flaky_calls)}
+
+def test_job_queue():
+    """测试后台任务队列的执行、重试与取消"""
+    try:
+        from django.core.management import call_command
+        from core.jobs import JobQueue
+        from core.models import Job
+
+        call_command('migrate', 'core', verbosity=0)
+        queue = JobQueue(
+            workers=2, max_attempts=2, run_in_process=False,
+            handlers={'test_ok': f'{__name__}._job_ok', 'test_flaky': f'{__name__}._job_flaky'}
+        )
+        queue.retry_delay = lambda attempts: 0
+        created = []
+        try:
+            ok_job = queue.enqueue('test_ok', owner_id=-1, payload={'value': 42})
+            flaky_job = queue.enqueue('test_flaky', owner_id=-1)
+            cancelled_job = queue.enqueue('test_ok', owner_id=-1)
+            created = [ok_job.id, flaky_job.id, cancelled_job.id]
+            queue.cancel(cancelled_job.id)
+
+            while queue.run_once('test') is not None:
+                pass
+
+            ok_job.refresh_from_db()
+            flaky_job.refresh_from_db()
+            cancelled_job.refresh_from_db()
+            retried = queue.retry(cancelled_job.id)
+            latest = queue.latest(-1)
+        finally:
+            Job.objects.filter(id__in=created).delete()
+
+        if (ok_job.state == Job.STATE_SUCCEEDED and ok_job.result == {'echo': 42}
+                and flaky_job.state == Job.STATE_SUCCEEDED and flaky_job.attempts == 2
+                and cancelled_job.state == Job.STATE_CANCELLED and cancelled_job.attempts == 0
+                and retried.state == Job.STATE_QUEUED and latest.id == cancelled_job.id):
+            print("✅ 后台任务队列测试成功")
+            return True
+        else:
+            print(f"❌ 后台任务队列结果不符合预期: {ok_job.state}, {flaky_job.state}/{flaky_job.attempts}, {cancelled_job.state}")
+            return False
+
+    except Exception as e:
+        print(f"❌ 后台任务队列测试失败: {e}")
+        return False
+
+def _job_slow(context):
+    # 长时间阻塞、不上报进度（如等待一次LLM调用）
+    import time
+    time.sleep(0.3)
+    return {'done': True}
+
+def test_job_heartbeat():
+    """测试运行中任务的心跳线程，以及心跳超时任务按尝试次数重新排队或标记失败"""
+    try:
+        from datetime import timedelta
+        from django.core.management import call_command
+        from django.utils import timezone
+        from core.jobs import JobQueue
+        from core.models import Job
+
+        call_command('migrate', 'core', verbosity=0)
+        queue = JobQueue(run_in_process=False, handlers={'test_slow': f'{__name__}._job_slow'})
+        queue.heartbeat_interval = 0.05
+        created = []
+        try:
+            slow_job = queue.enqueue('test_slow', owner_id=-1)
+            created.append(slow_job.id)
+            claimed = queue.claim('test')
+            started_heartbeat = claimed.heartbeat_at
+            queue.run_job(claimed)
+            slow_job.refresh_from_db()
+
+            # 模拟工作进程退出：两个心跳超时的运行中任务，一个还可以重试，一个已用完尝试次数
+            stale_at = timezone.now() - timedelta(seconds=queue.stale_seconds + 10)
+            retry_job = Job.objects.create(kind='test_slow', owner_id=-1, state=Job.STATE_RUNNING,
+                                           attempts=1, max_attempts=3, heartbeat_at=stale_at)
+            exhausted_job = Job.objects.create(kind='test_slow', owner_id=-1, state=Job.STATE_RUNNING,
+                                               attempts=3, max_attempts=3, heartbeat_at=stale_at)
+            created += [retry_job.id, exhausted_job.id]
+            recovered = queue.recover_stale()
+            retry_job.refresh_from_db()
+            exhausted_job.refresh_from_db()
+        finally:
+            Job.objects.filter(id__in=created).delete()
+
+        if (slow_job.state == Job.STATE_SUCCEEDED and slow_job.heartbeat_at > started_heartbeat
+                and recovered == 1 and retry_job.state == Job.STATE_QUEUED
+                and exhausted_job.state == Job.STATE_FAILED):
+            print("✅ 任务心跳测试成功")
+            return True
+        else:
+            print(f"❌ 任务心跳结果不符合预期: {slow_job.state}, {retry_job.state}, {exhausted_job.state}")
+            return False
+
+    except Exception as e:
+        print(f"❌ 任务心跳测试失败: {e}")
+        return False
+
+def test_progress_store():
+    """测试任务进度存储的序号与订阅推送"""
+    try:
+        import threading
+        import time
+        from core.models import Job
+        from core.progress import ProgressStore
+
+        store = ProgressStore()
+        job = Job(kind='test_ok', owner_id=-1, state=Job.STATE_RUNNING)
+        store.publish(job, {'status': 'processing', 'progress': 0})
+
+        def producer():
+            for percent in (30, 60, 90):
+                time.sleep(0.05)
+                store.publish(job, {'status': 'processing', 'progress': percent})
+            store.publish(job, {'status': 'completed', 'progress': 100}, state=Job.STATE_SUCCEEDED)
+
+        thread = threading.Thread(target=producer)
+        thread.start()
+        received = [snapshot for snapshot in store.subscribe(job.id, heartbeat=5.0)]
+        thread.join()
+
+        seqs = [snapshot['seq'] for snapshot in received]
+        if (seqs == sorted(set(seqs)) and received[-1]['state'] == Job.STATE_SUCCEEDED
+                and received[-1]['progress']['progress'] == 100 and store.get(job.id)['seq'] == 5):
+            print(f"✅ 进度存储测试成功，收到序号: {seqs}")
+            return True
+        else:
+            print(f"❌ 进度存储结果不符合预期: {seqs}")
+            return False
+
+    except Exception as e:
+        print(f"❌ 进度存储测试失败: {e}")
+        return False
+
+def test_event_log_replay():
+    """测试任务事件日志的断线补发与跨进程读取"""
+    try:
+        import tempfile
+        import threading
+        import time
+        from core.event_log import EventLog, format_event_id, parse_event_id
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'jobs', 'job.events.jsonl')
+            producer_log = EventLog(path)
+            producer_log.append({'type': 'start', 'message': '开始'})
+
+            def producer():
+                for index in range(5):
+                    time.sleep(0.02)
+                    producer_log.append({'type': 'content', 'content': f'第{index}段'})
+                producer_log.close()
+
+            thread = threading.Thread(target=producer)
+            thread.start()
+            # 同进程订阅者：断线前收到前3帧
+            first = []
+            for event in producer_log.follow(0, heartbeat=5.0):
+                first.append(event)
+                if len(first) == 3:
+                    break
+            last_event_id = format_event_id('job', first[-1][0])
+            thread.join()
+
+            # 另一个实例模拟其他进程中的订阅者，携带 Last-Event-ID 续传
+            job_id, after_seq = parse_event_id(last_event_id)
+            resumed = [event for event in EventLog(path, poll_interval=0.05).follow(after_seq, heartbeat=5.0)]
+
+        seqs = [seq for seq, _ in first + resumed]
+        if job_id == 'job' and seqs == list(range(1, 7)) and resumed[-1][1]['content'] == '第4段':
+            print(f"✅ 事件日志续传测试成功，收到序号: {seqs}")
+            return True
+        else:
+            print(f"❌ 事件日志续传结果不符合预期: {seqs}")
+            return False
+
+    except Exception as e:
+        print(f"❌ 事件日志续传测试失败: {e}")
+        return False
+
+def test_event_log_ring_buffer():
+    """测试事件日志的有界缓冲：生产者不等待慢订阅者，落后的订阅者收到合并后的追赶帧"""
+    try:
+        import tempfile
+        import threading
+        from core.event_log import EventLog
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            log = EventLog(os.path.join(tmp_dir, 'jobs', 'job.events.jsonl'), capacity=16, catchup_max_bytes=1024)
+            log.append({'type': 'start', 'message': '开始'})
+            produced = threading.Event()
+
+            def producer():
+                for index in range(1000):
+                    log.append({'type': 'content', 'content': f'{index},'})
+                log.append({'type': 'complete', 'message': '完成'})
+                log.close()
+                produced.set()
+
+            received = []
+            for event in log.follow(0, heartbeat=5.0):
+                received.append(event)
+                if len(received) == 1:
+                    # 慢订阅者：收到第一帧后停住，生产者应独立写完全部内容
+                    thread = threading.Thread(target=producer)
+                    thread.start()
+                    finished_alone = produced.wait(timeout=10)
+                    thread.join()
+            stats = log.stats()
+
+        text = ''.join(payload.get('content', '') for _, payload in received)
+        expected = ''.join(f'{index},' for index in range(1000))
+        print(f"收到 {len(received)} 帧，缓冲统计: {stats}")
+        if (finished_alone and text == expected and received[-1][0] == 1002
+                and received[-1][1]['type'] == 'complete' and len(received) < 20
+                and stats['depth'] == 16 and stats['evicted'] == 1002 - 16
+                and stats['catchups'] >= 1 and stats['coalesced'] == 1002 - len(received)):
+            print("✅ 事件日志有界缓冲测试成功")
+            return True
+        else:
+            print("❌ 事件日志有界缓冲结果不符合预期")
+            return False
+
+    except Exception as e:
+        print(f"❌ 事件日志有界缓冲测试失败: {e}")
+        return False
+
+def test_event_log_registry():
+    """测试事件日志注册表：统计汇总各任务的缓冲计数，过期的日志文件被清理而使用中的保留"""
+    try:
+        import tempfile
+        import time
+        from core.event_log import EventLogRegistry
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            registry = EventLogRegistry(root=tmp_dir, capacity=4, catchup_max_bytes=1024, retention=60)
+            active = registry.get('active', 1)
+            finished = registry.get('finished', 2)
+            for index in range(10):
+                active.append({'type': 'content', 'content': f'{index},'})
+            finished.append({'type': 'complete', 'message': '完成'})
+            finished.close()
+            events = list(finished.follow(0, heartbeat=5.0))
+            lagging = list(active.read(0))
+            registry.release('finished')
+
+            # 把两个日志文件的修改时间都改到保留期之前
+            expired = time.time() - 120
+            for job_id, owner_id in (('active', 1), ('finished', 2)):
+                os.utime(registry.path_for(job_id, owner_id), (expired, expired))
+            removed = registry.prune()
+            skipped = registry.prune()
+            stats = registry.stats()
+            active_kept = os.path.exists(registry.path_for('active', 1))
+            finished_kept = os.path.exists(registry.path_for('finished', 2))
+
+        print(f"注册表统计: {stats}")
+        if (len(events) == 1 and len(lagging) == 10 and removed == 1 and skipped == 0
+                and active_kept and not finished_kept
+                and stats['logs'] == 1 and stats['depth'] == 4 and stats['evicted'] == 6
+                and stats['catchups'] == 1 and stats['max_lag'] == 10 and stats['pruned'] == 1):
+            print("✅ 事件日志注册表测试成功")
+            return True
+        else:
+            print("❌ 事件日志注册表结果不符合预期")
+            return False
+
+    except Exception as e:
+        print(f"❌ 事件日志注册表测试失败: {e}")
+        return False
+
+def test_job_fan_out():
+    """测试重复提交加入已有任务，多个订阅者共享同一事件日志"""
+    try:
+        import tempfile
+        import threading
+        import time
+        from django.core.management import call_command
+        from core.event_log import EventLogRegistry
+        from core.jobs import JobQueue
+        from core.models import Job
+
+        call_command('migrate', 'core', verbosity=0)
+        queue = JobQueue(run_in_process=False, handlers={'test_ok': f'{__name__}._job_ok'})
+        created = []
+        try:
+            first, first_created = queue.enqueue_or_join('test_ok', owner_id=-1)
+            created.append(first.id)
+            second, second_created = queue.enqueue_or_join('test_ok', owner_id=-1)
+            queue.cancel(first.id)
+            third, third_created = queue.enqueue_or_join('test_ok', owner_id=-1)
+            created.append(third.id)
+        finally:
+            Job.objects.filter(id__in=created).delete()
+        joined = first_created and not second_created and second.id == first.id \
+            and third_created and third.id != first.id
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            registry = EventLogRegistry(root=tmp_dir)
+            log = registry.get('job', -1)
+            received = [[] for _ in range(3)]
+
+            def consumer(frames):
+                for event in registry.get('job', -1).follow(0, heartbeat=5.0):
+                    frames.append(event)
+
+            threads = [threading.Thread(target=consumer, args=(frames,)) for frames in received]
+            for thread in threads:
+                thread.start()
+            for index in range(20):
+                log.append({'type': 'content', 'content': f'第{index}段'})
+                time.sleep(0.005)
+            subscribers = registry.stats()['subscribers']
+            log.close()
+            for thread in threads:
+                thread.join()
+
+        shared = all(frames == received[0] for frames in received) and len(received[0]) == 20
+        if joined and shared and subscribers == 3:
+            print("✅ 任务合并与多订阅者测试成功")
+            return True
+        else:
+            print(f"❌ 任务合并与多订阅者结果不符合预期: joined={joined}, shared={shared}, subscribers={subscribers}")
+            return False
+
+    except Exception as e:
+        print(f"❌ 任务合并与多订阅者测试失败: {e}")
+        return False
+
+def test_speculative_notes():
+    """测试解析完成后预先生成笔记：低优先级、用户确认时加入并提升优先级和重试次数、每用户次数上限"""
+    try:
+        from django.core.management import call_command
+        from core.jobs import JobQueue
+        from core.models import Job
+        from notes.speculative import SpeculativeNotePolicy
+
+        call_command('migrate', 'core', verbosity=0)
+        queue = JobQueue(run_in_process=False, handlers={'generate_notes': f'{__name__}._job_ok'})
+        policy = SpeculativeNotePolicy(queue=queue, enabled=True, per_user_hour=1, per_hour=10)
+        owner_id = -2
+        Job.objects.filter(owner_id=owner_id).delete()
+        try:
+            speculative = policy.maybe_enqueue(owner_id, 'uploads', 'output')
+            other_user = queue.enqueue('generate_notes', owner_id=owner_id - 1)
+            # 用户确认：加入预先生成的任务并提升优先级，排在其他普通任务之前按创建时间执行
+            confirmed, created = queue.enqueue_or_join('generate_notes', owner_id=owner_id)
+            confirmed_attempts = Job.objects.get(id=confirmed.id).max_attempts
+            first_claimed = queue.claim('test')
+            queue.run_job(first_claimed)
+            # 同一小时内该用户的预先生成次数已用完
+            limited = policy.maybe_enqueue(owner_id, 'uploads', 'output')
+            guest = policy.skip_reason(0)
+        finally:
+            Job.objects.filter(owner_id__in=[owner_id, owner_id - 1]).delete()
+
+        if (speculative is not None and speculative.priority == Job.PRIORITY_SPECULATIVE
+                and speculative.max_attempts == 1 and speculative.payload.get('speculative')
+                and not created and confirmed.id == speculative.id and confirmed.priority == Job.PRIORITY_NORMAL
+                and confirmed.max_attempts == queue.max_attempts > 1 and confirmed_attempts == queue.max_attempts
+                and first_claimed.id == speculative.id and other_user.id != first_claimed.id
+                and limited is None and guest):
+            print("✅ 预先生成笔记测试成功")
+            return True
+        else:
+            print("❌ 预先生成笔记结果不符合预期")
+            return False
+
+    except Exception as e:
+        print(f"❌ 预先生成笔记测试失败: {e}")
+        return False
+
+def test_speculative_join_payload():
+    """测试加入预先生成任务时保留用户指定的参数，且状态接口不显示未确认的预先生成任务"""
+    try:
+        from django.core.management import call_command
+        from core.jobs import JobQueue
+        from core.models import Job
+
+        call_command('migrate', 'core', verbosity=0)
+        queue = JobQueue(run_in_process=False, handlers={'generate_notes': f'{__name__}._job_ok', 'parse_file': f'{__name__}._job_ok'})
+        owner_id = -3
+        Job.objects.filter(owner_id=owner_id).delete()
+        speculative_payload = {'upload_dir': 'uploads', 'output_dir': 'output', 'speculative': True}
+        try:
+            parse_job = queue.enqueue('parse_file', owner_id=owner_id)
+            queued = queue.enqueue('generate_notes', owner_id=owner_id, payload=speculative_payload,
+                                   priority=Job.PRIORITY_SPECULATIVE)
+            latest_before = queue.latest(owner_id)
+            # 排队中：改用用户指定的参数后加入
+            joined, joined_created = queue.enqueue_or_join(
+                'generate_notes', owner_id=owner_id,
+                payload={'upload_dir': 'uploads', 'output_dir': 'output', 'mode': 'outline', 'force': False}
+            )
+            queue.cancel(joined.id)
+
+            # 运行中：取消低优先级任务，按用户参数重新提交
+            running = queue.enqueue('generate_notes', owner_id=owner_id, payload=speculative_payload,
+                                    priority=Job.PRIORITY_SPECULATIVE)
+            Job.objects.filter(id=running.id).update(state=Job.STATE_RUNNING)
+            restarted, restarted_created = queue.enqueue_or_join(
+                'generate_notes', owner_id=owner_id,
+                payload={'upload_dir': 'uploads', 'output_dir': 'output', 'mode': None, 'force': True}
+            )
+            running.refresh_from_db()
+        finally:
+            Job.objects.filter(owner_id=owner_id).delete()
+
+        if (latest_before.id == parse_job.id
+                and not joined_created and joined.id == queued.id and joined.payload.get('mode') == 'outline'
+                and joined.priority == Job.PRIORITY_NORMAL
+                and restarted_created and restarted.id != running.id and running.cancel_requested
+                and restarted.payload.get('force') is True):
+            print("✅ 预先生成任务参数测试成功")
+            return True
+        else:
+            print("❌ 预先生成任务参数结果不符合预期")
+            return False
+
+    except Exception as e:
+        print(f"❌ 预先生成任务参数测试失败: {e}")
+        return False
+
 def run_tests():
     """运行所有数据库测试"""
     print("🔍 开始数据库测试...")
@@ -86,6 +522,15 @@ def run_tests():
         ("数据库连接", test_database_connection),
         ("模型导入", test_models_import),
         ("迁移状态", test_migrations),
+        ("后台任务队列", test_job_queue),
+        ("任务进度存储", test_progress_store),
+        ("任务心跳", test_job_heartbeat),
+        ("事件日志续传", test_event_log_replay),
+        ("事件日志有界缓冲", test_event_log_ring_buffer),
+        ("事件日志注册表", test_event_log_registry),
+        ("任务合并与多订阅者", test_job_fan_out),
+        ("预先生成笔记", test_speculative_notes),
+        ("预先生成任务参数", test_speculative_join_payload),
     ]
     
     passed = 0
@@ -242,6 +242,531 @@ def test_toc_generation():
         print(f"❌ 目录生成测试失败: {e}")
         return False
 
+class _FakeNotesClient:
+    """模拟统一客户端：分块调用固定耗时，合并阶段流式返回"""
+
+    def __init__(self, chunk_tokens):
+        from types import SimpleNamespace
+        self.config = SimpleNamespace(
+            default_model="test-model", notes_generation_mode="auto",
+            notes_chunk_tokens=chunk_tokens, notes_chunk_output_tokens=2000, async_max_concurrency=8,
+            notes_frame_interval_ms=100, notes_frame_max_bytes=4096,
+            notes_flush_interval_ms=1000, notes_flush_bytes=64 * 1024,
+            notes_compaction_enabled=True, notes_compaction_threshold=0.8,
+            notes_max_continuations=3
+        )
+        self.chunk_prompts = []
+        self.merge_prompt = None
+
+    def is_available(self):
+        return True
+
+    def chat_completion(self, messages, **kwargs):
+        import re
+        prompt = messages[0]["content"]
+        self.chunk_prompts.append(prompt)
+        time.sleep(0.2)
+        pages = re.findall(r"=== 第(\d+)页 ===", prompt)
+        return f"## 第{pages[0]}-{pages[-1]}页要点\n\n内容"
+
+    def stream_chat(self, messages, **kwargs):
+        self.merge_prompt = messages[0]["content"]
+        for piece in ["# 合并后的笔记\n\n", "## 小节一\n", "## 小节二\n"]:
+            yield {"type": "content", "content": piece}
+        yield {"type": "finish", "finish_reason": "stop"}
+
+def test_chunked_note_generation():
+    """测试长文档分块并行生成与合并"""
+    try:
+        import json
+        from notes.note_generator import NoteGenerator
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            json_path = os.path.join(tmp_dir, "doc.json")
+            items = [
+                {"type": "text", "page": page, "content": f"第{page}页的课程内容。" * 40}
+                for page in range(1, 9)
+            ]
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(items, f, ensure_ascii=False)
+
+            generator = NoteGenerator()
+            generator.client = _FakeNotesClient(chunk_tokens=900)
+
+            start_time = time.perf_counter()
+            events = list(generator.generate_notes_streaming(json_path, tmp_dir))
+            elapsed = time.perf_counter() - start_time
+
+            complete = events[-1]
+            with open(complete.get("file_path", ""), "r", encoding="utf-8") as f:
+                notes = f.read()
+
+        chunk_count = len(generator.client.chunk_prompts)
+        print(f"分块数: {chunk_count}, 总耗时: {elapsed:.2f}秒, 事件: {[e['type'] for e in events]}")
+
+        if (chunk_count >= 3 and elapsed < 0.2 * chunk_count
+                and all("第1页" not in p for p in generator.client.chunk_prompts[1:])
+                and "【第1部分】" in generator.client.merge_prompt
+                and complete["type"] == "complete" and "小节二" in complete["toc_content"]
+                and notes.startswith("# 合并后的笔记")):
+            print("✅ 分块笔记生成测试成功")
+            return True
+        else:
+            print("❌ 分块笔记生成结果不符合预期")
+            return False
+
+    except Exception as e:
+        print(f"❌ 分块笔记生成测试失败: {e}")
+        return False
+
+def test_text_compaction_streaming():
+    """测试逐页压缩只预读识别页眉页脚所需的开头几页，其余页按需读取"""
+    try:
+        from core.text_compaction import CompactionReport, TextCompactor
+
+        consumed = []
+
+        def pages():
+            for page in range(1, 1001):
+                consumed.append(page)
+                yield str(page), [f"数据结构课程 第{page}页\n第{page}页讲解的内容各不相同：{'算法' * (page % 7 + 1)}"], []
+
+        report = CompactionReport()
+        compacted = TextCompactor(sample_pages=30).iter_compact(pages(), report)
+        first = next(compacted)
+        read_ahead = len(consumed)
+        rest = list(compacted)
+
+        print(f"取第一页时已读取{read_ahead}页，共产出{len(rest) + 1}页，删除重复行{report.boilerplate_lines}行")
+        if (read_ahead == 30 and len(rest) == 999 and first[2] == []
+                and "数据结构课程" not in first[1][0] and report.boilerplate_lines == 1000
+                and report.tokens_after < report.tokens_before):
+            print("✅ 逐页文本压缩测试成功")
+            return True
+        else:
+            print("❌ 逐页文本压缩结果不符合预期")
+            return False
+
+    except Exception as e:
+        print(f"❌ 逐页文本压缩测试失败: {e}")
+        return False
+
+class _InterruptedNotesClient(_FakeNotesClient):
+    """模拟流式生成依次出现：中途断开、续写时重复已完成章节且达到长度上限、正常结束"""
+
+    RESPONSES = [
+        (["# 课程笔记\n\n## 第一章\n内容一\n\n", "## 第二章\n内容二的前"], None),
+        (["好的，下面继续：\n## 第一章\n重复的内容\n", "## 第二章\n内容二\n\n## 第三章\n内容"], "length"),
+        (["## 第三章\n内容三\n"], "stop"),
+    ]
+
+    def __init__(self):
+        super().__init__(chunk_tokens=100000)
+        # 不合并增量，使断开前已收到的内容都已写入
+        self.config.notes_frame_interval_ms = 0
+        self.prompts = []
+
+    def stream_chat(self, messages, **kwargs):
+        self.prompts.append(messages[-1]["content"])
+        pieces, finish_reason = self.RESPONSES[len(self.prompts) - 1]
+        for piece in pieces:
+            yield {"type": "content", "content": piece}
+        if finish_reason is None:
+            raise ConnectionError("连接被重置")
+        yield {"type": "finish", "finish_reason": finish_reason}
+
+def test_note_continuation():
+    """测试流式生成中断或截断后从最后一个完整章节续写，拼接时不重复标题"""
+    try:
+        import json
+        from notes.note_generator import NoteGenerator
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            json_path = os.path.join(tmp_dir, "doc.json")
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump([{"type": "text", "page": 1, "content": "课程内容"}], f, ensure_ascii=False)
+
+            generator = NoteGenerator()
+            generator.client = _InterruptedNotesClient()
+            events = list(generator.generate_notes_streaming(json_path, tmp_dir, mode="single"))
+
+            complete = events[-1]
+            with open(complete.get("file_path", ""), "r", encoding="utf-8") as f:
+                notes = f.read()
+
+        # 按前端的处理方式重放 content / rewind 事件
+        received = ""
+        for event in events:
+            if event["type"] == "content":
+                received += event["content"]
+            elif event["type"] == "rewind" and received.endswith(event["content"]):
+                received = received[:len(received) - len(event["content"])]
+
+        prompts = generator.client.prompts
+        expected = "# 课程笔记\n\n## 第一章\n内容一\n\n## 第二章\n内容二\n\n## 第三章\n内容三\n"
+        print(f"事件: {[e['type'] for e in events]}, 续写次数: {complete.get('continuations')}")
+        if (complete["type"] == "complete" and complete["continuations"] == 2
+                and notes == expected and received == expected
+                and "## 第一章" in prompts[1] and '"## 第二章"' in prompts[1]
+                and '"## 第三章"' in prompts[2] and "## 第二章" in prompts[2].split("---")[-1]):
+            print("✅ 笔记断点续写测试成功")
+            return True
+        else:
+            print(f"❌ 笔记断点续写结果不符合预期: {notes!r}")
+            return False
+
+    except Exception as e:
+        print(f"❌ 笔记断点续写测试失败: {e}")
+        return False
+
+def test_parallel_cancellation():
+    """测试提前关闭并发生成（任务取消）时不再执行排队中的调用，也不等待进行中的调用"""
+    try:
+        import threading
+        from notes.note_generator import NoteGenerator
+
+        generator = NoteGenerator()
+        generator.client = _FakeNotesClient(chunk_tokens=900)
+        generator.client.config.async_max_concurrency = 2
+        started = []
+        release = threading.Event()
+
+        def task(index):
+            started.append(index)
+            if index > 0:
+                release.wait(timeout=5)
+            return index
+
+        results = generator._run_parallel([lambda index=index: task(index) for index in range(10)], "test-cancel")
+        first = next(results)
+        start_time = time.perf_counter()
+        results.close()
+        elapsed = time.perf_counter() - start_time
+        release.set()
+        time.sleep(0.2)
+
+        print(f"第一个结果: {first}, 已开始的调用: {sorted(started)}, 关闭耗时: {elapsed:.3f}秒")
+        if first == (0, 0, None) and elapsed < 1 and len(started) <= 3:
+            print("✅ 并发生成取消测试成功")
+            return True
+        else:
+            print("❌ 并发生成取消结果不符合预期")
+            return False
+
+    except Exception as e:
+        print(f"❌ 并发生成取消测试失败: {e}")
+        return False
+
+def _expanded_heading(prompt):
+    """从章节展开提示词中取出要展开的章节名"""
+    section_part = prompt.split("现在只需编写其中的这一章节")[1]
+    return section_part.split("## ", 1)[1].split("\n", 1)[0].strip()
+
+class _FakeOutlineClient(_FakeNotesClient):
+    """模拟统一客户端：先返回大纲，各章节展开耗时不同"""
+
+    OUTLINE = (
+        "# 课程笔记\n\n"
+        "## 基本概念 【页码: 1-2】\n### 定义\n\n"
+        "## 核心定理 【页码: 3-4】\n### 证明\n\n"
+        "## 应用 【页码: 5-6】\n### 例题\n"
+    )
+    DELAYS = {"基本概念": 0.1, "核心定理": 0.3, "应用": 0.2}
+
+    def chat_completion(self, messages, **kwargs):
+        prompt = messages[0]["content"]
+        self.chunk_prompts.append(prompt)
+        if "《" not in prompt:
+            return self.OUTLINE
+        heading = _expanded_heading(prompt)
+        time.sleep(self.DELAYS[heading])
+        if heading == "应用":
+            # 模型遗漏章节标题时由生成器补上
+            return "应用部分的正文"
+        return f"## {heading}\n\n{heading}的正文"
+
+def test_outline_note_generation():
+    """测试先大纲后并行展开的笔记生成"""
+    try:
+        import json
+        from notes.note_generator import NoteGenerator
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            json_path = os.path.join(tmp_dir, "doc.json")
+            items = [
+                {"type": "text", "page": page, "content": f"第{page}页的课程内容。"}
+                for page in range(1, 7)
+            ]
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(items, f, ensure_ascii=False)
+
+            generator = NoteGenerator()
+            generator.client = _FakeOutlineClient(chunk_tokens=100000)
+
+            start_time = time.perf_counter()
+            events = list(generator.generate_notes_streaming(json_path, tmp_dir, mode="outline"))
+            elapsed = time.perf_counter() - start_time
+
+            complete = events[-1]
+            with open(complete.get("file_path", ""), "r", encoding="utf-8") as f:
+                notes = f.read()
+
+        sections = [e for e in events if e["type"] == "section"]
+        prompts_by_heading = {_expanded_heading(p): p for p in generator.client.chunk_prompts[1:]}
+        print(f"章节完成顺序: {[e['index'] for e in sections]}, 总耗时: {elapsed:.2f}秒")
+
+        order = [notes.find("## 基本概念"), notes.find("## 核心定理"), notes.find("## 应用")]
+        if (len(sections) == 3 and elapsed < 0.5
+                and [e["index"] for e in sections] == [0, 2, 1]
+                and notes.startswith("# 课程笔记") and -1 not in order and order == sorted(order)
+                and "【页码" not in notes
+                and "=== 第2页 ===" in prompts_by_heading["基本概念"]
+                and "=== 第5页 ===" not in prompts_by_heading["基本概念"]
+                and complete["type"] == "complete" and "核心定理" in complete["toc_content"]):
+            print("✅ 大纲并行笔记生成测试成功")
+            return True
+        else:
+            print("❌ 大纲并行笔记生成结果不符合预期")
+            return False
+
+    except Exception as e:
+        print(f"❌ 大纲并行笔记生成测试失败: {e}")
+        return False
+
+class _FakeDocumentClient(_FakeNotesClient):
+    """模拟统一客户端：按提示词中的课程名生成单文档笔记，并记录调用次数"""
+
+    def __init__(self):
+        super().__init__(chunk_tokens=100000)
+        self.config.notes_generation_mode = "single"
+        self.stream_calls = 0
+
+    def stream_chat(self, messages, **kwargs):
+        import re
+        self.stream_calls += 1
+        course = re.search(r"课程(\w)", messages[0]["content"]).group(1)
+        yield {"type": "content", "content": f"# 课程{course}笔记\n\n## 课程{course}要点\n\n内容\n"}
+        yield {"type": "finish", "finish_reason": "stop"}
+
+def test_incremental_note_generation():
+    """测试按文档哈希增量生成笔记"""
+    try:
+        import json
+        from notes.note_generator import NoteGenerator
+        from notes.incremental import IncrementalNoteBuilder, find_parsed_documents
+
+        def write_document(upload_dir, name, text):
+            os.makedirs(os.path.join(upload_dir, name), exist_ok=True)
+            with open(os.path.join(upload_dir, name, f"{name}.json"), "w", encoding="utf-8") as f:
+                json.dump([{"type": "text", "page": 1, "content": text}], f, ensure_ascii=False)
+
+        def run(builder, upload_dir):
+            events = list(builder.generate(find_parsed_documents(upload_dir)))
+            with open(events[-1]["file_path"], "r", encoding="utf-8") as f:
+                return events[-1], f.read()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            upload_dir = os.path.join(tmp_dir, "uploads")
+            output_dir = os.path.join(tmp_dir, "output")
+            generator = NoteGenerator()
+            generator.client = _FakeDocumentClient()
+            builder = IncrementalNoteBuilder(output_dir, generator)
+
+            write_document(upload_dir, "a", "课程A的内容")
+            write_document(upload_dir, "b", "课程B的内容")
+            _, notes = run(builder, upload_dir)
+            first_calls = generator.client.stream_calls
+
+            # 模拟用户修改了已有笔记中的章节
+            with open(builder.plan([])["manifest"].notes_file, "w", encoding="utf-8") as f:
+                f.write(notes.replace("## 课程A要点\n\n内容", "## 课程A要点\n\n用户修改后的内容"))
+
+            write_document(upload_dir, "c", "课程C的内容")
+            complete, notes = run(builder, upload_dir)
+            added_calls = generator.client.stream_calls - first_calls
+
+            _, unchanged_notes = run(builder, upload_dir)
+            unchanged_calls = generator.client.stream_calls - first_calls - added_calls
+
+            write_document(upload_dir, "b", "课程B修改后的内容")
+            run(builder, upload_dir)
+            changed_calls = generator.client.stream_calls - first_calls - added_calls - unchanged_calls
+
+            with open(os.path.join(output_dir, "notes_manifest.json"), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            timestamp_dirs = [d for d in os.listdir(output_dir) if os.path.isdir(os.path.join(output_dir, d))]
+
+        print(f"LLM调用: 首次{first_calls}, 新增文档{added_calls}, 未变化{unchanged_calls}, 修改文档{changed_calls}")
+        order = [notes.find("# 课程A笔记"), notes.find("# 课程B笔记"), notes.find("# 课程C笔记")]
+        if (first_calls == 2 and added_calls == 1 and unchanged_calls == 0 and changed_calls == 1
+                and -1 not in order and order == sorted(order)
+                and "用户修改后的内容" in notes and notes.count(NoteGenerator.NOTES_WATERMARK) == 1
+                and complete["reused_documents"] == 2 and complete["generated_documents"] == 1
+                and unchanged_notes == notes
+                and [d["key"] for d in manifest["documents"]] == ["a/a.json", "c/c.json", "b/b.json"]
+                and manifest["documents"][0]["sections"] == ["课程A要点"]
+                and ".note_parts" in timestamp_dirs and len(timestamp_dirs) == 4):
+            print("✅ 增量笔记生成测试成功")
+            return True
+        else:
+            print("❌ 增量笔记生成结果不符合预期")
+            return False
+
+    except Exception as e:
+        print(f"❌ 增量笔记生成测试失败: {e}")
+        return False
+
+def test_note_sources():
+    """测试笔记来源：解析条目流与多个JSON路径得到相同的提示词，且不写中间JSON"""
+    try:
+        import json
+        from notes.note_generator import NoteGenerator
+
+        items_a = [{"type": "text", "page": 1, "content": "课程A的内容"}]
+        items_b = [{"type": "text", "page": 2, "content": "课程B的内容"}]
+        # 页码重叠的两个文档：按路径顺序合并，第一个文档的页不应排到第二个文档之后或与之合并
+        book_a = [{"type": "text", "page": page, "content": f"教材A第{page}页讲解"} for page in (1, 2, 3)]
+        book_b = [{"type": "text", "page": page, "content": f"教材B第{page}页讲解"} for page in (1, 2, 3)]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = []
+            for name, items in (("a", items_a), ("b", items_b), ("book_a", book_a), ("book_b", book_b)):
+                paths.append(os.path.join(tmp_dir, f"{name}.json"))
+                with open(paths[-1], "w", encoding="utf-8") as f:
+                    json.dump(items, f, ensure_ascii=False)
+            book_paths, paths = paths[2:], paths[:2]
+
+            prompts, leftovers = [], []
+            for source in (paths, (item for item in items_a + items_b)):
+                generator = NoteGenerator()
+                generator.client = _FakeDocumentClient()
+                output_dir = os.path.join(tmp_dir, f"out{len(prompts)}")
+                events = list(generator.generate_notes_streaming(source, output_dir))
+                with open(os.path.join(events[-1]["output_dir"], "full_prompt.txt"), "r", encoding="utf-8") as f:
+                    prompts.append(f.read())
+                leftovers += [
+                    name for _, _, files in os.walk(output_dir) for name in files
+                    if name.endswith(".json") and name != "compaction_report.json"
+                ]
+
+            generator = NoteGenerator()
+            generator.client = _FakeDocumentClient()
+            blocks = generator._extract_text(generator._iter_source_items(book_paths))["text_content"].split("\n\n")
+
+        expected_blocks = [f"=== 第{page}页 ===\n教材{book}第{page}页讲解" for book in "AB" for page in (1, 2, 3)]
+        if (prompts[0] == prompts[1] and "=== 第1页 ===\n课程A的内容" in prompts[0]
+                and "=== 第2页 ===\n课程B的内容" in prompts[0] and not leftovers and blocks == expected_blocks):
+            print("✅ 笔记来源测试成功")
+            return True
+        else:
+            print(f"❌ 笔记来源结果不符合预期: 中间文件 {leftovers}，多文档页块 {blocks}")
+            return False
+
+    except Exception as e:
+        print(f"❌ 笔记来源测试失败: {e}")
+        return False
+
+def test_streaming_document_reader():
+    """测试解析文档的流式读取：结果与整体读取一致，峰值内存与最大一页相关而非整份文档"""
+    try:
+        import json
+        import tracemalloc
+        from notes.document_reader import PageAssembler, iter_json_array
+        from notes.note_generator import NoteGenerator
+
+        def write_book(path, page_count):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("[\n")
+                for page in range(1, page_count + 1):
+                    for line in range(10):
+                        f.write(json.dumps({"type": "text", "page": page, "content": f"第{page}页第{line}段。" * 40},
+                                           ensure_ascii=False) + ",\n")
+                    f.write(json.dumps({"type": "figure", "page": page, "path": f"images/{page}.png",
+                                        "caption": "示意图"}, ensure_ascii=False) + ",\n")
+                f.write(json.dumps({"type": "text", "page": "附录", "content": "附录内容"}, ensure_ascii=False) + "\n]")
+
+        def streaming_peak(path):
+            tracemalloc.start()
+            largest, pages = 0, 0
+            for block in PageAssembler().assemble(iter_json_array(path)):
+                largest = max(largest, len(block.encode("utf-8")))
+                pages += 1
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return peak, largest, pages
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            small_path = os.path.join(tmp_dir, "small.json")
+            book_path = os.path.join(tmp_dir, "book.json")
+            write_book(small_path, 100)
+            write_book(book_path, 400)
+            file_size = os.path.getsize(book_path)
+
+            with open(book_path, "r", encoding="utf-8") as f:
+                items = json.load(f)
+            same_items = list(iter_json_array(book_path, chunk_size=1000)) == items
+            del items
+
+            small_peak, _, _ = streaming_peak(small_path)
+            book_peak, largest_page, pages = streaming_peak(book_path)
+            tracemalloc.start()
+            with open(book_path, "r", encoding="utf-8") as f:
+                json.load(f)
+            load_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            text_content = NoteGenerator()._extract_text_from_json(book_path)["text_content"]
+
+        print(f"文件 {file_size // 1024}KB, 最大页 {largest_page // 1024}KB, 流式峰值 "
+              f"{small_peak // 1024}KB(100页)/{book_peak // 1024}KB(400页), json.load 峰值 {load_peak // 1024}KB")
+        if (same_items and pages == 401
+                and book_peak < small_peak * 1.2 + 64 * 1024 and book_peak * 5 < file_size
+                and text_content.startswith("=== 第1页 ===") and text_content.endswith("=== 第附录页 ===\n附录内容")
+                and "第400页第9段。" in text_content and "[图片] 路径: images/12.png" in text_content):
+            print("✅ 流式文档读取测试成功")
+            return True
+        else:
+            print("❌ 流式文档读取结果不符合预期")
+            return False
+
+    except Exception as e:
+        print(f"❌ 流式文档读取测试失败: {e}")
+        return False
+
+def test_text_compaction():
+    """测试提示词前的文本压缩：页眉页脚、页码、近重复段落与全角字符"""
+    try:
+        from core.text_compaction import TextCompactor
+
+        topics = ["极限的定义与性质", "导数的几何意义", "微分中值定理", "不定积分的换元法", "定积分的应用",
+                  "多元函数的偏导数", "重积分的计算", "曲线积分与格林公式", "级数的收敛判别", "常微分方程的解法"]
+        pages = []
+        for page, topic in enumerate(topics, start=1):
+            body = f"本页讨论{topic}，首先给出{topic}的基本概念，然后通过第{page}个例题说明{topic}在实际问题中的用法与注意事项。"
+            pages.append((str(page), [f"高等数学　课程讲义\n{body}\n第 {page} 页 / 共 10 页"]))
+        # 第11页重复了第2页的段落（只改动一个字），并含全角字母数字
+        repeated = pages[1][1][0].split("\n")[1].replace("首先", "先")
+        pages.append(("11", [f"高等数学　课程讲义\n{repeated}\n\n习题：计算ｆ（ｘ）＝ｘ２在ｘ＝１处的导数\n第 11 页 / 共 10 页"]))
+
+        compacted, report = TextCompactor().compact_pages(pages)
+        text = "\n".join(t for _, texts in compacted for t in texts)
+        print(f"压缩统计: {report.to_dict()}")
+
+        if ("课程讲义" not in text and "共 10 页" not in text
+                and all(topic in text for topic in topics)
+                and report.duplicate_paragraphs == 1 and text.count("导数的几何意义") == 3
+                and "ｆ" not in text and "计算f（x）＝x2在x＝1处" in text
+                and report.boilerplate_lines == 22 and report.tokens_saved > 0):
+            print("✅ 文本压缩测试成功")
+            return True
+        else:
+            print("❌ 文本压缩结果不符合预期")
+            return False
+
+    except Exception as e:
+        print(f"❌ 文本压缩测试失败: {e}")
+        return False
+
 def run_tests():
     """运行所有笔记生成测试"""
     print("🔍 开始笔记生成测试...")
@@ -255,6 +780,15 @@ def run_tests():
         ("文件保存", test_file_saving),
         ("流式传输模拟", test_streaming_simulation),
         ("目录生成", test_toc_generation),
+        ("分块笔记生成", test_chunked_note_generation),
+        ("大纲并行笔记生成", test_outline_note_generation),
+        ("并发生成取消", test_parallel_cancellation),
+        ("增量笔记生成", test_incremental_note_generation),
+        ("笔记来源", test_note_sources),
+        ("流式文档读取", test_streaming_document_reader),
+        ("文本压缩", test_text_compaction),
+        ("逐页文本压缩", test_text_compaction_streaming),
+        ("笔记断点续写", test_note_continuation),
     ]
     
     passed = 0
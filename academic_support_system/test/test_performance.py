@@ -173,6 +173,53 @@ def test_disk_space():
         print(f"❌ 磁盘空间测试失败: {e}")
         return False
 
+def test_stream_coalescing_throughput():
+    """基准测试：笔记流式增量逐帧输出 vs 合并帧+缓冲写入的事件吞吐"""
+    try:
+        import tempfile
+        from core.streaming import BufferedTextWriter, coalesce_deltas, sse_event
+
+        deltas = [{'type': 'content', 'content': f'笔记{index % 10}'} for index in range(50000)]
+        expected = ''.join(delta['content'] for delta in deltas)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # 原实现：每个增量 write+flush 一次并单独成帧
+            path = os.path.join(temp_dir, 'naive.md')
+            start = time.perf_counter()
+            naive_frames = 0
+            with open(path, 'w', encoding='utf-8') as f:
+                for event in deltas:
+                    f.write(event['content'])
+                    f.flush()
+                    sse_event(event)
+                    naive_frames += 1
+            naive_time = time.perf_counter() - start
+
+            path = os.path.join(temp_dir, 'coalesced.md')
+            start = time.perf_counter()
+            frames = 0
+            with BufferedTextWriter(path, flush_interval=1.0, flush_bytes=64 * 1024) as writer:
+                for event in coalesce_deltas(deltas, interval=0.1, max_bytes=4096):
+                    writer.write(event['content'])
+                    sse_event(event)
+                    frames += 1
+            coalesced_time = time.perf_counter() - start
+            with open(path, 'r', encoding='utf-8') as f:
+                written = f.read()
+
+        print(f"逐帧: {naive_frames} 帧, {len(deltas) / naive_time:.0f} 增量/秒")
+        print(f"合并: {frames} 帧, {writer.flushes} 次落盘, {len(deltas) / coalesced_time:.0f} 增量/秒")
+        if written == expected and frames < naive_frames:
+            print("✅ 流式合并基准测试成功")
+            return True
+        else:
+            print("❌ 合并后的内容或帧数不符合预期")
+            return False
+
+    except Exception as e:
+        print(f"❌ 流式合并基准测试失败: {e}")
+        return False
+
 def run_tests():
     """运行所有性能测试"""
     print("🔍 开始性能测试...")
@@ -184,6 +231,7 @@ def run_tests():
         ("并发请求", test_concurrent_requests),
         ("响应时间", test_response_time),
         ("磁盘空间", test_disk_space),
+        ("流式合并吞吐", test_stream_coalescing_throughput),
     ]
     
     passed = 0
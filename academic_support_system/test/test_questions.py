@@ -120,6 +120,111 @@ def test_fallback_questions():
         print(f"❌ 回退题目测试失败: {e}")
         return False
 
+def test_concurrent_question_generation():
+    """测试并发出题的顺序与耗时"""
+    try:
+        import asyncio
+        import time
+        from core.question_service import QuestionService
+        from core.unified_api_client import get_mock_response
+
+        class SlowAsyncClient:
+            """每次调用固定耗时的模拟异步客户端"""
+            def __init__(self):
+                self.calls = 0
+
+            async def call_api(self, prompt, **kwargs):
+                self.calls += 1
+                await asyncio.sleep(0.2)
+                if "题目集合" in prompt:
+                    return "题目总结"
+                return get_mock_response(prompt)
+
+        class AvailableClient:
+            def is_available(self):
+                return True
+
+        service = QuestionService()
+        service.client = AvailableClient()
+        service.async_client = SlowAsyncClient()
+
+        question_types = {
+            'multipleChoice': {'name': '选择题', 'count': 3},
+            'fillBlank': {'name': '填空题', 'count': 2},
+            'trueOrFalse': {'name': '判断题', 'count': 2},
+        }
+
+        start_time = time.time()
+        result = asyncio.run(service.generate_questions_async("测试笔记内容" * 100, question_types))
+        elapsed = time.time() - start_time
+
+        types = [q['type'] for q in result['questions']]
+        expected = ['选择题'] * 3 + ['填空题'] * 2 + ['判断题'] * 2
+        print(f"并发生成{len(types)}道题耗时: {elapsed:.2f}秒, 调用次数: {service.async_client.calls}")
+
+        # 串行需要约 8 × 0.2 秒，并发应接近两次调用的耗时
+        if result['success'] and types == expected and elapsed < 1.0:
+            print("✅ 并发出题测试成功")
+            return True
+        else:
+            print("❌ 并发出题结果不符合预期")
+            return False
+
+    except Exception as e:
+        print(f"❌ 并发出题测试失败: {e}")
+        return False
+
+def test_batch_question_generation():
+    """测试批量出题的截断恢复与补充请求"""
+    try:
+        from core.question_service import QuestionService
+
+        # 第一次响应在第3个元素处被截断，第2个元素缺少答案
+        truncated = """```json
+[
+  {"slice": 1, "text": "题目一", "type": "选择题", "options": ["A. 1", "B. 2", "C. 3", "D. 4"], "answer": "A", "explanation": "解析一"},
+  {"slice": 2, "text": "题目二", "type": "选择题", "answer": ""},
+  {"slice": 3, "text": "题目三", "type": "选择题", "opt"""
+        follow_up = """[
+  {"slice": 1, "text": "补充题目二", "type": "选择题", "answer": "B", "explanation": "解析二"},
+  {"slice": 2, "text": "补充题目三", "type": "选择题", "answer": "C", "explanation": "解析三"}
+]"""
+
+        class ScriptedClient:
+            def __init__(self, responses):
+                self.responses = list(responses)
+                self.prompts = []
+
+            def is_available(self):
+                return True
+
+            def call_api(self, prompt, **kwargs):
+                self.prompts.append(prompt)
+                return self.responses.pop(0)
+
+        service = QuestionService(batch_size=3)
+        service.client = ScriptedClient([truncated, follow_up])
+
+        template = service._get_prompt_template('选择题')
+        questions = service._generate_questions_by_type(template, '选择题', 3, "测试笔记内容" * 200, "")
+        texts = [q['text'] for q in questions]
+        print(f"批量结果: {texts}, 请求次数: {len(service.client.prompts)}")
+
+        # 补充请求只应包含缺失的两个片段
+        follow_up_prompt = service.client.prompts[1]
+        if (texts == ["题目一", "补充题目二", "补充题目三"]
+                and len(service.client.prompts) == 2
+                and "生成2道选择题" in follow_up_prompt):
+            print("✅ 批量出题测试成功")
+            return True
+        else:
+            print("❌ 批量出题结果不符合预期")
+            return False
+
+    except Exception as e:
+        print(f"❌ 批量出题测试失败: {e}")
+        return False
+
 def run_tests():
     """运行所有出题功能测试"""
     print("🔍 开始出题功能测试...")
@@ -130,6 +235,8 @@ def run_tests():
         ("题目类型", test_question_types),
         ("题目解析", test_question_parsing),
         ("回退题目", test_fallback_questions),
+        ("并发出题", test_concurrent_question_generation),
+        ("批量出题", test_batch_question_generation),
     ]
     
     passed = 0